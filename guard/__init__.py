@@ -1,6 +1,8 @@
 from .parameters import Parameters, generate_parameters, default_parameters
 from .world import World
+from .arrayworld import ArrayWorld
 from .community import Community
+from .ensemble import run_ensemble
 
 __all__ = ['Parameters', 'generate_parameters', 'default_parameters', 'World',
-           'Community']
+           'ArrayWorld', 'Community', 'run_ensemble']
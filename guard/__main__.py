@@ -0,0 +1,7 @@
+"""
+Run GUARD from the command line, see guard.cli.
+"""
+from .cli import main
+import sys
+
+sys.exit(main())
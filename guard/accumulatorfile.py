@@ -0,0 +1,193 @@
+"""
+Reading and writing accumulator data in a memory mappable binary format.
+
+An accumulator file starts with a magic string, the length of its header as a
+little endian unsigned 32 bit integer and a JSON header giving the format
+version, the data type, the shape of each era's array, the era labels and any
+attributes the accumulator needs to be reconstructed. The header is padded so
+that the data which follows is aligned. The data is the array of each era in
+turn, in C order, so a single era, or part of one, can be read without reading
+the rest of the file.
+"""
+from .daterange import DateRange
+import json
+import numpy as np
+import struct
+
+_MAGIC = b'\x93GUARDACC'
+_FORMAT_VERSION = 1
+# Alignment in bytes of the start of the data
+_ALIGNMENT = 64
+_DTYPES = (np.float32, np.float64)
+
+
+def is_accumulator_file(path):
+    """
+    Determine whether a file is an accumulator file, rather than a legacy
+    pickle dump.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        (bool): True if the file starts with the accumulator file magic
+            string, False otherwise.
+    """
+    with open(path, 'rb') as infile:
+        return infile.read(len(_MAGIC)) == _MAGIC
+
+
+def write_accumulator_file(path, data, dtype=np.float64, attributes=None):
+    """
+    Write accumulator data to a file.
+
+    Args:
+        path (str): Path to the file to write.
+        data (dict): The array of each era, keyed by date range. All arrays
+            must have the same shape.
+        dtype (numpy dtype, default=numpy.float64): The type to store the
+            data as, either numpy.float32 or numpy.float64.
+        attributes (dict, default=None): JSON serialisable attributes to store
+            in the header, for example the constructor arguments of the
+            accumulator.
+
+    Raises:
+        (ValueError): Raised if the data type is not supported or the arrays
+            have different shapes.
+    """
+    if np.dtype(dtype) not in [np.dtype(allowed) for allowed in _DTYPES]:
+        raise ValueError('Unsupported data type {}'.format(dtype))
+    dtype = np.dtype(dtype).newbyteorder('<')
+
+    eras = list(data)
+    arrays = [np.asarray(data[era]) for era in eras]
+    shape = arrays[0].shape if arrays else ()
+    if any(array.shape != shape for array in arrays):
+        raise ValueError('The data of every era must have the same shape')
+
+    header = json.dumps({'version': _FORMAT_VERSION,
+                         'dtype': dtype.str,
+                         'shape': list(shape),
+                         'eras': [str(era) for era in eras],
+                         'attributes': attributes or {}}).encode()
+    # Pad the header so that the data is aligned, ending with a newline
+    padding = -(len(_MAGIC) + 4 + len(header) + 1) % _ALIGNMENT
+    header += b' ' * padding + b'\n'
+
+    with open(path, 'wb') as outfile:
+        outfile.write(_MAGIC)
+        outfile.write(struct.pack('<I', len(header)))
+        outfile.write(header)
+        for array in arrays:
+            outfile.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+class AccumulatorFile(object):
+    """
+    An accumulator file, whose data is memory mapped on first access so that
+    reading an era, or part of one, only reads that part of the file.
+
+    Args:
+        path (str): Path to the accumulator file.
+
+    Attributes:
+        eras (list[DateRange]): The date ranges in the file, in the order
+            they are stored.
+        shape (tuple): The shape of the array of each era.
+        dtype (numpy dtype): The type of the stored data.
+        attributes (dict): The attributes stored with the data.
+
+    Raises:
+        (ValueError): Raised if the file is not an accumulator file, or is of
+            an unsupported format version.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as infile:
+            if infile.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(
+                    '{} is not an accumulator file'.format(path))
+            header_length, = struct.unpack('<I', infile.read(4))
+            header = json.loads(infile.read(header_length).decode())
+
+        if header['version'] != _FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported accumulator file version {}'.format(
+                    header['version']))
+
+        self.eras = [DateRange.from_string(era) for era in header['eras']]
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.attributes = header.get('attributes', {})
+        self._offset = len(_MAGIC) + 4 + header_length
+        self._data = None
+
+    @property
+    def data(self):
+        """
+        The read only memory mapped data of every era, with the era along the
+        first axis.
+        """
+        if self._data is None:
+            shape = (len(self.eras),) + self.shape
+            if np.prod(shape) == 0:
+                # Empty files cannot be memory mapped
+                self._data = np.zeros(shape, dtype=self.dtype)
+            else:
+                self._data = np.memmap(self.path, dtype=self.dtype, mode='r',
+                                       offset=self._offset, shape=shape)
+        return self._data
+
+    def era_index(self, era):
+        """
+        The position of an era in the file.
+
+        Args:
+            era (DateRange or str): The date range, or its label.
+
+        Returns:
+            (int): The index of the era along the first axis of data.
+
+        Raises:
+            (KeyError): Raised if the era is not in the file.
+        """
+        try:
+            return self.eras.index(era)
+        except ValueError:
+            raise KeyError(
+                'Era {} is not in {}'.format(era, self.path)) from None
+
+    def read(self, era, area=None):
+        """
+        Read the data of one era into memory.
+
+        Args:
+            era (DateRange or str): The date range, or its label.
+            area (Area, default=None): The region of the map to read. If None
+                the whole map is read.
+
+        Returns:
+            (numpy Array): The data of the era. If area has bounds the array
+                covers the bounding rectangle, otherwise it holds the value of
+                each tile of area.all_tiles in turn.
+        """
+        values = self.data[self.era_index(era)]
+        if area is None:
+            return np.array(values)
+        if hasattr(area, 'bounds'):
+            xmin, xmax, ymin, ymax = area.bounds()
+            return np.array(values[xmin:xmax, ymin:ymax])
+        x, y = np.array(area.all_tiles, dtype=int).reshape(-1, 2).T
+        return np.array(values[x, y])
+
+    def close(self):
+        """
+        Release the memory map of the file.
+        """
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
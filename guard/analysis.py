@@ -2,29 +2,46 @@
 Classes and routines for analysis of simulations.
 """
 from . import terrain
+from .accumulatorfile import (AccumulatorFile, is_accumulator_file,
+                              write_accumulator_file)
 from .area import Rectangle
 from .daterange import (DateRange, InvalidDateRange,
                         imperial_density_date_ranges, cities_date_ranges)
-import matplotlib.pyplot as plt
+from collections import namedtuple
+import json
+import numbers
 import numpy as np
 import pickle
-from scipy import ndimage, stats
-import yaml
+import weakref
+
+# matplotlib, scipy and yaml are imported by the functions which need them, so
+# that accumulators can be used without the cost of importing them
 
 # How many communities a polity requires before it is considered large and is
 # recorded
 _LARGE_POLITY_THRESHOLD = 10
 
+# Polity size bucket edges, roughly logarithmically spaced and including the
+# large polity threshold
+_POLITY_SIZE_EDGES = (0, 1, 2, 3, 5, 10, 20, 30, 50, 100, 200, 300, 500, 1000)
+
+# The fields of the world state which can be drawn as maps by map_rgba
+MAP_FIELDS = ('military_techs', 'ultrasocietal_traits', 'active')
+
 # Colours
 _SEA = np.array([0.25098039, 0.57647059, 0.92941176, 1.])
 _DESERT = np.array([0.7372549, 0.71372549, 0.25098039, 1.])
 _STEPPE = np.array([0.42745098, 0., 0.75686275, 1.])
+# Added to the colour of highlighted tiles
+_HIGHLIGHT = np.array([0.3, 0.0, 0.3, 0.0])
 
 
 def _init_world_plot():
     """
     Establish the figure, axis and colourmap for a standard map plot
     """
+    import matplotlib.pyplot as plt
+
     # Initialise figure and axis
     fig = plt.figure()
     ax = fig.subplots()
@@ -33,10 +50,44 @@ def _init_world_plot():
     ax.get_xaxis().set_visible(False)
     ax.get_yaxis().set_visible(False)
 
-    # Colour map
-    colour_map = plt.get_cmap('RdYlGn').reversed()
+    return fig, ax, _colour_map()
+
+
+def _colour_map():
+    """
+    The colourmap of a standard map plot
+    """
+    from matplotlib import colormaps
+
+    return colormaps['RdYlGn'].reversed()
+
 
-    return fig, ax, colour_map
+# Cached terrain overlays of each world, keyed by area bounds
+_terrain_overlays = weakref.WeakKeyDictionary()
+
+
+def _terrain_overlay(world, area):
+    """
+    Boolean masks of the sea, desert and steppe tiles of an area, keyed by
+    terrain. The masks are built once for each world and area and cached, as
+    terrain does not change during a simulation.
+    """
+    bounds = area.bounds()
+    overlays = _terrain_overlays.setdefault(world, {})
+    try:
+        return overlays[bounds]
+    except KeyError:
+        pass
+
+    xmin, xmax, ymin, ymax = bounds
+    terrain_codes = world.raster('terrain')[xmin:xmax, ymin:ymax]
+    overlay = {}
+    for landscape in (terrain.sea, terrain.desert, terrain.steppe):
+        mask = terrain_codes == terrain.all_terrains.index(landscape)
+        mask.flags.writeable = False
+        overlay[landscape] = mask
+    overlays[bounds] = overlay
+    return overlay
 
 
 def _colour_special_tiles(rgba_data, world, highlight_desert=False,
@@ -46,21 +97,13 @@ def _colour_special_tiles(rgba_data, world, highlight_desert=False,
     """
     if area is None:
         area = Rectangle.entire_map(world)
-    xmin, xmax, ymin, ymax = area.bounds()
-    # Colour sea and optionally desert
-    for tile in world.tiles:
-        x, y = tile.position[0], tile.position[1]
-        if area.in_area(x, y):
-            x -= xmin
-            y -= ymin
-            if tile.terrain is terrain.sea:
-                rgba_data[x][y] = _SEA
-            elif tile.terrain is terrain.desert:
-                if highlight_desert:
-                    rgba_data[x][y] = _DESERT
-            elif tile.terrain is terrain.steppe:
-                if highlight_steppe:
-                    rgba_data[x][y] = _STEPPE
+    overlay = _terrain_overlay(world, area)
+    # Colour sea and optionally desert and steppe
+    rgba_data[overlay[terrain.sea]] = _SEA
+    if highlight_desert:
+        rgba_data[overlay[terrain.desert]] = _DESERT
+    if highlight_steppe:
+        rgba_data[overlay[terrain.steppe]] = _STEPPE
     return rgba_data
 
 
@@ -69,19 +112,15 @@ def _highlight(rgba_data, area, highlight):
     Highlight tiles in an area
     """
     xmin, xmax, ymin, ymax = area.bounds()
-    for x, y in highlight.all_tiles:
-        if area.in_area(x, y):
-            x -= xmin
-            y -= ymin
-            rgba_data[x][y] += np.array([0.3, 0.0, 0.3, 0.0])
-            rgba_data[x][y] = np.array(
-                [min(value, 1.0) for value in rgba_data[x][y]]
-                )
+    x, y = np.array(highlight.all_tiles, dtype=int).reshape(-1, 2).T
+    inside = (x >= xmin) & (x < xmax) & (y >= ymin) & (y < ymax)
+    mask = np.zeros(rgba_data.shape[:2], dtype=bool)
+    mask[x[inside] - xmin, y[inside] - ymin] = True
+    rgba_data[mask] = np.minimum(rgba_data[mask] + _HIGHLIGHT, 1.0)
     return rgba_data
 
 
 def plot_military_techs(world, highlight_desert=False, highlight_steppe=False):
-    fig, ax, colour_map = _init_world_plot()
     """
     Plot a heatmap of military technology level.
 
@@ -92,23 +131,18 @@ def plot_military_techs(world, highlight_desert=False, highlight_steppe=False):
         highligt_steppe (bool, default=False): Highlight steppe tiles on the
             map.
     """
+    import matplotlib.pyplot as plt
 
-    # Prepare data
-    plot_data = np.array([
-        [world.index(x, y).total_military_techs()
-         for y in range(world.ydim)] for x in range(world.xdim)
-        ])
-    plot_data = plot_data / world.params.n_military_techs
+    fig, ax, colour_map = _init_world_plot()
 
-    # Generate rgba data
-    plot_data = colour_map(plot_data)
-    plot_data = _colour_special_tiles(plot_data, world, highlight_desert,
-                                      highlight_steppe)
+    plot_data = map_rgba(world, 'military_techs', highlight_desert,
+                         highlight_steppe)
 
     im = ax.imshow(np.rot90(plot_data), cmap=colour_map)
     fig.colorbar(im)
     fig.savefig('military_techs_{:04d}.pdf'.format(world.step_number),
                 format='pdf')
+    plt.close(fig)
 
 
 def plot_ultrasocietal_traits(world, highlight_desert=False,
@@ -123,24 +157,18 @@ def plot_ultrasocietal_traits(world, highlight_desert=False,
         highligt_steppe (bool, default=False): Highlight steppe tiles on the
             map.
     """
+    import matplotlib.pyplot as plt
+
     fig, ax, colour_map = _init_world_plot()
 
-    # Prepare data
-    plot_data = np.array([
-        [world.index(x, y).total_ultrasocietal_traits()
-         for y in range(world.ydim)] for x in range(world.xdim)
-         ])
-    plot_data = plot_data / world.params.n_ultrasocietal_traits
-
-    # Generate rgba data
-    plot_data = colour_map(plot_data)
-    plot_data = _colour_special_tiles(plot_data, world, highlight_desert,
-                                      highlight_steppe)
+    plot_data = map_rgba(world, 'ultrasocietal_traits', highlight_desert,
+                         highlight_steppe)
 
     im = ax.imshow(np.rot90(plot_data), cmap=colour_map)
     fig.colorbar(im)
     fig.savefig('ultrasocietal_traits_{:04d}.pdf'.format(world.step_number),
                 format='pdf')
+    plt.close(fig)
 
 
 def plot_active_agriculture(world, highlight_desert=False,
@@ -155,24 +183,84 @@ def plot_active_agriculture(world, highlight_desert=False,
         highligt_steppe (bool, default=False): Highlight steppe tiles on the
             map.
     """
-    fig, ax, colour_map = _init_world_plot()
+    import matplotlib.pyplot as plt
 
-    # Prepare data
-    active_tiles = [tile for tile in world.tiles
-                    if tile.is_active(world.step_number) is True]
-    plot_data = np.zeros([world.xdim, world.ydim])
-    for tile in active_tiles:
-        x, y = tile.position
-        plot_data[x][y] = 1.
+    fig, ax, colour_map = _init_world_plot()
 
-    # Generate rgba data
-    plot_data = colour_map(plot_data)
-    plot_data = _colour_special_tiles(plot_data, world, highlight_desert,
-                                      highlight_steppe)
+    plot_data = map_rgba(world, 'active', highlight_desert, highlight_steppe)
 
     im = ax.imshow(np.rot90(plot_data), cmap=colour_map)
     fig.colorbar(im)
     fig.savefig('active_{:04d}.pdf'.format(world.step_number), format='pdf')
+    plt.close(fig)
+
+
+def map_rgba(world, field, highlight_desert=False, highlight_steppe=False):
+    """
+    The colour of each tile in a map of one of the fields plotted by
+    plot_military_techs, plot_ultrasocietal_traits and
+    plot_active_agriculture.
+
+    Args:
+        world (World): The world object to plot.
+        field (str): The field to plot, one of MAP_FIELDS.
+        highligt_desert (bool, default=False): Highlight desert tiles on the
+            map.
+        highligt_steppe (bool, default=False): Highlight steppe tiles on the
+            map.
+
+    Returns:
+        (numpy Array): The RGBA colour of each tile, indexed by x and y
+            coordinate.
+
+    Raises:
+        (ValueError): Raised if field is not one of MAP_FIELDS.
+    """
+    if field not in MAP_FIELDS:
+        raise ValueError('field must be one of {}'.format(
+            ', '.join(MAP_FIELDS)))
+
+    # Prepare data
+    plot_data = world.raster(field).astype(float)
+    if field == 'military_techs':
+        plot_data = plot_data / world.params.n_military_techs
+    elif field == 'ultrasocietal_traits':
+        plot_data = plot_data / world.params.n_ultrasocietal_traits
+
+    # Generate rgba data
+    plot_data = _colour_map()(plot_data)
+    return _colour_special_tiles(plot_data, world, highlight_desert,
+                                 highlight_steppe)
+
+
+def _read_accumulator_data(data_file, mmap=False):
+    """
+    Read the data of each era from an accumulator file, or a legacy pickle
+    dump of a dictionary of arrays keyed by era label.
+
+    Args:
+        data_file (str): Path to the file.
+        mmap (bool, default=False): Whether to memory map the data of an
+            accumulator file rather than reading it into memory.
+
+    Returns:
+        (dict): The array of each era, keyed by date range.
+        (dict): The attributes stored with the data, empty for a pickle dump.
+    """
+    if is_accumulator_file(data_file):
+        accumulator_file = AccumulatorFile(data_file)
+        if mmap:
+            data = {era: accumulator_file.data[index]
+                    for index, era in enumerate(accumulator_file.eras)}
+        else:
+            data = {era: accumulator_file.read(era)
+                    for era in accumulator_file.eras}
+        return data, accumulator_file.attributes
+
+    with open(data_file, 'rb') as picklefile:
+        data_dict = pickle.load(picklefile)
+    return {DateRange.from_string(era): value
+            for era, value in data_dict.items()}, {}
 
 
 class AccumulatorBase(object):
@@ -191,43 +279,43 @@ class AccumulatorBase(object):
             represents the accumulated value in a tile of the map.
     """
     _prefix = None
+    # Whether the accumulator samples each attack attempted, successful or
+    # not, rather than the state of the world after each step
+    _samples_attacks = False
 
     def __init__(self, world, date_ranges):
         self.world = world
         self.date_ranges = date_ranges
         self.data = {era: np.zeros([world.xdim, world.ydim])
                      for era in date_ranges}
+        self._eras_by_year = {}
 
     @classmethod
-    def from_file(cls, world, data_file):
+    def from_file(cls, world, data_file, mmap=False):
         """
         Reconstruct and accumulator from dumped data.
 
         Args:
             world (World): The world definition.
-            data_file (str): Path to the dumped data pickle file.
+            data_file (str): Path to the accumulator file written by dump. A
+                legacy pickle dump may also be read.
+            mmap (bool, default=False): Whether to memory map the data rather
+                than reading it into memory. The data is then read only.
 
         Returns:
             (AccumulatorBase): An accumulator object with the state defined in
                 data_file.
         """
-        date_ranges = []
-        data = {}
-        with open(data_file, 'rb') as picklefile:
-            data_dict = pickle.load(picklefile)
-            for era, value in data_dict.items():
-                daterange = DateRange.from_string(era)
-                date_ranges.append(daterange)
-                data[daterange] = value
-
-            accumulator = cls(world, date_ranges)
-            accumulator.data = data
+        data, attributes = _read_accumulator_data(data_file, mmap)
+        accumulator = cls(world, list(data), **attributes)
+        accumulator.data = data
         return accumulator
 
     @classmethod
     def mean(cls, accumulators):
         mean_accumulator = cls(accumulators[0].world,
-                               accumulators[0].date_ranges)
+                               accumulators[0].date_ranges,
+                               **accumulators[0]._attributes())
 
         total = len(accumulators)
         for era in mean_accumulator.date_ranges:
@@ -243,6 +331,22 @@ class AccumulatorBase(object):
         """
         raise NotImplementedError
 
+    def active_eras(self):
+        """
+        The date ranges which contain the world's current year. These are
+        cached for each year, as accumulators sample many times a year.
+
+        Returns:
+            (list[DateRange]): The date ranges containing the current year.
+        """
+        year = self.world.year()
+        try:
+            return self._eras_by_year[year]
+        except KeyError:
+            eras = [era for era in self.date_ranges if era.is_within(year)]
+            self._eras_by_year[year] = eras
+            return eras
+
     def preprocess(self, data, era):
         """
         Preprocess data to be plotted. In this implementation the data is
@@ -309,8 +413,31 @@ class AccumulatorBase(object):
             highlight (Area, default=None): An arbitrary region of the map to
                 highlight.
         """
+        import matplotlib.pyplot as plt
+
         fig, ax, colour_map = _init_world_plot()
 
+        plot_data, vmin, vmax = self._map_data(era, highlight_desert,
+                                               highlight_steppe, area,
+                                               highlight)
+
+        im = ax.imshow(np.rot90(plot_data), cmap=colour_map, vmin=vmin,
+                       vmax=vmax)
+        fig.colorbar(im)
+        fig.savefig('{}_{}.pdf'.format(self._prefix, era), format='pdf')
+        plt.close(fig)
+
+    def _map_data(self, era, highlight_desert=False, highlight_steppe=False,
+                  area=None, highlight=None):
+        """
+        The colour of each tile in the plot of one era, and the range of the
+        colour bar, see plot.
+
+        Returns:
+            (tuple): The RGBA colour of each tile, indexed by x and y
+                coordinate relative to the area, and the minimum and maximum
+                of the colour bar.
+        """
         if area is None:
             area = Rectangle.entire_map(self.world)
         xmin, xmax, ymin, ymax = area.bounds()
@@ -319,29 +446,35 @@ class AccumulatorBase(object):
         plot_data = self.preprocess(plot_data, era)
         vmin, vmax = self.min_max(plot_data, era)
 
-        plot_data = colour_map(plot_data)
+        plot_data = _colour_map()(plot_data)
         plot_data = _colour_special_tiles(plot_data, self.world,
                                           highlight_desert, highlight_steppe,
                                           area)
         if highlight:
             plot_data = _highlight(plot_data, area, highlight)
+        return plot_data, vmin, vmax
 
-        im = ax.imshow(np.rot90(plot_data), cmap=colour_map, vmin=vmin,
-                       vmax=vmax)
-        fig.colorbar(im)
-        fig.savefig('{}_{}.pdf'.format(self._prefix, era), format='pdf')
-
-    def dump(self, outfile):
+    def dump(self, outfile, dtype=np.float64):
         """
-        Write the state of the accumulator to a file in a pickled format.
+        Write the state of the accumulator to an accumulator file, see
+        accumulatorfile.AccumulatorFile.
 
         Args:
             outfile (str): path to the file to write.
+            dtype (numpy dtype, default=numpy.float64): The type to store the
+                data as, either numpy.float32 or numpy.float64.
+        """
+        write_accumulator_file(outfile, self.data, dtype, self._attributes())
+
+    def _attributes(self):
+        """
+        The constructor arguments, other than world and date ranges, which
+        are stored with the data by dump and passed back by from_file.
+
+        Returns:
+            (dict): The JSON serialisable arguments, keyed by name.
         """
-        with open(outfile, 'wb') as picklefile:
-            pickle.dump(
-                {str(key): value for key, value in self.data.items()},
-                picklefile)
+        return {}
 
 
 class ImperialDensity(AccumulatorBase):
@@ -368,20 +501,112 @@ class ImperialDensity(AccumulatorBase):
         super().__init__(world, date_ranges)
 
     def sample(self):
-        # Create list of tiles to sample, only tiles with agriculture
-        agricultural_tiles = [tile for tile in self.world.tiles
-                              if tile.terrain.polity_forming]
-        agricultural_tiles[:] = [tile for tile in agricultural_tiles
-                                 if tile.is_active(self.world.step_number)]
-
-        # Create list of eras to add imperial density to, only those that
-        # contain the current year
-        year = self.world.year()
-        active_eras = [era for era in self.date_ranges if era.is_within(year)]
-        for tile in agricultural_tiles:
-            if tile.polity.size() > _LARGE_POLITY_THRESHOLD:
-                for era in active_eras:
-                    self.data[era][tile.position[0], tile.position[1]] += 1.
+        # Add imperial density to only the eras containing the current year
+        active_eras = self.active_eras()
+        if not active_eras:
+            return
+
+        # Active agricultural tiles which belong to a large polity
+        large = np.logical_and(
+            self.world.raster('active'),
+            self.world.raster('polity_size') > _LARGE_POLITY_THRESHOLD)
+        for era in active_eras:
+            self.data[era] += large
+
+
+class PolitySizeDensity(AccumulatorBase):
+    """
+    Accumulator of the number of samples each tile spends in polities of each
+    size, from which the imperial density for any large polity threshold can
+    be found after a simulation.
+
+    Args:
+        world (World): The world definition.
+        date_ranges (list[DateRange], default=imperial_density_date_ranges):
+            The date ranges to accumulate data for. These ranges may overlap.
+        edges (tuple[int], default=(0, 1, 2, 3, 5, 10, 20, 30, 50, 100, 200,
+            300, 500, 1000)): The edges of the polity size buckets, in
+            ascending order. Bucket i contains polities larger than edges[i]
+            and no larger than edges[i+1], the final bucket has no upper
+            limit.
+
+    Attributes:
+        data (dict): The accumulated counts for each of the date ranges
+            specified. The keys of the dictionary are the date ranges. The
+            values are three dimensional numpy arrays where element [x, y, i]
+            is the number of samples in which the tile at (x, y) was active
+            and belonged to a polity in bucket i.
+    """
+    _label = 'imperial density'
+    _prefix = 'polity_size_density'
+
+    def __init__(self, world, date_ranges=imperial_density_date_ranges,
+                 edges=_POLITY_SIZE_EDGES):
+        super().__init__(world, date_ranges)
+        self.edges = np.asarray(edges)
+        self.data = {era: np.zeros([world.xdim, world.ydim, len(edges)])
+                     for era in date_ranges}
+
+    def sample(self):
+        active_eras = self.active_eras()
+        if not active_eras:
+            return
+
+        # The bucket of each active tile, offset by the tile's position in
+        # the flattened data arrays
+        active = self.world.raster('active')
+        size = self.world.raster('polity_size')[active]
+        bucket = np.searchsorted(self.edges, size, side='left') - 1
+        bucket += np.flatnonzero(active) * len(self.edges)
+        counts = np.bincount(bucket, minlength=active.size*len(self.edges))
+        for era in active_eras:
+            self.data[era] += counts.reshape(self.data[era].shape)
+
+    def imperial_density(self, threshold=_LARGE_POLITY_THRESHOLD):
+        """
+        The imperial density for a large polity threshold.
+
+        Args:
+            threshold (int, default=10): Polities larger than threshold are
+                considered large. Must be one of the bucket edges.
+
+        Returns:
+            (ImperialDensity): An imperial density accumulator with the data
+                accumulated for the threshold.
+
+        Raises:
+            (ValueError): Raised if threshold is not a bucket edge.
+        """
+        if threshold not in self.edges:
+            raise ValueError(
+                'threshold must be one of the bucket edges {}'.format(
+                    self.edges.tolist()))
+        first_bucket = np.flatnonzero(self.edges == threshold)[0]
+
+        imperial_density = ImperialDensity(self.world, self.date_ranges)
+        imperial_density.data = {
+            era: np.sum(data[:, :, first_bucket:], axis=2)
+            for era, data in self.data.items()}
+        return imperial_density
+
+    def plot(self, era, highlight_desert=False, highlight_steppe=False,
+             area=None, highlight=None):
+        """
+        Produce a plot of the imperial density for the default large polity
+        threshold for one era, see AccumulatorBase.plot. Use
+        imperial_density to plot other thresholds.
+        """
+        self.imperial_density().plot(era, highlight_desert, highlight_steppe,
+                                     area, highlight)
+
+    def _map_data(self, era, highlight_desert=False, highlight_steppe=False,
+                  area=None, highlight=None):
+        return self.imperial_density()._map_data(era, highlight_desert,
+                                                 highlight_steppe, area,
+                                                 highlight)
+
+    def _attributes(self):
+        return {'edges': self.edges.tolist()}
 
 
 class AttackEvents(AccumulatorBase):
@@ -401,15 +626,347 @@ class AttackEvents(AccumulatorBase):
     """
     _label = 'attack frequency'
     _prefix = 'attack_frequency'
+    _samples_attacks = True
 
     def __init__(self, world, date_ranges):
         super().__init__(world, date_ranges)
 
     def sample(self, tile):
-        year = self.world.year()
-        active_eras = [era for era in self.date_ranges if era.is_within(year)]
+        """
+        Sample a single attack, for use as the attack callback of World.step
+        or ArrayWorld.step.
+
+        Args:
+            tile (Community or int): The target of the attack. ArrayWorld
+                passes the target's tile number rather than a community.
+        """
+        if isinstance(tile, numbers.Integral):
+            x, y = tile % self.world.xdim, tile // self.world.xdim
+        else:
+            x, y = tile.position
+        for era in self.active_eras():
+            self.data[era][x, y] += 1.
+
+    def sample_attacks(self, attack_buffer):
+        """
+        Sample the attacks made in a step, as recorded in a world's attack
+        buffer. Attach the accumulator with World.record_attacks for this to
+        be called at the end of every attack phase, which is faster than
+        passing sample as a callback.
+
+        Args:
+            attack_buffer (AttackBuffer): The attacks made in the current
+                step.
+        """
+        active_eras = self.active_eras()
+        if not active_eras or len(attack_buffer) == 0:
+            return
+
+        targets = attack_buffer.field('target')
+        x, y = targets % self.world.xdim, targets // self.world.xdim
         for era in active_eras:
-            self.data[era][tile.position[0], tile.position[1]] += 1.
+            np.add.at(self.data[era], (x, y), 1.)
+
+
+class AccumulatorStatistics(object):
+    """
+    Streaming statistics of an accumulator over an ensemble of simulations.
+
+    Replicas are added one at a time, and the running per tile mean and sum
+    of squared deviations updated using Welford's algorithm, so memory use is
+    independent of the number of replicas. Statistics gathered separately,
+    for example by different worker processes, may be combined with merge.
+
+    If quantile edges are given a histogram of each tile's values is also
+    kept, from which approximate quantiles are interpolated. Values outside
+    of the edges are counted in the first or last bin.
+
+    Args:
+        world (World): The world definition.
+        date_ranges (list[DateRange]): The date ranges of the accumulator.
+        accumulator_class (type, default=ImperialDensity): The class of the
+            accumulator whose data is added. Statistics are returned as
+            instances of this class.
+        quantile_edges (sequence[float], default=None): The bin edges of the
+            histograms used to approximate quantiles. If None quantiles are
+            not available.
+        attributes (dict, default=None): The constructor arguments of the
+            accumulator, other than world and date ranges, see
+            AccumulatorBase.dump. If None the class defaults are used.
+
+    Attributes:
+        count (int): The number of replicas added.
+        data (dict): The running mean for each of the date ranges.
+        m2 (dict): The running sum of squared deviations from the mean for
+            each of the date ranges.
+        histograms (dict): The histogram of each tile's values for each of
+            the date ranges, with the bins along the last axis. None if
+            quantile_edges is None.
+    """
+    def __init__(self, world, date_ranges, accumulator_class=ImperialDensity,
+                 quantile_edges=None, attributes=None):
+        self.world = world
+        self.date_ranges = date_ranges
+        self.accumulator_class = accumulator_class
+        self.attributes = {} if attributes is None else dict(attributes)
+        self.count = 0
+        self.data = {}
+        self.m2 = {}
+
+        if quantile_edges is None:
+            self.quantile_edges = None
+            self.histograms = None
+        else:
+            self.quantile_edges = np.asarray(quantile_edges, dtype=float)
+            if (len(self.quantile_edges) < 2
+                    or np.any(np.diff(self.quantile_edges) <= 0)):
+                raise ValueError(
+                    'Quantile edges must be at least two increasing values')
+            self.histograms = {}
+
+    def add(self, accumulator):
+        """
+        Add the data of a single replica.
+
+        Args:
+            accumulator (AccumulatorBase or dict): The accumulator of the
+                replica, or its data.
+        """
+        data = getattr(accumulator, 'data', accumulator)
+
+        self.count += 1
+        for era in self.date_ranges:
+            values = data[era]
+            if self.count == 1:
+                self.data[era] = np.array(values, dtype=float)
+                self.m2[era] = np.zeros_like(self.data[era])
+            else:
+                delta = values - self.data[era]
+                self.data[era] += delta / self.count
+                self.m2[era] += delta * (values - self.data[era])
+
+            if self.histograms is not None:
+                n_bins = len(self.quantile_edges) - 1
+                bins = np.searchsorted(self.quantile_edges, values,
+                                       side='right') - 1
+                bins = np.clip(bins, 0, n_bins - 1)
+                if era not in self.histograms:
+                    self.histograms[era] = np.zeros(np.shape(values)
+                                                    + (n_bins,),
+                                                    dtype=np.int64)
+                histogram = self.histograms[era].reshape(-1, n_bins)
+                histogram[np.arange(len(histogram)), bins.ravel()] += 1
+
+    def merge(self, other):
+        """
+        Combine the statistics of another set of replicas into these, using
+        the pairwise update of Chan et al.
+
+        Args:
+            other (AccumulatorStatistics): The statistics to merge. These
+                must be of the same date ranges, quantile edges and
+                accumulator attributes.
+
+        Raises:
+            (ValueError): Raised if the statistics have different quantile
+                edges or accumulator attributes.
+        """
+        if self.attributes != other.attributes:
+            raise ValueError('Cannot merge statistics with different '
+                             'accumulator attributes')
+        if (self.quantile_edges is None) != (other.quantile_edges is None) or (
+                self.quantile_edges is not None and not np.array_equal(
+                    self.quantile_edges, other.quantile_edges)):
+            raise ValueError('Cannot merge statistics with different quantile'
+                             ' edges')
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count = other.count
+            self.data = {era: np.copy(other.data[era])
+                         for era in self.date_ranges}
+            self.m2 = {era: np.copy(other.m2[era])
+                       for era in self.date_ranges}
+            if self.histograms is not None:
+                self.histograms = {era: np.copy(other.histograms[era])
+                                   for era in self.date_ranges}
+            return
+
+        count = self.count + other.count
+        for era in self.date_ranges:
+            delta = other.data[era] - self.data[era]
+            self.data[era] += delta * (other.count / count)
+            self.m2[era] += (other.m2[era]
+                             + delta**2 * (self.count * other.count / count))
+            if self.histograms is not None:
+                self.histograms[era] += other.histograms[era]
+        self.count = count
+
+    def _accumulator(self, data):
+        """
+        Construct an accumulator holding the given data.
+        """
+        accumulator = self.accumulator_class(self.world, self.date_ranges,
+                                             **self.attributes)
+        accumulator.data = data
+        return accumulator
+
+    def mean(self):
+        """
+        The mean over the replicas added.
+
+        Returns:
+            (AccumulatorBase): An accumulator holding the mean of each tile.
+
+        Raises:
+            (ValueError): Raised if no replicas have been added.
+        """
+        if self.count == 0:
+            raise ValueError('No replicas have been added')
+        return self._accumulator({era: np.copy(self.data[era])
+                                  for era in self.date_ranges})
+
+    def variance(self, ddof=1):
+        """
+        The variance over the replicas added.
+
+        Args:
+            ddof (int, default=1): The delta degrees of freedom. The sum of
+                squared deviations is divided by count - ddof.
+
+        Returns:
+            (AccumulatorBase): An accumulator holding the variance of each
+                tile.
+
+        Raises:
+            (ValueError): Raised if fewer than ddof + 1 replicas have been
+                added.
+        """
+        if self.count <= ddof:
+            raise ValueError(
+                'At least {} replicas are required, {} have been added'.format(
+                    ddof + 1, self.count))
+        return self._accumulator({era: self.m2[era] / (self.count - ddof)
+                                  for era in self.date_ranges})
+
+    def standard_deviation(self, ddof=1):
+        """
+        The standard deviation over the replicas added, see variance.
+
+        Returns:
+            (AccumulatorBase): An accumulator holding the standard deviation
+                of each tile.
+        """
+        variance = self.variance(ddof)
+        variance.data = {era: np.sqrt(value)
+                         for era, value in variance.data.items()}
+        return variance
+
+    def quantile(self, q):
+        """
+        The approximate quantile of each tile over the replicas added,
+        interpolated linearly within the histogram bins.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            (AccumulatorBase): An accumulator holding the quantile of each
+                tile.
+
+        Raises:
+            (ValueError): Raised if quantile edges were not given, no
+                replicas have been added or q is not between 0 and 1.
+        """
+        if self.histograms is None:
+            raise ValueError('Quantiles require quantile edges')
+        if self.count == 0:
+            raise ValueError('No replicas have been added')
+        if not 0 <= q <= 1:
+            raise ValueError('Quantile must be between 0 and 1')
+
+        edges = self.quantile_edges
+        data = {}
+        for era in self.date_ranges:
+            cumulative = np.cumsum(self.histograms[era], axis=-1)
+            target = q * self.count
+            # The first non empty bin whose cumulative count reaches the
+            # target
+            if target > 0:
+                bins = np.sum(cumulative < target, axis=-1)
+            else:
+                bins = np.sum(cumulative == 0, axis=-1)
+            bins = np.minimum(bins, len(edges) - 2)
+            below = np.take_along_axis(cumulative, bins[..., None] - 1,
+                                       axis=-1)[..., 0]
+            below = np.where(bins > 0, below, 0)
+            in_bin = np.take_along_axis(self.histograms[era],
+                                        bins[..., None], axis=-1)[..., 0]
+            fraction = np.divide(target - below, in_bin,
+                                 out=np.zeros(bins.shape),
+                                 where=in_bin > 0)
+            data[era] = edges[bins] + fraction * (edges[bins+1] - edges[bins])
+        return self._accumulator(data)
+
+    def dump(self, outfile):
+        """
+        Write the statistics to a NumPy .npz file.
+
+        Args:
+            outfile (str): path to the file to write.
+        """
+        arrays = {'count': self.count,
+                  'eras': np.array([str(era) for era in self.date_ranges]),
+                  'attributes': json.dumps(self.attributes)}
+        if self.quantile_edges is not None:
+            arrays['quantile_edges'] = self.quantile_edges
+        for name, values in (('mean', self.data), ('m2', self.m2),
+                             ('histogram', self.histograms or {})):
+            for era, value in values.items():
+                arrays['{}/{}'.format(name, era)] = value
+        # Save to an open file so that NumPy does not append a suffix to the
+        # path
+        with open(outfile, 'wb') as npzfile:
+            np.savez(npzfile, **arrays)
+
+    @classmethod
+    def from_file(cls, world, data_file, accumulator_class=ImperialDensity):
+        """
+        Reconstruct statistics from dumped data.
+
+        Args:
+            world (World): The world definition.
+            data_file (str): Path to the NumPy .npz file written by dump.
+            accumulator_class (type, default=ImperialDensity): The class of
+                the accumulator the statistics are of.
+
+        Returns:
+            (AccumulatorStatistics): The statistics defined in data_file.
+        """
+        with np.load(data_file) as arrays:
+            eras = [DateRange.from_string(era) for era in arrays['eras']]
+            quantile_edges = arrays.get('quantile_edges')
+            # Files written before attributes were stored have none
+            attributes = json.loads(str(arrays.get('attributes', '{}')))
+            statistics = cls(world, eras, accumulator_class, quantile_edges,
+                             attributes)
+            statistics.count = int(arrays['count'])
+            if statistics.count > 0:
+                statistics.data = {era: arrays['mean/{}'.format(era)]
+                                   for era in eras}
+                statistics.m2 = {era: arrays['m2/{}'.format(era)]
+                                 for era in eras}
+                if quantile_edges is not None:
+                    statistics.histograms = {
+                        era: arrays['histogram/{}'.format(era)]
+                        for era in eras}
+        return statistics
+
+
+# The result of a linear regression of a correlator against an accumulator in
+# one era, n is the number of tiles compared
+Regression = namedtuple('Regression',
+                        ['slope', 'intercept', 'rvalue', 'pvalue', 'n'])
 
 
 class CorrelateBase(object):
@@ -423,13 +980,13 @@ class CorrelateBase(object):
     """
     _label = None
     _prefix = None
-    _REMOVE_FLAG = -5
 
     def __init__(self, world, date_ranges):
         self.world = world
         self.date_ranges = date_ranges
         self.data = {era: np.zeros([world.xdim, world.ydim])
                      for era in date_ranges}
+        self._masks = {}
 
     def plot_heatmap(self, blur=False, area=None, highlight=None):
         """
@@ -442,51 +999,95 @@ class CorrelateBase(object):
                 is plotted.
             highlight (Area, default=None): An area of the map to highlight.
         """
-        if area is None:
-            area = Rectangle.entire_map(self.world)
-        xmin, xmax, ymin, ymax = area.bounds()
+        import matplotlib.pyplot as plt
 
         for era in self.date_ranges:
             fig, ax, colour_map = _init_world_plot()
 
-            plot_data = self.data[era][xmin:xmax, ymin:ymax]
-
-            if blur:
-                plot_data = ndimage.gaussian_filter(plot_data, sigma=blur)
-            # Normalise
-            vmax = np.max(plot_data)
-            plot_data = plot_data/vmax
-
-            # Create rgb data
-            plot_data = colour_map(plot_data)
-            plot_data = _colour_special_tiles(plot_data, self.world, area=area)
-            if highlight:
-                plot_data = _highlight(plot_data, area, highlight)
+            plot_data, vmin, vmax = self._map_data(era, blur, area, highlight)
 
             im = ax.imshow(np.rot90(plot_data), cmap=colour_map, vmax=vmax,
-                           vmin=0)
+                           vmin=vmin)
             fig.colorbar(im)
             fig.savefig('{}_{}.pdf'.format(self._prefix, era))
+            plt.close(fig)
 
-    def correlate(self, accumulator, blur=False, cumulative=False, area=None,
-                  exclude=None, log_log=False):
+    def _map_data(self, era, blur=False, area=None, highlight=None):
         """
-        Perform a linear regression of the accumulators date against the
-        correlators data and plot the result.
+        The colour of each tile in the heatmap of one era, and the range of
+        the colour bar, see plot_heatmap.
+
+        Returns:
+            (tuple): The RGBA colour of each tile, indexed by x and y
+                coordinate relative to the area, and the minimum and maximum
+                of the colour bar.
+        """
+        from scipy import ndimage
+
+        if area is None:
+            area = Rectangle.entire_map(self.world)
+        xmin, xmax, ymin, ymax = area.bounds()
+
+        plot_data = self.data[era][xmin:xmax, ymin:ymax]
+
+        if blur:
+            plot_data = ndimage.gaussian_filter(plot_data, sigma=blur)
+        # Normalise
+        vmax = np.max(plot_data)
+        plot_data = plot_data/vmax
+
+        # Create rgb data
+        plot_data = _colour_map()(plot_data)
+        plot_data = _colour_special_tiles(plot_data, self.world, area=area)
+        if highlight:
+            plot_data = _highlight(plot_data, area, highlight)
+        return plot_data, 0, vmax
+
+    def _correlation_mask(self, area, exclude=None):
+        """
+        A boolean mask of the tiles of an area to correlate, which excludes
+        sea tiles and the tiles of an excluded area. Masks are cached for
+        each area and excluded area.
 
         Args:
-            accumulator (AccumulatorBase): The accumulator to compare against.
-            blur (float, default=False): The radius of Gaussian blur to apply
-                to the data. If False no blur is applied.
-            cumulative (bool, default=False): Whether to compare against
-                cumulative accumulator data or not.
-            area (Area, default=None): The area to correlate and plot. If None
-                the whole map correlated.
-            exclude (Area, default=None): An area to exclude from the
-                correlation.
-            log_log (bool, default=False): If true correlate the logarithms of
-                the data and accumulator data.
+            area (Area): The area to correlate.
+            exclude (Area, default=None): An area to exclude.
+
+        Returns:
+            (numpy Array): The read only mask over the bounding rectangle of
+                area.
         """
+        key = (area.bounds(),
+               None if exclude is None else tuple(exclude.all_tiles))
+        try:
+            return self._masks[key]
+        except KeyError:
+            pass
+
+        mask = (self.world.raster('terrain')
+                != terrain.all_terrains.index(terrain.sea))
+        if exclude:
+            x, y = np.array(exclude.all_tiles, dtype=int).reshape(-1, 2).T
+            mask[x, y] = False
+        xmin, xmax, ymin, ymax = area.bounds()
+        mask = mask[xmin:xmax, ymin:ymax].copy()
+        mask.flags.writeable = False
+        self._masks[key] = mask
+        return mask
+
+    def _correlation_data(self, accumulator, blur=False, cumulative=False,
+                          area=None, exclude=None, log_log=False):
+        """
+        Generate the pairs of values to correlate in each era common to this
+        object and an accumulator, see regress. Neither object's data is
+        modified.
+
+        Yields:
+            (tuple): The era, the accumulator's values and this object's
+                values, as one dimensional arrays of the same length.
+        """
+        from scipy import ndimage
+
         assert self.world is accumulator.world
         common_eras = [era for era in self.date_ranges
                        if era in accumulator.date_ranges]
@@ -494,72 +1095,80 @@ class CorrelateBase(object):
         if area is None:
             area = Rectangle.entire_map(self.world)
         xmin, xmax, ymin, ymax = area.bounds()
-        xdim = xmax - xmin
-        ydim = ymax - ymin
-
-        if cumulative:
-            cumulative_sum = np.zeros([xdim, ydim])
+        # Don't compare sea or excluded tiles
+        mask = self._correlation_mask(area, exclude)
 
-        sea_tiles = []
-        for tile in self.world.tiles:
-            if tile.terrain == terrain.sea:
-                x, y = tile.position[0], tile.position[1]
-                if area.in_area(x, y):
-                    sea_tiles.append((x-xmin, y-ymin))
-
-        # Correlate population and imperial density between eras in both
-        # cities data and imperial denisty
+        cumulative_sum = 0.
         for era in common_eras:
-            # Figure and axes
-            fig, ax = plt.subplots()
-            # Axes setup
-            ax.set_xlabel(accumulator._label)
-            ax.set_ylabel(self._label)
-            ax.set_title(str(era))
-
             comparison = accumulator.data[era][xmin:xmax, ymin:ymax]
             if cumulative:
-                comparison += cumulative_sum
+                comparison = comparison + cumulative_sum
                 cumulative_sum = comparison
             data = self.data[era][xmin:xmax, ymin:ymax]
 
             if blur:
                 data = ndimage.gaussian_filter(data, sigma=blur)
 
-            # Don't compare sea tiles
-            for x, y in sea_tiles:
-                comparison[x, y] = self._REMOVE_FLAG
-                data[x, y] = self._REMOVE_FLAG
+            selected = mask
+            if log_log is True:
+                # Remove any tiles with value 0 and take logarithms
+                selected = mask & (comparison != 0) & (data != 0)
+                yield era, np.log(comparison[selected]), np.log(data[selected])
+            else:
+                yield era, comparison[selected], data[selected]
+
+    def regress(self, accumulator, blur=False, cumulative=False, area=None,
+                exclude=None, log_log=False):
+        """
+        Perform a linear regression of the accumulators data against the
+        correlators data, without plotting. Sea tiles, excluded tiles and, if
+        log_log is True, tiles where either value is 0 are not compared.
 
-            # Don't compare excluded tiles
-            if exclude:
-                for x, y in exclude.all_tiles:
-                    comparison[x, y] = self._REMOVE_FLAG
-                    data[x, y] = self._REMOVE_FLAG
+        Args:
+            accumulator (AccumulatorBase): The accumulator to compare against.
+            blur (float, default=False): The radius of Gaussian blur to apply
+                to the data. If False no blur is applied.
+            cumulative (bool, default=False): Whether to compare against
+                cumulative accumulator data or not.
+            area (Area, default=None): The area to correlate. If None the
+                whole map correlated.
+            exclude (Area, default=None): An area to exclude from the
+                correlation.
+            log_log (bool, default=False): If true correlate the logarithms of
+                the data and accumulator data.
 
-            comparison = comparison.flatten()
-            data = data.flatten()
+        Returns:
+            (dict): The Regression of each era common to this object and the
+                accumulator, keyed by era.
+        """
+        return {era: _linear_regression(comparison, data)
+                for era, comparison, data in self._correlation_data(
+                    accumulator, blur, cumulative, area, exclude, log_log)}
 
-            if log_log is True:
-                # Remove any tiles with value 0
-                for index in range(len(comparison)):
-                    if data[index] == 0 or comparison[index] == 0:
-                        comparison[index] = self._REMOVE_FLAG
-                        data[index] = self._REMOVE_FLAG
-
-            # Remove flagged elements
-            comparison = np.array([elem for elem in comparison
-                                   if elem != self._REMOVE_FLAG])
-            data = np.array([elem for elem in data
-                             if elem != self._REMOVE_FLAG])
-
-            # Take logarithms if requested
-            if log_log is True:
-                comparison = np.log(comparison)
-                data = np.log(data)
+    def correlate(self, accumulator, blur=False, cumulative=False, area=None,
+                  exclude=None, log_log=False):
+        """
+        Perform a linear regression of the accumulators date against the
+        correlators data and plot the result. See regress for the arguments.
+
+        Returns:
+            (dict): The Regression of each era common to this object and the
+                accumulator, keyed by era.
+        """
+        import matplotlib.pyplot as plt
+
+        results = {}
+        for era, comparison, data in self._correlation_data(
+                accumulator, blur, cumulative, area, exclude, log_log):
+            linreg = _linear_regression(comparison, data)
+            results[era] = linreg
 
-            # Linear regression
-            linreg = stats.linregress(comparison, data)
+            # Figure and axes
+            fig, ax = plt.subplots()
+            # Axes setup
+            ax.set_xlabel(accumulator._label)
+            ax.set_ylabel(self._label)
+            ax.set_title(str(era))
 
             # Scatter plot of data against comparison with best fit line
             ax.plot(comparison, data, 'x')
@@ -569,6 +1178,22 @@ class CorrelateBase(object):
             fig.tight_layout()
             fig.savefig('{}_{}_correlation_{}.pdf'.format(
                 self._prefix, accumulator._prefix, era), format='pdf')
+            plt.close(fig)
+        return results
+
+
+def _linear_regression(x, y):
+    """
+    Linear regression of y against x, with undefined statistics if there are
+    fewer than two points or x is constant.
+    """
+    from scipy import stats
+
+    if len(x) < 2 or np.all(x == x[0]):
+        return Regression(np.nan, np.nan, np.nan, np.nan, len(x))
+    linreg = stats.linregress(x, y)
+    return Regression(linreg.slope, linreg.intercept, linreg.rvalue,
+                      linreg.pvalue, len(x))
 
 
 # Population corralatable class
@@ -586,6 +1211,8 @@ class CitiesPopulation(CorrelateBase):
     _prefix = 'population'
 
     def __init__(self, world, data_file, date_ranges=cities_date_ranges):
+        import yaml
+
         super().__init__(world, date_ranges)
 
         # Sum populations from cities and eras
@@ -620,6 +1247,8 @@ class Battles(CorrelateBase):
     _prefix = 'battles'
 
     def __init__(self, world, date_ranges, data_file):
+        import yaml
+
         super().__init__(world, date_ranges)
 
         # Sum battles from data file
@@ -639,7 +1268,8 @@ class HistoricalImperialDensity(CorrelateBase):
 
     Args:
         world (World): The world definition.
-        data_file (str): Path to the imperial density pickle file.
+        data_file (str): Path to the imperial density accumulator file, or
+            legacy pickle file.
     """
     _label = 'historical imperial density'
     _prefix = 'imperial_density'
@@ -648,8 +1278,7 @@ class HistoricalImperialDensity(CorrelateBase):
         # Use the date ranges from Turchin et al.
         super().__init__(world, date_ranges=imperial_density_date_ranges)
 
-        with open(data_file, 'rb') as picklefile:
-            impd = pickle.load(picklefile)
+        impd, _ = _read_accumulator_data(data_file)
 
         for era, imperial_density in impd.items():
             self.data[era] = imperial_density
@@ -669,6 +1298,8 @@ class CompareEmpireShape(object):
             "0".
     """
     def __init__(self, world, data_file, years):
+        import yaml
+
         self.world = world
         self.years = years
 
@@ -732,6 +1363,8 @@ class CompareEmpireShape(object):
         Plot histograms of the number of polities of each size, and the number
         of communities in polities of each size.
         """
+        import matplotlib.pyplot as plt
+
         for year in self.years:
             # Don't produce a histogram if there are no polities or the
             # empire did not exist at this century
@@ -757,23 +1390,34 @@ class CompareEmpireShape(object):
             ax[1].hist(polity_sizes, bins=bins, weights=polity_sizes)
             fig.tight_layout()
             fig.savefig('{}_{}.pdf'.format(self.name, year))
+            plt.close(fig)
 
     def dump(self, outfile):
         """
-        Dump the data of the object to a pickle file.
+        Dump the data of the object to a NumPy .npz file.
 
         Args:
-            outfile (str): Path to the pickle file to create.
+            outfile (str): Path to the file to create.
         """
-        with open(outfile, 'wb') as picklefile:
-            pickle.dump(self.n_polities, picklefile)
-            pickle.dump(self.polity_sizes, picklefile)
+        years = list(self.n_polities)
+        sizes = [self.polity_sizes[year] for year in years]
+        # Save to an open file so that NumPy does not append a suffix to the
+        # path
+        with open(outfile, 'wb') as npzfile:
+            np.savez(npzfile,
+                     years=np.array(years, dtype=str),
+                     n_polities=np.array([self.n_polities[year]
+                                          for year in years], dtype=np.int64),
+                     polity_sizes=np.array(
+                         [size for year_sizes in sizes
+                          for size in year_sizes], dtype=np.int64),
+                     offsets=np.cumsum([0] + [len(year_sizes)
+                                              for year_sizes in sizes]))
 
     @classmethod
     def from_file(cls, world, data_file, years, infile):
         """
-        Reconstruct a CompareEmpireShape object previously dumped to a pickle
-        file.
+        Reconstruct a CompareEmpireShape object previously dumped to a file.
 
         Args:
             world (World): The world definition.
@@ -782,14 +1426,19 @@ class CompareEmpireShape(object):
                 defined. These must correspond to keys in the YAML file and are
                 of the format "year era" _e.g._ "100 AD", "300 BC". Year 0 is
                 given by "0".
-            infile (str): Path to the pickle file.
+            infile (str): Path to the file written by dump.
 
         Returns:
             (CompareEmpireShape): A CompareEmpireShape object with the state of
-                that previously dumped to the pickle file.
+                that previously dumped to the file.
         """
         compare = cls(world, data_file, years)
-        with open(infile, 'rb') as picklefile:
-            compare.n_polities = pickle.load(picklefile)
-            compare.polity_sizes = pickle.load(picklefile)
+        with np.load(infile) as arrays:
+            offsets = arrays['offsets']
+            polity_sizes = arrays['polity_sizes']
+            for index, year in enumerate(arrays['years']):
+                year = str(year)
+                compare.n_polities[year] = int(arrays['n_polities'][index])
+                compare.polity_sizes[year] = polity_sizes[
+                    offsets[index]:offsets[index+1]].tolist()
         return compare
@@ -0,0 +1,1003 @@
+"""
+Array backed world module.
+"""
+from . import terrain, default_parameters
+from .community import DIRECTIONS
+from .littoral import littoral_index
+from .rng import RandomStream
+from .snapshot import save_snapshot, load_snapshot
+from .events import AttackBuffer
+from .world import (RASTER_FIELDS, _START_YEAR, _YEARS_PER_STEP, _FINAL_STEP,
+                    _fork_params, _fork_rng, _raster)
+import copy
+import numpy as np
+import os
+
+# Integer codes of terrains in the terrain array
+_SEA = terrain.all_terrains.index(terrain.sea)
+_STEPPE = terrain.all_terrains.index(terrain.steppe)
+
+# The values and arrays written by ArrayWorld.save_static_arrays, sea_attacks
+# is whether the littoral neighbour index is populated
+_STATIC_SCALARS = ('xdim', 'ydim', 'littoral_range', 'sea_attacks')
+_STATIC_ARRAYS = ('terrain', 'elevation', 'active_from', 'polity_forming',
+                  'neighbours', 'littoral', 'littoral_offsets',
+                  'littoral_targets', 'littoral_distances', '_littoral_keys')
+
+
+class ArrayWorld(object):
+    """
+    A structure-of-arrays implementation of World. Rather than linking
+    Community and Polity objects, the state of every tile is held in NumPy
+    arrays indexed by tile number. Tiles are numbered in the same column-major
+    fashion as World.tiles, _i.e._ tile x + y*xdim is at coordinates (x,y).
+
+    The simulation follows the same rules as World and produces statistically
+    equivalent results, although the random number streams differ.
+
+    Args:
+        xdim (int): The x dimension of the world in communities.
+        ydim (int): The y dimension of the world in communities.
+        terrains (list[int]): The terrain of each tile as its position in
+            terrain.all_terrains.
+        elevation (list[float]): The elevation of each tile in kilometres.
+        active_from (list[int]): The step number at which each tile becomes
+            agriculturally active.
+        params (Parameters, default=guard.default_paramters): The simulation
+            parameter set to use.
+        rng (RandomStream, default=None): The random number stream used for
+            every stochastic decision in the simulation. If None a new,
+            unseeded, stream is created.
+
+    Attributes:
+        xdim (int): The x dimension of the world in communities.
+        ydim (int): The y dimension of the world in communities.
+        params (Parameters): The simulation parameter set.
+        step_number (int): The current step number.
+        terrain (numpy Array): The terrain code of each tile.
+        elevation (numpy Array): The elevation of each tile in kilometres.
+        active_from (numpy Array): The step at which each tile becomes active.
+        polity_forming (numpy Array): True for tiles whose terrain can form
+            polities.
+        neighbours (numpy Array): The tile number of each tiles neighbours in
+            the order of DIRECTIONS, -1 where there is no neighbour.
+        littoral (numpy Array): True for littoral tiles.
+        littoral_range (float): The greatest distance included in the
+            littoral neighbour index.
+        littoral_offsets (numpy Array): Tile i's littoral neighbours are
+            entries littoral_offsets[i] to littoral_offsets[i+1] of
+            littoral_targets and littoral_distances, sorted by distance.
+        littoral_targets (numpy Array): Tile numbers of littoral neighbours.
+        littoral_distances (numpy Array): Distances to littoral neighbours.
+        ultrasocietal_traits (numpy Array): A bitmask for each tile of which
+            ultrasocietal traits the community possesses, bit i is set if the
+            community possesses trait i.
+        ultrasocietal_trait_counts (numpy Array): The number of
+            ultrasocietal traits of each tile.
+        military_techs (numpy Array): A bitmask for each tile of which
+            military technologies the community possesses.
+        military_tech_counts (numpy Array): The number of military
+            technologies of each tile.
+        polity (numpy Array): The polity label of each tile, -1 for tiles
+            which cannot form polities.
+        polity_size (numpy Array): The number of communities in the polity
+            with each label, zero for unused labels.
+        polity_traits (numpy Array): The total number of ultrasocietal traits
+            in the polity with each label.
+        rng (RandomStream): The random number stream.
+    """
+    def __init__(self, xdim, ydim, terrains, elevation, active_from,
+                 params=default_parameters, rng=None):
+        self._set_parameters(params, rng)
+
+        self.xdim = xdim
+        self.ydim = ydim
+        self.total_tiles = xdim*ydim
+
+        self.terrain = np.array(terrains, dtype=np.int8)
+        self.elevation = np.array(elevation, dtype=float)
+        self.active_from = np.array(active_from, dtype=np.int64)
+        self.polity_forming = np.array(
+            [landscape.polity_forming for landscape in terrain.all_terrains]
+            )[self.terrain]
+        # Non polity forming tiles have the Community defaults
+        self.elevation[~self.polity_forming] = 0
+        self.active_from[~self.polity_forming] = 0
+        self._set_period_boundaries()
+
+        # Initialise neighbours and littoral neighbours
+        self.set_neighbours()
+        self.set_littoral_tiles()
+        self.set_littoral_neighbours()
+
+        self._initialise_state()
+
+    @classmethod
+    def from_static_arrays(cls, directory, params=default_parameters,
+                           rng=None):
+        """
+        Build an array world from the static arrays written by
+        save_static_arrays. The arrays describing the map and its neighbour
+        and littoral neighbour indices are memory mapped, read only, rather
+        than calculated. Every process which builds a world from the same
+        directory shares the same pages of memory, so the arrays are not
+        copied into each process.
+
+        Args:
+            directory (str): The directory written by save_static_arrays.
+            params (Parameters, default=guard.default_paramters): The
+                simulation parameter set to use. If it enables sea attacks
+                and the parameters of the saved world did not, the world
+                builds its own littoral neighbour index.
+            rng (RandomStream, default=None): The random number stream. If
+                None a new, unseeded, stream is created.
+
+        Returns:
+            (ArrayWorld): The array world, at step 0.
+        """
+        world = cls.__new__(cls)
+        world._set_parameters(params, rng)
+
+        scalars = {
+            name: np.load(os.path.join(directory, name + '.npy')).item()
+            for name in _STATIC_SCALARS
+            }
+        world.xdim, world.ydim = scalars['xdim'], scalars['ydim']
+        world.total_tiles = world.xdim*world.ydim
+        for name in _STATIC_ARRAYS:
+            setattr(world, name, np.load(
+                os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        world._set_period_boundaries()
+
+        world.littoral_range = scalars['littoral_range']
+        world._key_stride = (world.xdim**2 + world.ydim**2) + 1
+        # The littoral neighbour index is empty without sea attacks
+        if params.sea_attacks and not scalars['sea_attacks']:
+            world.set_littoral_neighbours()
+
+        world._initialise_state()
+        return world
+
+    def save_static_arrays(self, directory):
+        """
+        Write the static arrays of the world, which describe the map and its
+        neighbour and littoral neighbour indices, to a directory as NumPy
+        .npy files, from which from_static_arrays builds worlds without
+        copying them.
+
+        Args:
+            directory (str): Path to an existing directory to write the
+                files to.
+        """
+        scalars = {'xdim': self.xdim, 'ydim': self.ydim,
+                   'littoral_range': self.littoral_range,
+                   'sea_attacks': self.params.sea_attacks}
+        for name in _STATIC_SCALARS:
+            np.save(os.path.join(directory, name + '.npy'), scalars[name])
+        for name in _STATIC_ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'),
+                    getattr(self, name))
+
+    def _set_parameters(self, params, rng):
+        """
+        Set the simulation parameters and random number stream of a new world,
+        which has no attached accumulators.
+        """
+        self.params = params
+        if rng is None:
+            rng = RandomStream()
+        self.rng = rng
+        self.attack_accumulators = []
+        self.attack_buffer = AttackBuffer()
+
+    def _set_period_boundaries(self):
+        """
+        Find the steps at which agricultural periods begin, between which the
+        set of active tiles does not change.
+        """
+        self._period_boundaries = np.unique(
+            self.active_from[self.polity_forming])
+        self._active_interval = (None, None)
+
+    def _initialise_state(self):
+        """
+        Set the traits, technologies and polities of every tile to their
+        initial state, and the step number to zero.
+        """
+        # Initial traits and technologies, held as bitmasks in 64 bit
+        # integers
+        params = self.params
+        if max(params.n_ultrasocietal_traits, params.n_military_techs) > 63:
+            raise ValueError('ArrayWorld supports at most 63 ultrasocietal '
+                             'traits and military technologies')
+        self.ultrasocietal_traits = np.zeros(self.total_tiles, dtype=np.int64)
+        self.ultrasocietal_trait_counts = np.zeros(self.total_tiles,
+                                                   dtype=np.int64)
+        self._seed_military_techs()
+
+        # Each agricultural tile is its own polity, set step number to zero
+        self.reset()
+
+    @classmethod
+    def from_communities(cls, xdim, ydim, communities,
+                         params=default_parameters, rng=None):
+        """
+        Build an array world from a list of communities, as passed to World.
+
+        Args:
+            xdim (int): The x dimension of the world in communities.
+            ydim (int): The y dimension of the world in communities.
+            communities (list[Community]): The list of communities in the
+                world, in the same order as World.tiles.
+            params (Parameters, default=guard.default_paramters): The
+                simulation parameter set to use.
+            rng (RandomStream, default=None): The random number stream. If
+                None a new, unseeded, stream is created.
+
+        Returns:
+            (ArrayWorld): The array world.
+        """
+        return cls(
+            xdim, ydim,
+            [terrain.all_terrains.index(tile.terrain) for tile in communities],
+            [tile.elevation for tile in communities],
+            [tile.period.active_from for tile in communities],
+            params, rng)
+
+    def __str__(self):
+        string = 'ArrayWorld:\n'
+        string += '\t- Tiles: {0}\n'.format(self.total_tiles)
+        string += '\t- Dimensions: {0}x{1}\n'.format(self.xdim, self.ydim)
+        string += '\t- Number of polities: {0}'.format(
+            self.number_of_polities())
+
+        return string
+
+    def number_of_polities(self):
+        """
+        Calculate the number of polities in the world.
+
+        Returns:
+            (int): The number of polities.
+        """
+        return int(np.count_nonzero(self.polity_size))
+
+    def index(self, x, y):
+        """
+        Return the tile number of the tile at coordinates (x,y).
+
+        Returns:
+            (int): The tile number of the tile at coordinate (x,y).
+            (None): If there is no such tile.
+        """
+        if x < 0 or x >= self.xdim or y < 0 or y >= self.ydim:
+            return None
+        return x + y*self.xdim
+
+    def positions(self):
+        """
+        The coordinates of all tiles.
+
+        Returns:
+            (tuple): A tuple (x, y) of arrays of the x and y coordinates of
+                each tile.
+        """
+        tiles = np.arange(self.total_tiles)
+        return tiles % self.xdim, tiles // self.xdim
+
+    def raster(self, field):
+        """
+        The value of a field for every tile, as an array indexed by the
+        coordinates of the tile.
+
+        Args:
+            field (str): The field, one of RASTER_FIELDS, see World.raster.
+
+        Returns:
+            (numpy Array): A two dimensional xdim by ydim array, where element
+                [x, y] is the value for the tile at (x, y).
+
+        Raises:
+            (ValueError): Raised if field is not one of RASTER_FIELDS.
+        """
+        if field == 'terrain':
+            values = self.terrain
+        elif field == 'elevation':
+            values = self.elevation
+        elif field == 'active':
+            values = self.active()
+        elif field == 'polity':
+            values = self.polity
+        elif field == 'polity_size':
+            values = np.where(self.polity >= 0, self.polity_size[self.polity],
+                              0)
+        elif field == 'ultrasocietal_traits':
+            values = self.ultrasocietal_trait_counts
+        elif field == 'military_techs':
+            values = self.military_tech_counts
+        else:
+            raise ValueError('field must be one of {}'.format(
+                ', '.join(RASTER_FIELDS)))
+        return _raster(self.xdim, self.ydim, values)
+
+    def as_arrays(self):
+        """
+        Rasters of every field of the world's state, see raster.
+
+        Returns:
+            (dict): The raster of each of RASTER_FIELDS, keyed by field.
+        """
+        return {field: self.raster(field) for field in RASTER_FIELDS}
+
+    def year(self):
+        """
+        Return the current year.
+
+        Returns:
+            (int): The current year. Years BC are negative.
+        """
+        return self.step_number*_YEARS_PER_STEP + _START_YEAR
+
+    def sea_attack_distance(self):
+        """
+        Determine maximum sea attack distance at current step.
+
+        Returns:
+            (float): The maximum sea attack distance.
+        """
+        return (self.params.base_sea_attack_distance
+                + self.step_number * self.params.sea_attack_increment)
+
+    def active(self):
+        """
+        Determine which tiles are active (polity forming and currently
+        agricultural). The mask is cached and only rebuilt when the step
+        number crosses the start of an agricultural period.
+
+        Returns:
+            (numpy Array): True for active tiles.
+        """
+        start, end = self._active_interval
+        if start is None or not start <= self.step_number < end:
+            self._set_active_tiles()
+        return self._active
+
+    def active_tiles(self):
+        """
+        The tile numbers of the active tiles.
+
+        Returns:
+            (numpy Array): The active tile numbers, in ascending order.
+        """
+        start, end = self._active_interval
+        if start is None or not start <= self.step_number < end:
+            self._set_active_tiles()
+        return self._active_tiles
+
+    def _set_active_tiles(self):
+        """
+        Build the active mask and tile numbers and the interval of steps over
+        which they are valid.
+        """
+        position = np.searchsorted(self._period_boundaries, self.step_number,
+                                   side='right')
+        if position == 0:
+            start = -np.inf
+        else:
+            start = self._period_boundaries[position-1]
+        if position == len(self._period_boundaries):
+            end = np.inf
+        else:
+            end = self._period_boundaries[position]
+
+        self._active_interval = (start, end)
+        self._active = np.logical_and(self.polity_forming,
+                                      self.active_from <= self.step_number)
+        self._active_tiles = np.flatnonzero(self._active)
+
+    def total_ultrasocietal_traits(self):
+        """
+        Total number of ultrasocietal traits of each tile.
+
+        Returns:
+            (numpy Array): The number of traits of each tile.
+        """
+        return self.ultrasocietal_trait_counts
+
+    def total_military_techs(self):
+        """
+        Total number of military technologies of each tile.
+
+        Returns:
+            (numpy Array): The number of technologies of each tile.
+        """
+        return self.military_tech_counts
+
+    def set_neighbours(self):
+        """
+        Determine the tile numbers of each tiles neighbours.
+        """
+        x, y = self.positions()
+        tiles = np.arange(self.total_tiles)
+        self.neighbours = np.stack([
+            np.where(x > 0, tiles - 1, -1),
+            np.where(x < self.xdim - 1, tiles + 1, -1),
+            np.where(y < self.ydim - 1, tiles + self.xdim, -1),
+            np.where(y > 0, tiles - self.xdim, -1)
+            ], axis=1)
+        assert self.neighbours.shape[1] == len(DIRECTIONS)
+
+    def set_littoral_tiles(self):
+        """
+        Flag polity forming tiles with at least one sea neighbour as littoral.
+        """
+        # Append a False entry so that missing neighbours (-1) are not sea
+        sea = np.append(self.terrain == _SEA, False)
+        self.littoral = np.logical_and(
+            self.polity_forming, np.any(sea[self.neighbours], axis=1))
+
+    def final_sea_attack_distance(self):
+        """
+        Determine the maximum sea attack distance at the final step of a
+        simulation, 1500AD.
+
+        Returns:
+            (float): The maximum sea attack distance.
+        """
+        return (self.params.base_sea_attack_distance
+                + _FINAL_STEP * self.params.sea_attack_increment)
+
+    def set_littoral_neighbours(self, max_distance=None):
+        """
+        Build the littoral neighbour index. Littoral tiles are neighbours of
+        all other littoral tiles within range, and of themselves at distance
+        0, which is important in order to reproduce Turchin's results.
+
+        Args:
+            max_distance (float, default=None): The greatest distance of a
+                neighbour to include. If None the maximum sea attack distance
+                at the final step is used.
+        """
+        if max_distance is None:
+            max_distance = self.final_sea_attack_distance()
+        self.littoral_range = max_distance
+
+        littoral = self.littoral
+        if not self.params.sea_attacks:
+            littoral = np.zeros_like(littoral)
+        (self.littoral_offsets, self.littoral_targets,
+         squared_distances) = littoral_index(self.xdim, self.ydim, littoral,
+                                             max_distance)
+        self.littoral_distances = np.sqrt(squared_distances)
+
+        # Search keys which are sorted over the whole index, so that the
+        # number of neighbours of a tile within range can be found by
+        # bisection
+        rows = np.repeat(np.arange(self.total_tiles),
+                         np.diff(self.littoral_offsets))
+        self._key_stride = (self.xdim**2 + self.ydim**2) + 1
+        self._littoral_keys = rows*self._key_stride + squared_distances
+
+    def littoral_neighbours_in_range(self, tiles, distance):
+        """
+        Count the littoral neighbours within a distance of each of a set of
+        tiles.
+
+        Args:
+            tiles (numpy Array): The tile numbers to consider.
+            distance (float): The threshold distance.
+
+        Returns:
+            (numpy Array): The number of littoral neighbours within range of
+                each tile. These are the first entries of each tiles
+                neighbours in the littoral index.
+        """
+        # No neighbour is further away than the map diagonal
+        threshold = min(int(np.floor(distance**2)), self._key_stride - 1)
+        end = np.searchsorted(self._littoral_keys,
+                              tiles*self._key_stride + threshold,
+                              side='right')
+        return end - self.littoral_offsets[tiles]
+
+    def reset(self, seed=None):
+        """
+        Reset the world by returning all polities to single communities and
+        setting the step number to 0.
+
+        Args:
+            seed (int, default=None): If not None, reseed the world's random
+                number stream with this seed, clear all ultrasocietal traits
+                and draw the initial military technologies again from the
+                reseeded stream, so that the simulation which follows depends
+                only on the seed.
+        """
+        if seed is not None:
+            self.rng.seed(seed)
+            self.ultrasocietal_traits = np.zeros(self.total_tiles,
+                                                 dtype=np.int64)
+            self.ultrasocietal_trait_counts = np.zeros(self.total_tiles,
+                                                       dtype=np.int64)
+            self._seed_military_techs()
+        self.step_number = 0
+        self.polity = np.where(self.polity_forming,
+                               np.arange(self.total_tiles), -1)
+        self.polity_size = self.polity_forming.astype(np.int64)
+        self.polity_traits = np.where(self.polity_forming,
+                                      self.total_ultrasocietal_traits(), 0)
+
+    def _seed_military_techs(self):
+        """
+        Set the military technologies of every tile to their initial state.
+        """
+        params = self.params
+        if params.military_technology_seed == 'steppes':
+            # Steppe communities start with all military technologies
+            seeded = self.terrain == _STEPPE
+        elif params.military_technology_seed == 'uniform':
+            # 4.34% chance of starting with all military technologies, as in
+            # Community
+            seeded = np.logical_and(
+                self.polity_forming,
+                self.rng.generator.random(self.total_tiles) < 0.0434)
+        else:
+            raise ValueError('tech_seed must be one of "steppes" or "uniform"')
+        self.military_techs = np.where(
+            seeded, (1 << params.n_military_techs) - 1, 0)
+        self.military_tech_counts = np.where(
+            seeded, params.n_military_techs, 0)
+
+    def fork(self, seed=None, params=None):
+        """
+        Create an independent copy of the world in its current state, from
+        which a simulation may continue separately. Only the arrays of
+        mutable state are copied, the static arrays describing the map and
+        its neighbour and littoral neighbour indices are shared, unless params
+        enables sea attacks and this world's parameters do not, in which case
+        the copy builds its own littoral neighbour index.
+
+        Args:
+            seed (int, default=None): The seed of the copy's random number
+                stream. If None the copy continues from the same random number
+                stream state as this world, and so reproduces its future.
+            params (Parameters, default=None): The simulation parameter set of
+                the copy. If None this world's parameters are used.
+
+        Returns:
+            (ArrayWorld): The copy of the world.
+
+        Raises:
+            (ValueError): Raised if params has a different number of
+                ultrasocietal traits or military technologies.
+        """
+        clone = copy.copy(self)
+        clone.params = _fork_params(self.params, params)
+        clone.rng = _fork_rng(self.rng, seed)
+        clone.attack_accumulators = []
+        clone.attack_buffer = AttackBuffer()
+        # The littoral neighbour index is empty without sea attacks
+        if clone.params.sea_attacks and not self.params.sea_attacks:
+            clone.set_littoral_neighbours()
+        for name in ('ultrasocietal_traits', 'ultrasocietal_trait_counts',
+                     'military_techs', 'military_tech_counts', 'polity',
+                     'polity_size', 'polity_traits'):
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+
+    def save_state(self, path):
+        """
+        Write the state of the simulation to a file. The file holds the step
+        number, the polity label of each tile, the traits and technologies of
+        each tile and the state of the random number stream, from which
+        load_state resumes the simulation exactly.
+
+        Args:
+            path (str): Path to the file to write.
+        """
+        save_snapshot(path, self.step_number, self.polity,
+                      np.zeros(0, dtype=np.int64), self.ultrasocietal_traits,
+                      self.military_techs, self.rng)
+
+    def load_state(self, path):
+        """
+        Restore the state of the simulation from a file written by save_state.
+        The world must have been built from the same map and parameters.
+
+        Args:
+            path (str): Path to the snapshot file.
+
+        Raises:
+            (ValueError): Raised if the snapshot is of a world with a
+                different number of tiles.
+        """
+        state = load_snapshot(path, self.total_tiles, self.rng)
+
+        self.step_number = state['step_number']
+        self.ultrasocietal_traits = state['ultrasocietal_traits']
+        self.military_techs = state['military_techs']
+        self.ultrasocietal_trait_counts = np.array(
+            [bin(mask).count('1') for mask in self.ultrasocietal_traits])
+        self.military_tech_counts = np.array(
+            [bin(mask).count('1') for mask in self.military_techs])
+
+        forming = self.polity_forming
+        self.polity = state['polity']
+        self.polity_size = np.bincount(self.polity[forming],
+                                       minlength=self.total_tiles)
+        self.polity_traits = np.bincount(
+            self.polity[forming],
+            weights=self.ultrasocietal_trait_counts[forming],
+            minlength=self.total_tiles).astype(np.int64)
+
+    def cultural_shift(self):
+        """
+        Attempt cultural shift in all communities.
+
+        Notes:
+            Only the traits which may shift at the larger of the two mutation
+            rates are sampled, each is then shifted with the probability of
+            its own mutation rate relative to the larger rate. This is
+            equivalent to drawing a random number for every trait of every
+            community, as in World.
+        """
+        params = self.params
+        n_traits = params.n_ultrasocietal_traits
+        shift_probability = max(params.mutation_to_ultrasocietal,
+                                params.mutation_from_ultrasocietal)
+
+        tiles = np.flatnonzero(self.polity_forming)
+        candidates = self.rng.bernoulli_positions(len(tiles)*n_traits,
+                                                  shift_probability)
+        tiles = tiles[candidates // n_traits]
+        indices = candidates % n_traits
+        traits = (self.ultrasocietal_traits[tiles] >> indices) & 1 == 1
+        probability = np.where(traits, params.mutation_from_ultrasocietal,
+                               params.mutation_to_ultrasocietal)
+        shift = probability > shift_probability*self.rng.generator.random(
+            len(candidates))
+        tiles, indices, traits = tiles[shift], indices[shift], traits[shift]
+
+        # Keep trait counts and polity trait totals consistent with the
+        # shifted traits
+        change = np.where(traits, -1, 1)
+        np.bitwise_xor.at(self.ultrasocietal_traits, tiles,
+                          np.left_shift(1, indices))
+        np.add.at(self.ultrasocietal_trait_counts, tiles, change)
+        np.add.at(self.polity_traits, self.polity[tiles], change)
+
+    def disintegration(self):
+        """
+        Attempt disintegration of all polities.
+        """
+        params = self.params
+
+        # Skip single community polities
+        labels = np.flatnonzero(self.polity_size > 1)
+        size = self.polity_size[labels]
+        probability = (params.disintegration_size_coefficient * size -
+                       params.disintegration_ultrasocietal_trait_coefficient *
+                       self.polity_traits[labels] / size)
+        probability = np.where(
+            probability < 0, params.disintegration_base,
+            np.minimum(params.disintegration_base + probability, 1))
+        collapsed = labels[
+            probability > self.rng.generator.random(len(labels))]
+        if len(collapsed) == 0:
+            return
+
+        # Give each community of the collapsed polities a new label of its
+        # own from the unused labels
+        communities = np.flatnonzero(np.isin(self.polity, collapsed))
+        self.polity_size[collapsed] = 0
+        self.polity_traits[collapsed] = 0
+        new_labels = np.flatnonzero(self.polity_size == 0)[:len(communities)]
+        self.polity[communities] = new_labels
+        self.polity_size[new_labels] = 1
+        self.polity_traits[new_labels] = self.ultrasocietal_trait_counts[
+            communities]
+
+    def attack(self, callback=None):
+        """
+        Attempt an attack from all active communities.
+
+        Attacks are made in a random order but, rather than being resolved
+        one at a time as in World, they are resolved in rounds. Each round
+        resolves together every outstanding attack whose attacker and target
+        are not the target of an earlier outstanding attack. The attack power
+        of polities, and for entropy maximisation the choice of target, are
+        only recalculated between rounds, so an attack may use powers, or
+        target probabilities, which are out of date after earlier attacks in
+        the same round have moved tiles between polities. The resolution is
+        therefore an approximation of sequential resolution, which agrees
+        with it statistically rather than exactly.
+
+        Args:
+            callback (function, default=None): A callback function invoked
+                with the target's tile number for each attack made, in order,
+                once all attacks have been resolved. Used to record attack
+                events, record_attacks is a faster alternative.
+        """
+        params = self.params
+        rng = self.rng.generator
+
+        # Extend the littoral neighbour index if the simulation runs past the
+        # final step
+        if params.sea_attacks:
+            if self.sea_attack_distance() > self.littoral_range:
+                self.set_littoral_neighbours(2*self.sea_attack_distance())
+
+        # Generate a random order for communities to attempt attacks in
+        attackers = self.rng.permutation(self.active_tiles())
+
+        if params.attack_method == 'uniform':
+            attackers, targets, sea_attack = self._uniform_targets(attackers)
+            choose_targets = None
+        elif params.attack_method == 'entropy_maximisation':
+            targets = np.full(len(attackers), -1)
+            sea_attack = np.zeros(len(attackers), dtype=bool)
+            choose_targets = self._entropy_maximisation_targets
+        else:
+            raise ValueError('attack_method must be one of "uniform" or'
+                             '"entropy_maxmisation"')
+
+        n_attacks = len(attackers)
+        draws = (rng.random(n_attacks), rng.random(n_attacks),
+                 rng.integers(params.n_military_techs, size=n_attacks),
+                 rng.random(n_attacks))
+        made = np.zeros(n_attacks, dtype=bool)
+        success = np.zeros(n_attacks, dtype=bool)
+
+        # Positions of the outstanding attacks in the attack order
+        outstanding = np.arange(n_attacks)
+        while len(outstanding) > 0:
+            if choose_targets is not None:
+                chosen, chosen_sea = choose_targets(attackers[outstanding])
+                # Communities with no neighbour to attack make no attack
+                outstanding = outstanding[chosen != -1]
+                targets[outstanding] = chosen[chosen != -1]
+                sea_attack[outstanding] = chosen_sea[chosen != -1]
+
+            unblocked = self._unblocked_attacks(attackers[outstanding],
+                                                targets[outstanding])
+            ready = outstanding[unblocked]
+            made[ready], success[ready] = self._resolve_attacks(
+                attackers[ready], targets[ready], sea_attack[ready],
+                *(draw[ready] for draw in draws))
+            outstanding = outstanding[~unblocked]
+
+        attackers, targets = attackers[made], targets[made]
+        if callback:
+            for target in targets.tolist():
+                callback(target)
+        if self.attack_accumulators:
+            self.attack_buffer.clear()
+            self.attack_buffer.extend(self.step_number, attackers, targets,
+                                      success[made], sea_attack[made])
+        for accumulator in self.attack_accumulators:
+            accumulator.sample_attacks(self.attack_buffer)
+
+    def record_attacks(self, accumulator):
+        """
+        Attach an accumulator of attack events. At the end of each attack
+        phase the attacks made are written to ArrayWorld.attack_buffer, which
+        is passed to the accumulator's sample_attacks method.
+
+        Args:
+            accumulator (AttackEvents): The accumulator.
+        """
+        self.attack_accumulators.append(accumulator)
+
+    def _uniform_targets(self, attackers):
+        """
+        Choose a random neighbour of each attacker to attack. The targets
+        depend only on static properties of the map, so are chosen for all
+        attacks up front. Returns the attackers which have a valid target,
+        their targets and whether each attack is made by sea.
+        """
+        rng = self.rng.generator
+
+        direction = rng.integers(len(DIRECTIONS), size=len(attackers))
+        targets = self.neighbours[attackers, direction]
+
+        # Don't attack or spread technology to an empty neighbour
+        # It is important to replicate Turchin's results that communities
+        # attack each neighbour with a probability of 1/4
+        attackers = attackers[targets != -1]
+        targets = targets[targets != -1]
+
+        sea_attack = self.terrain[targets] == _SEA
+        if self.params.sea_attacks:
+            # Replace sea targets with a littoral neighbour within range
+            sea_attackers = attackers[sea_attack]
+            in_range = self.littoral_neighbours_in_range(
+                sea_attackers, self.sea_attack_distance())
+            choice = (rng.random(len(sea_attackers))*in_range).astype(
+                np.int64)
+            targets[sea_attack] = self.littoral_targets[
+                self.littoral_offsets[sea_attackers] + choice]
+        else:
+            attackers = attackers[~sea_attack]
+            targets = targets[~sea_attack]
+            sea_attack = sea_attack[~sea_attack]
+
+        # Don't attack or spread technology to a non-agricultural or inactive
+        # tile
+        valid = self.active()[targets]
+        return attackers[valid], targets[valid], sea_attack[valid]
+
+    def _entropy_maximisation_targets(self, attackers):
+        """
+        Choose a target for each attacker with a probability inversely
+        proportional to the attack power of the target's polity. Candidates
+        are the active land neighbours in other polities and the littoral
+        neighbours within range. Returns the target of each attacker, -1 if
+        there are no candidates, and whether each attack is made by sea.
+        """
+        params = self.params
+        n_attackers = len(attackers)
+
+        # Land neighbours which are active and in another polity
+        active = np.append(self.active(), False)
+        land = self.neighbours[attackers]
+        valid_land = np.logical_and(
+            active[land],
+            self.polity[land] != self.polity[attackers][:, np.newaxis])
+        n_land = np.count_nonzero(valid_land, axis=1)
+
+        if params.sea_attacks:
+            sea_offsets = self.littoral_offsets[attackers]
+            n_sea = self.littoral_neighbours_in_range(
+                attackers, self.sea_attack_distance())
+        else:
+            sea_offsets = n_sea = np.zeros(n_attackers, dtype=np.int64)
+
+        # The candidates of every attacker in one array, land neighbours then
+        # littoral neighbours
+        ends = np.cumsum(n_land + n_sea)
+        starts = ends - n_land - n_sea
+        candidates = np.empty(np.sum(n_land + n_sea), dtype=np.int64)
+        rank = np.cumsum(valid_land, axis=1) - 1
+        candidates[(starts[:, np.newaxis] + rank)[valid_land]] = land[
+            valid_land]
+        sea_rows = np.repeat(np.arange(n_attackers), n_sea)
+        sea_position = np.arange(len(sea_rows)) - np.repeat(
+            np.cumsum(n_sea) - n_sea, n_sea)
+        candidates[starts[sea_rows] + n_land[sea_rows] + sea_position] = (
+            self.littoral_targets[sea_offsets[sea_rows] + sea_position])
+
+        # Select a candidate of each attacker by bisecting the cumulative
+        # sum of advantages over all candidates
+        advantages = 1. / (
+            self.polity_traits[self.polity[candidates]]
+            * params.ultrasocietal_attack_coefficient + 1.)
+        cumulative = np.append(0., np.cumsum(advantages))
+        threshold = cumulative[starts] + self.rng.generator.random(
+            n_attackers)*(cumulative[ends] - cumulative[starts])
+        choice = np.clip(
+            np.searchsorted(cumulative, threshold, side='right') - 1,
+            starts, ends - 1)
+
+        has_candidates = ends > starts
+        targets = np.full(n_attackers, -1)
+        targets[has_candidates] = candidates[choice[has_candidates]]
+        sea_attack = choice - starts >= n_land
+        return targets, sea_attack
+
+    def _unblocked_attacks(self, attackers, targets):
+        """
+        Determine which of a sequence of attacks, in order, may be resolved
+        together. An attack is blocked if its attacker or target is the
+        target of an earlier attack, as that attack may change the tile.
+
+        Returns:
+            (numpy Array): True for attacks which are not blocked.
+        """
+        order = np.arange(len(attackers))
+        first_attack = np.full(self.total_tiles, len(attackers))
+        np.minimum.at(first_attack, targets, order)
+        return np.logical_and(first_attack[attackers] >= order,
+                               first_attack[targets] >= order)
+
+    def _resolve_attacks(self, attackers, targets, sea_attack, success_draw,
+                         ethnocide_draw, selected_tech, spread_draw):
+        """
+        Resolve a set of attacks whose targets are distinct and are not the
+        attacker of another attack in the set, and attempt to spread military
+        technology from each attacker to its target. The random draws are
+        uniform in [0,1), apart from selected_tech which is the technology
+        to attempt to spread. All state is read before any is written.
+
+        Returns:
+            (numpy Array): True for attacks which were made. Under uniform
+                attack, communities do not attack a neighbour in the same
+                polity, but do spread technology to it.
+            (numpy Array): True for successful attacks.
+        """
+        params = self.params
+        polity = self.polity
+        polity_traits = self.polity_traits
+        traits = self.ultrasocietal_traits
+        n_traits = self.ultrasocietal_trait_counts
+        elevation = self.elevation[targets]
+
+        attacking, defending = polity[attackers], polity[targets]
+        if params.attack_method == 'uniform':
+            made = attacking != defending
+        else:
+            made = np.ones(len(attackers), dtype=bool)
+
+        power_attacker = (polity_traits[attacking]
+                          * params.ultrasocietal_attack_coefficient + 1.)
+        power_defender = (polity_traits[defending]
+                          * params.ultrasocietal_attack_coefficient + 1.)
+        power_defender += np.where(
+            sea_attack, 0., params.elevation_defence_coefficient * elevation)
+        success = np.logical_and(
+            made,
+            (power_attacker - power_defender)
+            / (power_attacker + power_defender) > success_draw)
+
+        # Attempt ethnocide
+        ethnocide_gradient = ((params.ethnocide_max - params.ethnocide_min)
+                              / params.n_military_techs)
+        ethnocide = np.logical_and(
+            success,
+            params.ethnocide_min
+            + ethnocide_gradient * self.military_tech_counts[attackers]
+            - params.ethnocide_elevation_coefficient * elevation
+            > ethnocide_draw)
+
+        # Attempt to spread military technology
+        tech = np.left_shift(1, selected_tech)
+        techs = self.military_techs
+        spread = np.logical_and.reduce([
+            techs[attackers] & tech != 0, techs[targets] & tech == 0,
+            params.military_tech_spread_probability > spread_draw])
+
+        # Transfer defending communities to attacker's polity, replacing the
+        # traits of those subject to ethnocide with those of the attacker
+        captured, won, lost = (targets[success], attacking[success],
+                               defending[success])
+        old_traits = n_traits[captured]
+        new_traits = np.where(ethnocide[success], n_traits[attackers[success]],
+                              old_traits)
+        new_masks = np.where(ethnocide[success], traits[attackers[success]],
+                             traits[captured])
+        polity[captured] = won
+        np.add.at(self.polity_size, lost, -1)
+        np.add.at(self.polity_size, won, 1)
+        np.add.at(polity_traits, lost, -old_traits)
+        np.add.at(polity_traits, won, new_traits)
+        traits[captured] = new_masks
+        n_traits[captured] = new_traits
+
+        techs[targets[spread]] |= tech[spread]
+        self.military_tech_counts[targets[spread]] += 1
+        return made, success
+
+    def prune_empty_polities(self):
+        """
+        Polities are labels in an ArrayWorld, so empty polities need no
+        pruning. Present for compatibility with World.
+        """
+        pass
+
+    def step(self, attack_callback=None):
+        """
+        Conduct a simulation step
+
+        Args:
+            attack_callback (function, default=None): A callback function
+                invoked with the target's tile number for each attack made,
+                see attack. Used to record attack events.
+        """
+        # Attacks
+        self.attack(attack_callback)
+
+        # Cultural shift
+        self.cultural_shift()
+
+        # Disintegration
+        self.disintegration()
+
+        # Increment step counter
+        self.step_number += 1
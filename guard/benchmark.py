@@ -0,0 +1,291 @@
+"""
+Benchmarks of simulation throughput and scaling.
+
+Results are written as JSON so that they can be stored as a baseline and later
+runs compared against it, for example
+
+    python -m guard benchmark --output baseline.json
+    python -m guard benchmark --baseline baseline.json
+
+Each result records its value, unit and whether higher values are better.
+"""
+from . import analysis, generate_parameters, terrain
+from .mapfile import read_map
+from .world import World
+from datetime import datetime, timezone
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# The map used by default, from the data directory of the repository
+DEFAULT_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                           'data', 'old_world.yml')
+ENGINES = ('object', 'array')
+ATTACK_METHODS = ('uniform', 'entropy_maximisation')
+SCALING_SIZES = (10**4, 10**5, 10**6)
+
+# The format version of the results, changing it marks old results as
+# incomparable
+_FORMAT_VERSION = 1
+
+
+def run_benchmarks(map_file=DEFAULT_MAP, steps=100, repeat=3,
+                   scaling_sizes=SCALING_SIZES, scaling_steps=5,
+                   engines=ENGINES, seed=1):
+    """
+    Run the benchmark suite.
+
+    The suite measures
+        - world construction from the map file, with and without the
+          compiled map cache, and the construction of littoral neighbours,
+        - the steps per second of each engine and attack method on the map,
+        - the cost of sampling each accumulator after the steps above,
+        - world construction time and steps per second of each engine on
+          synthetic maps of increasing size.
+    Each measurement is the best of repeat runs.
+
+    Args:
+        map_file (str, default=DEFAULT_MAP): Path to the YAML world
+            definition.
+        steps (int, default=100): The number of steps to time on the map.
+        repeat (int, default=3): The number of times to repeat each
+            measurement.
+        scaling_sizes (sequence[int], default=SCALING_SIZES): The
+            approximate number of tiles of each synthetic map.
+        scaling_steps (int, default=5): The number of steps to time on each
+            synthetic map.
+        engines (sequence[str], default=ENGINES): The simulation engines to
+            benchmark.
+        seed (int, default=1): The seed of the simulations.
+
+    Returns:
+        (dict): The results under the key 'results', keyed by benchmark
+            name, and a description of the machine under the key 'metadata'.
+    """
+    results = {}
+    results.update(_construction(map_file, engines, repeat))
+    for engine in engines:
+        for attack_method in ATTACK_METHODS:
+            params = generate_parameters(attack_method=attack_method)
+            world = World.from_file(map_file, params, engine, seed)
+            name = 'step/{}/{}'.format(engine, attack_method)
+            results[name] = _result(
+                _steps_per_second(world, steps, repeat, seed), 'steps/s',
+                higher_is_better=True)
+        results.update(_sampling(map_file, engine, steps, repeat, seed))
+    for size in scaling_sizes:
+        results.update(_scaling(size, engines, scaling_steps, repeat, seed))
+    return {'version': _FORMAT_VERSION, 'metadata': _metadata(),
+            'results': results}
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare benchmark results against a baseline.
+
+    Args:
+        results (dict): The results of run_benchmarks.
+        baseline (dict): The baseline results of run_benchmarks.
+        tolerance (float, default=0.1): The fractional slow down beyond
+            which a benchmark is considered to have regressed.
+
+    Returns:
+        (dict): The speed up of each benchmark present in both the results
+            and baseline, keyed by name. Values greater than 1 are faster than
+            the baseline.
+        (list[str]): The names of the benchmarks which have regressed.
+
+    Raises:
+        (ValueError): Raised if the results are of different format versions.
+    """
+    if results.get('version') != baseline.get('version'):
+        raise ValueError('Results of different format versions cannot be '
+                         'compared')
+    speed_ups = {}
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        value, reference = result['value'], baseline['results'][name]['value']
+        if result['higher_is_better']:
+            speed_ups[name] = value / reference
+        else:
+            speed_ups[name] = reference / value
+    regressions = [name for name, speed_up in speed_ups.items()
+                   if speed_up < 1 - tolerance]
+    return speed_ups, regressions
+
+
+def save_results(results, path):
+    """
+    Write benchmark results to a JSON file.
+
+    Args:
+        results (dict): The results of run_benchmarks.
+        path (str): Path to the file to write.
+    """
+    with open(path, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """
+    Read benchmark results written by save_results.
+
+    Args:
+        path (str): Path to the results file.
+
+    Returns:
+        (dict): The results.
+    """
+    with open(path, 'r') as infile:
+        return json.load(infile)
+
+
+def _result(value, unit, higher_is_better=False):
+    """
+    A single benchmark result.
+    """
+    return {'value': value, 'unit': unit,
+            'higher_is_better': higher_is_better}
+
+
+def _best_time(function, repeat, number=1):
+    """
+    The shortest time per call of a function, in seconds, of repeat
+    measurements each of number calls.
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for call in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def _steps_per_second(world, steps, repeat, seed):
+    """
+    The best rate of stepping fresh copies of a world, so that each repeat
+    does the same work. Copying the world is not timed.
+    """
+    times = []
+    for i in range(repeat):
+        clone = world.fork(seed)
+        start = time.perf_counter()
+        for step in range(steps):
+            clone.step()
+        times.append(time.perf_counter() - start)
+    return steps / min(times)
+
+
+def _construction(map_file, engines, repeat):
+    """
+    Time world construction from a map file.
+    """
+    results = {}
+    results['construction/read_map/uncached'] = _result(
+        _best_time(lambda: read_map(map_file, cache=False), repeat), 's')
+    # Ensure the compiled map is cached before timing cached reads
+    read_map(map_file)
+    results['construction/read_map/cached'] = _result(
+        _best_time(lambda: read_map(map_file), repeat), 's')
+    for engine in engines:
+        results['construction/from_file/{}'.format(engine)] = _result(
+            _best_time(lambda: World.from_file(map_file, engine=engine),
+                       repeat), 's')
+
+    world = World.from_file(map_file)
+    results['construction/set_littoral_neighbours'] = _result(
+        _best_time(world.set_littoral_neighbours, repeat), 's')
+    return results
+
+
+def _sampling(map_file, engine, steps, repeat, seed):
+    """
+    Time sampling each accumulator after a number of steps.
+    """
+    world = World.from_file(map_file, engine=engine, seed=seed)
+    attack_events = analysis.AttackEvents(
+        world, analysis.imperial_density_date_ranges)
+    world.record_attacks(attack_events)
+    for step in range(steps):
+        world.step()
+    # Sample in an era which includes the current year
+    era = analysis.DateRange(world.year(), world.year() + 1)
+
+    # Sampling is fast, so time many samples per measurement
+    number = 100
+    results = {}
+    for cls in (analysis.ImperialDensity, analysis.PolitySizeDensity):
+        accumulator = cls(world, [era])
+        results['sample/{}/{}'.format(engine, cls.__name__)] = _result(
+            _best_time(accumulator.sample, repeat, number), 's')
+    attack_events = analysis.AttackEvents(world, [era])
+    results['sample/{}/AttackEvents'.format(engine)] = _result(
+        _best_time(lambda: attack_events.sample_attacks(world.attack_buffer),
+                   repeat, number), 's')
+    return results
+
+
+def _synthetic_map(total_tiles):
+    """
+    A square map of roughly total_tiles tiles, of agricultural land with a
+    strip of steppe along one edge and a channel of sea down the middle.
+    """
+    xdim = ydim = int(round(np.sqrt(total_tiles)))
+    terrains = np.full([ydim, xdim], terrain.all_terrains.index(
+        terrain.agriculture), dtype=int)
+    terrains[:, :max(1, xdim // 10)] = terrain.all_terrains.index(
+        terrain.steppe)
+    terrains[:, xdim // 2] = terrain.all_terrains.index(terrain.sea)
+    elevations = np.random.default_rng(0).uniform(0, 1000, xdim*ydim)
+    periods = np.zeros(xdim*ydim, dtype=int)
+    return xdim, ydim, terrains.flatten(), elevations, periods
+
+
+def _scaling(size, engines, steps, repeat, seed):
+    """
+    Time world construction and steps on a synthetic map.
+    """
+    xdim, ydim, terrains, elevations, periods = _synthetic_map(size)
+    results = {}
+    for engine in engines:
+        prefix = 'scaling/{}/{}'.format(engine, size)
+
+        def construct():
+            return World.from_arrays(xdim, ydim, terrains, elevations,
+                                     periods, engine=engine, seed=seed)
+        results[prefix+'/construction'] = _result(
+            _best_time(construct, repeat), 's')
+        world = construct()
+        results[prefix+'/step'] = _result(
+            _steps_per_second(world, steps, repeat, seed), 'steps/s',
+            higher_is_better=True)
+    return results
+
+
+def _metadata():
+    """
+    A description of the machine and code being benchmarked.
+    """
+    metadata = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'commit': None
+        }
+    try:
+        metadata['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return metadata
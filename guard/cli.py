@@ -0,0 +1,333 @@
+"""
+Command line interface for running batches of simulations.
+
+Usage:
+    python -m guard run config.yml [--output DIR] [--workers N] [--seed S]
+    python -m guard benchmark [--output FILE] [--baseline FILE]
+
+See guard.benchmark for the benchmark suite.
+
+The configuration is a YAML file, for example
+
+    map: old_world.yml
+    engine: object
+    parameters:
+      mutation_to_ultrasocietal: 0.0002
+    steps: 1500
+    replicas: 20
+    seed: 42
+    workers: 4
+    statistics: true
+    accumulators:
+      - ImperialDensity
+      - name: AttackEvents
+        date_ranges: [1500BC-500BC, 500BC-500AD, 500AD-1500AD]
+    output: results
+
+Only map is required. Paths in the configuration are relative to the
+configuration file.
+"""
+from . import analysis, benchmark, ensemble, generate_parameters
+from .daterange import (DateRange, InvalidDateRange,
+                        imperial_density_date_ranges)
+from .ensemble import run_ensemble
+from .mapfile import MissingYamlKey, InvalidYamlValue
+from .parameters import ParameterKeyException
+import argparse
+import json
+import numpy as np
+import os
+import sys
+import time
+
+# The configuration keys and their default values
+_DEFAULT_CONFIG = {
+    'map': None,
+    'engine': 'object',
+    'parameters': {},
+    'steps': 1500,
+    'replicas': 20,
+    'seed': None,
+    'workers': None,
+    'statistics': False,
+    'accumulators': ['ImperialDensity'],
+    'output': '.'
+    }
+
+
+class ConfigError(Exception):
+    """
+    Exception for an invalid run configuration.
+    """
+    pass
+
+
+def read_config(config_file):
+    """
+    Read and validate a run configuration file.
+
+    Args:
+        config_file (str): Path to the YAML configuration file.
+
+    Returns:
+        (dict): The configuration, with defaults filled in and the map and
+            output paths resolved relative to the configuration file.
+
+    Raises:
+        (ConfigError): Raised if the configuration is invalid.
+    """
+    import yaml
+
+    with open(config_file, 'r') as infile:
+        config = yaml.load(infile, Loader=yaml.FullLoader) or {}
+    if not isinstance(config, dict):
+        raise ConfigError('The configuration must be a mapping')
+
+    unknown = set(config) - set(_DEFAULT_CONFIG)
+    if unknown:
+        raise ConfigError('Unknown configuration keys: {}'.format(
+            ', '.join(sorted(unknown))))
+    if config.get('map') is None:
+        raise ConfigError('The configuration must name a map')
+    config = dict(_DEFAULT_CONFIG, **config)
+
+    if config['engine'] not in ('object', 'array'):
+        raise ConfigError("engine must be either 'object' or 'array'")
+
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    for key in ('map', 'output'):
+        config[key] = os.path.normpath(os.path.join(config_dir, config[key]))
+    return config
+
+
+def _accumulator_spec(accumulator):
+    """
+    Convert an accumulator entry of a configuration, either the name of an
+    accumulator class or a mapping of its name and date ranges, to the tuple
+    of accumulator class and date ranges used by run_ensemble, see
+    ensemble._accumulator_spec.
+    """
+    if isinstance(accumulator, dict):
+        if set(accumulator) - {'name', 'date_ranges'}:
+            raise ConfigError(
+                'Accumulators may only specify name and date_ranges')
+        accumulator = (accumulator.get('name'),
+                       accumulator.get('date_ranges'))
+    name, date_ranges = ensemble._accumulator_spec(accumulator)
+
+    cls = getattr(analysis, str(name), None)
+    if not (isinstance(cls, type) and issubclass(cls, analysis.AccumulatorBase)
+            and cls is not analysis.AccumulatorBase):
+        raise ConfigError('Unknown accumulator {}'.format(name))
+    if date_ranges is None:
+        # AttackEvents has no default date ranges
+        if cls is analysis.AttackEvents:
+            date_ranges = imperial_density_date_ranges
+        else:
+            return cls, None
+    return cls, [DateRange.from_string(str(era)) for era in date_ranges]
+
+
+def run(config):
+    """
+    Run the ensemble described by a configuration and write the results.
+
+    For each accumulator the ensemble mean is written to an accumulator file
+    named after the accumulator, for example imperial_density.dat. If
+    statistics are requested the AccumulatorStatistics are also written to
+    a .npz file, for example imperial_density_statistics.npz. Where several
+    accumulators share a name, for example the same class with different
+    date ranges, the second and later are numbered in the order they are
+    configured, for example imperial_density_2.dat. A summary of the run,
+    including its timing, is written to summary.json.
+
+    Args:
+        config (dict): The configuration, as returned by read_config.
+
+    Returns:
+        (dict): The run summary.
+
+    Raises:
+        (ConfigError): Raised if the configuration is invalid.
+    """
+    try:
+        params = generate_parameters(**(config['parameters'] or {}))
+    except ParameterKeyException as error:
+        raise ConfigError(error)
+    specs = [_accumulator_spec(accumulator)
+             for accumulator in config['accumulators']]
+
+    # Choose a seed if none is given so that the run can be reproduced
+    seed = config['seed']
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    start = time.perf_counter()
+    results = run_ensemble(config['map'], params, config['replicas'],
+                           config['steps'], specs, config['workers'], seed,
+                           statistics=config['statistics'],
+                           engine=config['engine'])
+    wall_time = time.perf_counter() - start
+
+    os.makedirs(config['output'], exist_ok=True)
+    files = []
+    names = _output_names(results, config['statistics'])
+    for result, name in zip(results, names):
+        if config['statistics']:
+            mean = result.mean()
+            path = os.path.join(config['output'],
+                                '{}_statistics.npz'.format(name))
+            result.dump(path)
+            files.append(path)
+        else:
+            mean = result
+        path = os.path.join(config['output'], '{}.dat'.format(name))
+        mean.dump(path)
+        files.append(path)
+
+    summary = {
+        'map': config['map'],
+        'engine': config['engine'],
+        'parameters': params._asdict(),
+        'steps': config['steps'],
+        'replicas': config['replicas'],
+        'seed': seed,
+        'workers': config['workers'] or os.cpu_count(),
+        'files': files,
+        'wall_time': wall_time,
+        'steps_per_second': config['steps'] * config['replicas'] / wall_time
+        }
+    with open(os.path.join(config['output'], 'summary.json'), 'w') as outfile:
+        json.dump(summary, outfile, indent=2)
+    return summary
+
+
+def _output_names(results, statistics):
+    """
+    The name of the output files of each result, the accumulator's prefix
+    numbered from the second occurrence onwards so that no two results
+    overwrite each other.
+    """
+    names = []
+    occurrences = {}
+    for result in results:
+        prefix = (result.accumulator_class if statistics else result)._prefix
+        occurrences[prefix] = occurrences.get(prefix, 0) + 1
+        if occurrences[prefix] == 1:
+            names.append(prefix)
+        else:
+            names.append('{}_{}'.format(prefix, occurrences[prefix]))
+    return names
+
+
+def main(argv=None):
+    """
+    The command line entry point.
+
+    Args:
+        argv (list[str], default=None): The command line arguments. If None
+            sys.argv is used.
+
+    Returns:
+        (int): The exit status.
+    """
+    parser = argparse.ArgumentParser(
+        prog='guard', description='Simulate imperial dynamics.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run', help='Run an ensemble of simulations described by a '
+        'configuration file.')
+    run_parser.add_argument('config', help='Path to the YAML configuration.')
+    run_parser.add_argument('--output', help='Directory to write results to, '
+                            'overriding the configuration.')
+    run_parser.add_argument('--workers', type=int, help='Number of worker '
+                            'processes, overriding the configuration.')
+    run_parser.add_argument('--seed', type=int, help='Ensemble seed, '
+                            'overriding the configuration.')
+
+    benchmark_parser = subparsers.add_parser(
+        'benchmark', help='Measure simulation throughput and scaling.')
+    benchmark_parser.add_argument('--map', default=benchmark.DEFAULT_MAP,
+                                  help='Path to the YAML world definition.')
+    benchmark_parser.add_argument('--steps', type=int, default=100,
+                                  help='Number of steps to time on the map.')
+    benchmark_parser.add_argument('--repeat', type=int, default=3,
+                                  help='Number of repeats of each '
+                                  'measurement.')
+    benchmark_parser.add_argument('--sizes', type=int, nargs='*',
+                                  default=benchmark.SCALING_SIZES,
+                                  help='Number of tiles of each synthetic '
+                                  'map.')
+    benchmark_parser.add_argument('--engines', nargs='+',
+                                  default=benchmark.ENGINES,
+                                  choices=benchmark.ENGINES,
+                                  help='Simulation engines to benchmark.')
+    benchmark_parser.add_argument('--output', help='Path to write the JSON '
+                                  'results to.')
+    benchmark_parser.add_argument('--baseline', help='Path to JSON results '
+                                  'to compare against.')
+    benchmark_parser.add_argument('--tolerance', type=float, default=0.1,
+                                  help='Fractional slow down counted as a '
+                                  'regression.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        return _main_run(args)
+    return _main_benchmark(args)
+
+
+def _main_run(args):
+    """
+    Run an ensemble, see main.
+    """
+    import yaml
+
+    try:
+        config = read_config(args.config)
+        for key in ('output', 'workers', 'seed'):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+        summary = run(config)
+    except (ConfigError, InvalidDateRange, MissingYamlKey, InvalidYamlValue,
+            OSError, yaml.YAMLError) as error:
+        print('guard: error: {}'.format(error), file=sys.stderr)
+        return 2
+
+    print('{} replicas of {} steps in {:.1f} s ({:.1f} steps per second), '
+          'results written to {}'.format(
+              summary['replicas'], summary['steps'], summary['wall_time'],
+              summary['steps_per_second'], config['output']))
+    return 0
+
+
+def _main_benchmark(args):
+    """
+    Run the benchmark suite, see main. The exit status is 1 if any benchmark
+    has regressed from the baseline.
+    """
+    try:
+        baseline = None
+        if args.baseline is not None:
+            baseline = benchmark.load_results(args.baseline)
+        results = benchmark.run_benchmarks(
+            args.map, args.steps, args.repeat, args.sizes,
+            engines=args.engines)
+        if args.output is not None:
+            benchmark.save_results(results, args.output)
+        speed_ups, regressions = {}, []
+        if baseline is not None:
+            speed_ups, regressions = benchmark.compare(results, baseline,
+                                                       args.tolerance)
+    except (ValueError, OSError) as error:
+        print('guard: error: {}'.format(error), file=sys.stderr)
+        return 2
+
+    for name, result in results['results'].items():
+        line = '{:<50} {:>12.4g} {:<8}'.format(name, result['value'],
+                                               result['unit'])
+        if name in speed_ups:
+            line += ' {:6.2f}x{}'.format(
+                speed_ups[name], ' REGRESSED' if name in regressions else '')
+        print(line)
+    return 1 if regressions else 0
@@ -2,9 +2,10 @@
 Community class.
 """
 from . import terrain, period
+from .rng import default_stream
+from bisect import bisect_right
 from collections import namedtuple
-from numpy.random import random, randint, choice
-import numpy as np
+from itertools import islice
 
 """
 Names of the four cardinal directions
@@ -31,57 +32,89 @@ class Community(object):
             communities with the terrain.agriculture terain. The default is
             period.agri, which means the community is agriculturally active
             from the begining of the simulation.
+        rng (RandomStream, default=rng.default_stream): The random number
+            stream used to seed military technologies.
 
     Attributes:
         terrain (Terrain): The terrain of the community.
         elevation (int): The communities elevation in kilometres.
-        ultrasocietal_traits (list[bool]): A vector of which ultrasocietal
+        ultrasocietal_trait_mask (int): A bitmask of which ultrasocietal
             traits the community possesses.
-        military_techs (list[bool]): A vector of which military technologies
+        ultrasocietal_traits (tuple[bool]): A vector of which ultrasocietal
+            traits the community possesses, unpacked from the bitmask.
+        military_tech_mask (int): A bitmask of which military technologies
             the community possesses.
+        military_techs (tuple[bool]): A vector of which military
+            technologies the community possesses, unpacked from the bitmask.
         position (tuple[int,int]): The position of the community on its map in
             the format (x,y).
+        tile_number (int): The position of the community in the tiles of its
+            world, None if it is not part of a world.
         neighbours (dict): The communities neighbours in the four cardinal
             directions.
         littoral (bool): True if the community is littoral, False otherwise.
         littoral_neighbours (list[LittoralNeighbour]): A list of all of the
-            communities littoral neighbours as LittoralNeighbour named tuples.
+            communities littoral neighbours as LittoralNeighbour named tuples,
+            sorted by distance.
+        littoral_distances (list[float]): The distances of the littoral
+            neighbours, in the same order.
         polity (Polity): The polity to which the community belongs.
 
     """
     def __init__(self, params, landscape=terrain.agriculture, elevation=0,
-                 active_from=period.agri1):
+                 active_from=period.agri1, rng=default_stream):
         self.terrain = landscape
         self.elevation = elevation
         self.period = active_from
 
-        self.ultrasocietal_traits = [False]*params.n_ultrasocietal_traits
+        self.polity = None
+
+        # Traits and technologies are held as integer bitmasks, with bit i set
+        # if the community possesses trait or technology i, and their totals
+        # are cached
+        self._n_ultrasocietal_traits = params.n_ultrasocietal_traits
+        self._n_military_techs = params.n_military_techs
+        self._ultrasocietal_trait_mask = 0
+        self._total_ultrasocietal_traits = 0
+        self.seed_military_techs(params, rng)
+
+        self.position = (None, None)
+        self.tile_number = None
+        self.neighbours = dict.fromkeys(DIRECTIONS)
+        self.littoral = False
+        self.littoral_neighbours = []
+        self.littoral_distances = []
+
+    def seed_military_techs(self, params, rng=default_stream):
+        """
+        Set the community's military technologies to their initial state.
+
+        Args:
+            params (Parameters): The set of simulation parameters to use.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream used to seed military technologies.
+
+        Raises:
+            (ValueError): Raised if params.military_technology_seed is not
+                one of 'steppes' or 'uniform'.
+        """
+        self.military_tech_mask = 0
         if params.military_technology_seed == 'steppes':
             # Steppe communities start with all military technologies
-            if landscape == terrain.steppe:
-                self.military_techs = [True]*params.n_military_techs
-            else:
-                self.military_techs = [False]*params.n_military_techs
+            if self.terrain == terrain.steppe:
+                self.military_tech_mask = _full_mask(params.n_military_techs)
         elif params.military_technology_seed == 'uniform':
             # 4.34% chance of starting with all military technologies In the
             # original simulation there are 115 steppes tiles out of 2647
             # polity supporting (steppe or agricultural) tiles making 4.34% of
             # the communities begining with all miliatry technologies
-            if random() < 0.0434:
-                if landscape in [terrain.steppe, terrain.agriculture]:
-                    self.military_techs = [True]*params.n_military_techs
-            else:
-                self.military_techs = [False]*params.n_military_techs
+            if rng.random() < 0.0434:
+                if self.terrain in [terrain.steppe, terrain.agriculture]:
+                    self.military_tech_mask = _full_mask(
+                        params.n_military_techs)
         else:
             raise ValueError('tech_seed must be one of "steppes" or "uniform"')
 
-        self.position = (None, None)
-        self.neighbours = dict.fromkeys(DIRECTIONS)
-        self.littoral = False
-        self.littoral_neighbours = []
-
-        self.polity = None
-
     def __str__(self):
         string = "Community:\n"
         string += "\tTerrain: {0}\n".format(self.terrain)
@@ -93,6 +126,114 @@ class Community(object):
 
         return string
 
+    @property
+    def ultrasocietal_trait_mask(self):
+        """
+        (int): A bitmask of which ultrasocietal traits the community
+            possesses, bit i is set if the community possesses trait i.
+            Assigning a new bitmask keeps the running trait totals of the
+            community and its polity up to date.
+        """
+        return self._ultrasocietal_trait_mask
+
+    @ultrasocietal_trait_mask.setter
+    def ultrasocietal_trait_mask(self, mask):
+        change = _popcount(mask) - self._total_ultrasocietal_traits
+        self._ultrasocietal_trait_mask = mask
+        self._change_total_ultrasocietal_traits(change)
+
+    @property
+    def ultrasocietal_traits(self):
+        """
+        (tuple[bool]): A vector of which ultrasocietal traits the community
+            possesses. This is unpacked from ultrasocietal_trait_mask, so is
+            immutable and must be replaced as a whole, or single traits
+            changed with toggle_ultrasocietal_trait.
+        """
+        return _unpack(self._ultrasocietal_trait_mask,
+                       self._n_ultrasocietal_traits)
+
+    @ultrasocietal_traits.setter
+    def ultrasocietal_traits(self, traits):
+        self.ultrasocietal_trait_mask = _pack(traits)
+
+    @property
+    def military_tech_mask(self):
+        """
+        (int): A bitmask of which military technologies the community
+            possesses, bit i is set if the community possesses technology i.
+        """
+        return self._military_tech_mask
+
+    @military_tech_mask.setter
+    def military_tech_mask(self, mask):
+        self._military_tech_mask = mask
+        self._total_military_techs = _popcount(mask)
+
+    @property
+    def military_techs(self):
+        """
+        (tuple[bool]): A vector of which military technologies the community
+            possesses. This is unpacked from military_tech_mask, so is
+            immutable and must be replaced as a whole, or single technologies
+            set in military_tech_mask.
+        """
+        return _unpack(self._military_tech_mask, self._n_military_techs)
+
+    @military_techs.setter
+    def military_techs(self, techs):
+        self.military_tech_mask = _pack(techs)
+
+    def has_ultrasocietal_trait(self, index):
+        """
+        Determine whether the community possesses an ultrasocietal trait.
+
+        Args:
+            index (int): The index of the trait.
+
+        Returns:
+            (bool): True if the community possesses the trait, False
+                otherwise.
+        """
+        return self._ultrasocietal_trait_mask >> index & 1 == 1
+
+    def toggle_ultrasocietal_trait(self, index):
+        """
+        Gain or lose a single ultrasocietal trait, keeping the running trait
+        totals up to date.
+
+        Args:
+            index (int): The index of the trait to toggle.
+        """
+        if self.has_ultrasocietal_trait(index):
+            change = -1
+        else:
+            change = 1
+        self._ultrasocietal_trait_mask ^= 1 << index
+        self._change_total_ultrasocietal_traits(change)
+
+    def copy_ultrasocietal_traits(self, other):
+        """
+        Replace the community's ultrasocietal traits with those of another,
+        keeping the running trait totals up to date.
+
+        Args:
+            other (Community): The community to copy traits from.
+        """
+        change = (other._total_ultrasocietal_traits
+                  - self._total_ultrasocietal_traits)
+        self._ultrasocietal_trait_mask = other._ultrasocietal_trait_mask
+        self._change_total_ultrasocietal_traits(change)
+
+    def _change_total_ultrasocietal_traits(self, change):
+        """
+        Update the running total of ultrasocietal traits, and that of the
+        community's polity, after a change to the traits bitmask.
+        """
+        self._total_ultrasocietal_traits += change
+        if self.polity is not None:
+            self.polity.change_total_ultrasocietal_traits(change)
+
     def total_ultrasocietal_traits(self):
         """
         Total number of ultrasocietal traits.
@@ -100,7 +241,7 @@ class Community(object):
         Returns:
             (int): The total number of ultrasocietal traits.
         """
-        return sum(self.ultrasocietal_traits)
+        return self._total_ultrasocietal_traits
 
     def total_military_techs(self):
         """
@@ -109,7 +250,7 @@ class Community(object):
         Returns:
             (int): The total number of military technologies.
         """
-        return sum(self.military_techs)
+        return self._total_military_techs
 
     def is_active(self, step_number):
         """
@@ -147,6 +288,33 @@ class Community(object):
         """
         self.polity = polity
 
+    def set_littoral_neighbours(self, littoral_neighbours):
+        """
+        Assign the community's littoral neighbours.
+
+        Args:
+            littoral_neighbours (list[LittoralNeighbour]): The littoral
+                neighbours of the community.
+        """
+        self.littoral_neighbours = sorted(
+            littoral_neighbours, key=lambda neighbour: neighbour.distance)
+        self.littoral_distances = [
+            neighbour.distance for neighbour in self.littoral_neighbours]
+
+    def littoral_neighbours_within(self, distance):
+        """
+        Count the littoral neighbours within a given distance. As the
+        littoral neighbours are sorted by distance, these are the first
+        entries of the littoral neighbours list.
+
+        Args:
+            distance (float): The threshold distance.
+
+        Returns:
+            (int): The number of littoral neighbours within range.
+        """
+        return bisect_right(self.littoral_distances, distance)
+
     def littoral_neighbours_in_range(self, distance):
         """
         Filter the littoral neighbours list to only include neighbours within a
@@ -159,8 +327,8 @@ class Community(object):
             (list[LittoralNeighbour]): A list of all littoral neighours within
                 range.
         """
-        return [neighbour for neighbour in self.littoral_neighbours
-                if neighbour.distance <= distance]
+        return self.littoral_neighbours[
+            :self.littoral_neighbours_within(distance)]
 
     def attack_power(self, params):
         """
@@ -244,7 +412,8 @@ class Community(object):
 
         return probability
 
-    def attack(self, target, params, sea_attack, probability=None):
+    def attack(self, target, params, sea_attack, probability=None,
+               rng=default_stream):
         """
         Conduct an attack.
 
@@ -254,20 +423,27 @@ class Community(object):
             sea_attack (bool): Whether the attack is made by sea.
             probability (float, default=None): Manually set the success
                 probability. If None this has no effect. Used for testing.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream.
+
+        Returns:
+            (bool): True if the attack was successful, False otherwise.
         """
         if probability is None:
             probability = self.success_probability(target, params, sea_attack)
         # Determine whether attack was successful
-        if probability > random():
+        if probability > rng.random():
             # Transfer defending community to attacker's polity
             self.polity.transfer_community(target)
 
             # Attempt ethnocide
-            if self.ethnocide_probability(target, params) > random():
-                target.ultrasocietal_traits[:] = self.ultrasocietal_traits
+            if self.ethnocide_probability(target, params) > rng.random():
+                target.copy_ultrasocietal_traits(self)
+            return True
+        return False
 
     def attempt_attack(self, params, step_number, sea_attack_distance,
-                       callback=None):
+                       callback=None, rng=default_stream, events=None):
         """
         Attempt to attack a random neighbour.
 
@@ -279,13 +455,17 @@ class Community(object):
             callback (function, default=None): A callback function to be
                 invoked when a successful attack is made. Currently used to
                 collect attack frequency.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream.
+            events (AttackBuffer, default=None): If not None, each attack
+                made is appended to the buffer.
         """
         sea_attack = False
         proceed = True
 
         # Check attack method
         if params.attack_method == 'uniform':
-            direction = choice(DIRECTIONS)
+            direction = rng.choice(DIRECTIONS)
             target = self.neighbours[direction]
 
             # Don't attack or spread technology to an empty neighbour
@@ -298,9 +478,10 @@ class Community(object):
                 if params.sea_attacks:
                     # Sea attack
                     # Find a littoral neighbour within range
-                    in_range = self.littoral_neighbours_in_range(
+                    in_range = self.littoral_neighbours_within(
                         sea_attack_distance)
-                    target = in_range[choice(len(in_range))].neighbour
+                    target = self.littoral_neighbours[
+                        rng.randint(in_range)].neighbour
                     sea_attack = True
                 else:
                     return
@@ -322,14 +503,19 @@ class Community(object):
         elif params.attack_method == 'entropy_maximisation':
             land_neighbours = [
                 neighbour for neighbour in self.neighbours.values()
+                if neighbour is not None
                 if neighbour.terrain.polity_forming
                 if neighbour.is_active(step_number)
                 if neighbour.polity is not self.polity
                 ]
             if params.sea_attacks:
+                # Neighbours in range are the first of the sorted littoral
+                # neighbours
                 sea_neighbours = [
                     littoral_neighbour.neighbour for littoral_neighbour
-                    in self.littoral_neighbours_in_range(sea_attack_distance)
+                    in islice(self.littoral_neighbours,
+                              self.littoral_neighbours_within(
+                                  sea_attack_distance))
                     ]
                 all_neighbours = land_neighbours + sea_neighbours
             else:
@@ -338,15 +524,10 @@ class Community(object):
             if len(all_neighbours) == 0:
                 return
 
-            neighbour_strengths = np.array(
-                [neighbour.attack_power(params)
-                 for neighbour in all_neighbours]
-                )
-
-            advantages = 1. / neighbour_strengths
-            probabilities = advantages / np.sum(advantages)
+            advantages = [1. / neighbour.attack_power(params)
+                          for neighbour in all_neighbours]
 
-            target_no = choice(range(len(all_neighbours)), p=probabilities)
+            target_no = rng.weighted_index(advantages)
             target = all_neighbours[target_no]
 
             if target_no > len(land_neighbours)-1:
@@ -357,32 +538,46 @@ class Community(object):
 
         # Conduct an attack if there is no reason not to
         if proceed:
-            self.attack(target, params, sea_attack=sea_attack)
+            success = self.attack(target, params, sea_attack=sea_attack,
+                                  rng=rng)
             if callback:
                 callback(target)
+            if events is not None:
+                events.append(step_number, self.tile_number,
+                              target.tile_number, success, sea_attack)
 
         # Attempt to diffuse military technology regardless of whether the
         # attack proceeded or was successful
-        self.diffuse_military_tech(target, params)
+        self.diffuse_military_tech(target, params, rng)
 
-    def cultural_shift(self, params):
+    def cultural_shift(self, params, rng=default_stream):
         """
         Local cultural shift (mutation of ultrasocietal traits vector).
 
         Args:
             params (Parameters): The simulation parameter set.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream.
         """
-        for index, trait in enumerate(self.ultrasocietal_traits):
-            if trait is False:
+        mask = self._ultrasocietal_trait_mask
+        change = 0
+        for index in range(self._n_ultrasocietal_traits):
+            trait = 1 << index
+            if not mask & trait:
                 # Chance to develop an ultrasocietal trait
-                if params.mutation_to_ultrasocietal > random():
-                    self.ultrasocietal_traits[index] = True
+                if params.mutation_to_ultrasocietal > rng.random():
+                    mask |= trait
+                    change += 1
             else:
                 # Chance to loose an ultrasocietal trait
-                if params.mutation_from_ultrasocietal > random():
-                    self.ultrasocietal_traits[index] = False
-
-    def diffuse_military_tech(self, target, params):
+                if params.mutation_from_ultrasocietal > rng.random():
+                    mask &= ~trait
+                    change -= 1
+        if change != 0:
+            self._ultrasocietal_trait_mask = mask
+            self._change_total_ultrasocietal_traits(change)
+
+    def diffuse_military_tech(self, target, params, rng=default_stream):
         """
         Attempt to spread military technology.
 
@@ -390,10 +585,47 @@ class Community(object):
             target (Community): The community to attempt to spread technology
                 to.
             params (Parameters): The simulation parameter set.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream.
         """
         # Select a tech to share
-        selected_tech = randint(params.n_military_techs)
-        if self.military_techs[selected_tech] is True:
-            if params.military_tech_spread_probability > random():
+        selected_tech = 1 << rng.randint(params.n_military_techs)
+        if self._military_tech_mask & selected_tech:
+            if params.military_tech_spread_probability > rng.random():
                 # Share this tech with the target
-                target.military_techs[selected_tech] = True
+                if not target._military_tech_mask & selected_tech:
+                    target._military_tech_mask |= selected_tech
+                    target._total_military_techs += 1
+
+
+def _full_mask(width):
+    """
+    A bitmask with the lowest width bits set.
+    """
+    return (1 << width) - 1
+
+
+def _popcount(mask):
+    """
+    The number of set bits in a bitmask.
+    """
+    return bin(mask).count('1')
+
+
+def _pack(flags):
+    """
+    Pack a vector of bools into a bitmask.
+    """
+    mask = 0
+    for index, flag in enumerate(flags):
+        if flag:
+            mask |= 1 << index
+    return mask
+
+
+def _unpack(mask, width):
+    """
+    Unpack a bitmask into a tuple of bools, at least width long.
+    """
+    width = max(width, mask.bit_length())
+    return tuple(mask >> index & 1 == 1 for index in range(width))
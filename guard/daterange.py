@@ -39,18 +39,28 @@ class DateRange(object):
 
         Returns:
             (DateRange): The DateRange object corresponding to the date string.
+
+        Raises:
+            (InvalidDateRange): Raised if the string is not of the format
+                "50BC-250AD", or does not create a valid range.
         """
         # Get dates in AD/BC format from string
         dates = string.split('-')
+        if len(dates) != 2:
+            raise InvalidDateRange(
+                'Invalid date range "{}"'.format(string))
 
         # Change into integer representation
         for i, date in enumerate(dates):
             if date == '0':
                 dates[i] = 0
-            elif date[-2:] == 'BC':
-                dates[i] = int(date[:-2])*-1
-            else:
+            elif date[-2:] in ('BC', 'AD') and date[:-2].isdigit():
                 dates[i] = int(date[:-2])
+                if date[-2:] == 'BC':
+                    dates[i] *= -1
+            else:
+                raise InvalidDateRange(
+                    'Invalid date range "{}"'.format(string))
 
         return cls(*dates)
 
@@ -0,0 +1,215 @@
+"""
+Running ensembles of independent simulations in parallel.
+"""
+from . import default_parameters
+from .analysis import ImperialDensity, AccumulatorStatistics
+from .arrayworld import ArrayWorld
+from .world import World
+from concurrent.futures import (ProcessPoolExecutor, wait,
+                                FIRST_COMPLETED)
+import contextlib
+import numpy as np
+import os
+import tempfile
+
+
+def run_ensemble(map_file, params=default_parameters, n_replicas=20,
+                 steps=1500, accumulators=(ImperialDensity,), workers=None,
+                 seed=None, statistics=False, quantile_edges=None,
+                 engine='object'):
+    """
+    Run an ensemble of independent simulations of a world and average the
+    data accumulated in each. Replicas are distributed over a pool of worker
+    processes and their results reduced as each finishes, so only a running
+    total, or running statistics, is held for each accumulator.
+
+    Each process builds the world once and each replica runs on a fork of
+    it, so the neighbour and littoral neighbour indices are not built again
+    for each replica. With the array engine the workers build their worlds
+    from the static arrays of this process's world, memory mapped from
+    temporary files, so the map and its indices are neither rebuilt nor
+    copied into each worker. With the object engine each worker builds its
+    world from the compiled map cache. Each fork is reset with a seed
+    spawned from a single numpy.random.SeedSequence, so replicas are
+    statistically independent and the ensemble is reproducible for a given
+    seed regardless of the number of workers.
+
+    Args:
+        map_file (str): Path to the YAML world definition, or a map compiled
+            by mapfile.compile_map.
+        params (Parameters, default=default_parameters): The simulation
+            parameters.
+        n_replicas (int, default=20): The number of simulations to run.
+        steps (int, default=1500): The number of steps in each simulation.
+        accumulators (list, default=(ImperialDensity,)): The accumulators to
+            record in each simulation. Each element is either an accumulator
+            class or a tuple of an accumulator class and the date ranges to
+            pass to it.
+        workers (int, default=None): The number of worker processes. If None
+            the number of CPUs is used. If 1 the replicas are run in this
+            process.
+        seed (int, default=None): The seed from which each replica's seed is
+            spawned. If None fresh entropy is used.
+        statistics (bool, default=False): Whether to return the streaming
+            statistics of each accumulator, rather than only its mean.
+        quantile_edges (sequence[float], default=None): The histogram bin
+            edges used to approximate quantiles, see AccumulatorStatistics.
+            Only used if statistics is True.
+        engine (str, default='object'): The simulation engine to use, either
+            'object' or 'array'.
+
+    Returns:
+        (list[AccumulatorBase]): The mean of each accumulator over the
+            ensemble, in the same order as accumulators. If statistics is
+            True a list of AccumulatorStatistics is returned instead.
+    """
+    specs = [_accumulator_spec(accumulator) for accumulator in accumulators]
+    seeds = np.random.SeedSequence(seed).spawn(n_replicas)
+    # The world from which replicas run in this process are forked, which
+    # also holds the accumulators' results
+    world = World.from_file(map_file, params, engine)
+
+    # Running totals of each accumulator's data
+    totals = [None] * len(specs)
+
+    if statistics:
+        totals = []
+        for cls, date_ranges in specs:
+            accumulator = _construct(cls, world, date_ranges)
+            totals.append(AccumulatorStatistics(
+                world, accumulator.date_ranges, cls, quantile_edges,
+                accumulator._attributes()))
+
+    def reduce(replica_data):
+        for index, data in enumerate(replica_data):
+            if statistics:
+                totals[index].add(data)
+            elif totals[index] is None:
+                totals[index] = data
+            else:
+                for era in totals[index]:
+                    totals[index][era] += data[era]
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers == 1:
+        for replica_seed in seeds:
+            reduce(_run_replica(world, steps, specs, replica_seed))
+    else:
+        with contextlib.ExitStack() as stack:
+            static_directory = None
+            if engine == 'array':
+                static_directory = stack.enter_context(
+                    tempfile.TemporaryDirectory())
+                world.save_static_arrays(static_directory)
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=workers, initializer=_initialise_worker,
+                initargs=(map_file, params, engine, static_directory)))
+            # Keep a bounded number of replicas in flight so that finished
+            # results are reduced, and released, promptly
+            replica_seeds = iter(seeds)
+            pending = set()
+            while True:
+                for replica_seed in replica_seeds:
+                    pending.add(executor.submit(_run_worker_replica, steps,
+                                                specs, replica_seed))
+                    if len(pending) >= 2*workers:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    reduce(future.result())
+
+    if statistics:
+        return totals
+
+    means = []
+    for (cls, date_ranges), total in zip(specs, totals):
+        accumulator = _construct(cls, world, date_ranges)
+        if total is not None:
+            accumulator.data = {era: total[era] / n_replicas
+                                for era in accumulator.date_ranges}
+        means.append(accumulator)
+    return means
+
+
+def _accumulator_spec(accumulator):
+    """
+    Normalise an accumulator specification to a tuple of the accumulator class
+    and its date ranges, which are None if the class default should be used.
+    """
+    if isinstance(accumulator, tuple):
+        cls, date_ranges = accumulator
+        return cls, date_ranges
+    return accumulator, None
+
+
+def _construct(cls, world, date_ranges):
+    """
+    Construct an accumulator, using the default date ranges if none are
+    given.
+    """
+    if date_ranges is None:
+        return cls(world)
+    return cls(world, date_ranges)
+
+
+# The world from which a worker process forks its replicas
+_worker_world = None
+
+
+def _initialise_worker(map_file, params, engine, static_directory=None):
+    """
+    Build the world of a worker process, from which its replicas are forked.
+    If static_directory is not None the world is an ArrayWorld built from
+    the static arrays in that directory, see ArrayWorld.from_static_arrays.
+    """
+    global _worker_world
+    if static_directory is None:
+        _worker_world = World.from_file(map_file, params, engine)
+    else:
+        _worker_world = ArrayWorld.from_static_arrays(static_directory,
+                                                      params)
+
+
+def _run_worker_replica(steps, specs, seed):
+    """
+    Run a single simulation in a worker process, see _run_replica.
+    """
+    return _run_replica(_worker_world, steps, specs, seed)
+
+
+def _run_replica(base_world, steps, specs, seed):
+    """
+    Run a single simulation on a fork of a world and return the data of each
+    accumulator.
+
+    Args:
+        base_world (World): The world at step 0, which is left unchanged.
+        steps (int): The number of steps to simulate.
+        specs (list[tuple]): The accumulator classes and date ranges.
+        seed (numpy.random.SeedSequence): The seed of this replica.
+
+    Returns:
+        (list[dict]): The accumulated data of each accumulator.
+    """
+    # Reset the fork with its seed so that its initial technologies, as well
+    # as its future, are drawn from the replica's own random number stream
+    world = base_world.fork()
+    world.reset(seed)
+    accumulators = [_construct(cls, world, date_ranges)
+                    for cls, date_ranges in specs]
+    step_samplers = []
+    for accumulator in accumulators:
+        if accumulator._samples_attacks:
+            world.record_attacks(accumulator)
+        else:
+            step_samplers.append(accumulator.sample)
+
+    for step in range(steps):
+        world.step()
+        for sample in step_samplers:
+            sample()
+
+    return [accumulator.data for accumulator in accumulators]
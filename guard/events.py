@@ -0,0 +1,114 @@
+"""
+Buffering of attack events.
+"""
+import numpy as np
+
+
+class AttackBuffer(object):
+    """
+    A buffer of attack events. Events are held as rows of a preallocated
+    integer array, which grows as needed and is reused once cleared, so that
+    recording events does not allocate new arrays every step.
+
+    Events may be added one at a time with append, which writes directly into
+    the array, or in bulk with extend.
+
+    Args:
+        capacity (int, default=4096): The number of events to allocate space
+            for initially.
+
+    Attributes:
+        records (numpy Array): The buffered events, one row per event with
+            the columns given by FIELDS.
+    """
+    # The columns of the records array. The step number of the attack, the
+    # tile numbers of the attacker and target, whether the attack was
+    # successful and whether it was made by sea.
+    FIELDS = ('step', 'attacker', 'target', 'success', 'sea')
+
+    def __init__(self, capacity=4096):
+        self._records = np.zeros([0, len(self.FIELDS)], dtype=np.int64)
+        self._size = 0
+        self._allocate(capacity)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def records(self):
+        return self._records[:self._size]
+
+    def field(self, name):
+        """
+        The values of one field of the buffered events.
+
+        Args:
+            name (str): The field, one of FIELDS.
+
+        Returns:
+            (numpy Array): The value of the field for each event.
+        """
+        return self.records[:, self.FIELDS.index(name)]
+
+    def extend(self, step, attackers, targets, success, sea):
+        """
+        Add events to the buffer.
+
+        Args:
+            step (int): The step number of the attacks.
+            attackers (sequence[int]): The tile number of each attacker.
+            targets (sequence[int]): The tile number of each target.
+            success (sequence[bool]): Whether each attack was successful.
+            sea (sequence[bool]): Whether each attack was made by sea.
+        """
+        n_events = len(attackers)
+        start, end = self._size, self._size + n_events
+        if end > len(self._records):
+            self._allocate(max(end, 2*len(self._records)))
+
+        self._records[start:end, 0] = step
+        self._records[start:end, 1] = attackers
+        self._records[start:end, 2] = targets
+        self._records[start:end, 3] = success
+        self._records[start:end, 4] = sea
+        self._size = end
+
+    def append(self, step, attacker, target, success, sea):
+        """
+        Add an event to the buffer.
+
+        Args:
+            step (int): The step number of the attack.
+            attacker (int): The tile number of the attacker.
+            target (int): The tile number of the target.
+            success (bool): Whether the attack was successful.
+            sea (bool): Whether the attack was made by sea.
+        """
+        if self._size == len(self._records):
+            self._allocate(2*len(self._records))
+
+        # Writing to a flat view of the records avoids creating NumPy scalars
+        start = self._size*len(self.FIELDS)
+        view = self._view
+        view[start] = step
+        view[start+1] = attacker
+        view[start+2] = target
+        view[start+3] = success
+        view[start+4] = sea
+        self._size += 1
+
+    def _allocate(self, capacity):
+        """
+        Allocate space for a number of events, keeping the buffered events.
+        """
+        records = np.zeros([max(capacity, 1), len(self.FIELDS)],
+                           dtype=np.int64)
+        records[:self._size] = self.records
+        self._records = records
+        self._view = memoryview(records).cast('B').cast('q')
+
+    def clear(self):
+        """
+        Empty the buffer, keeping its allocated space.
+        """
+        self._size = 0
@@ -0,0 +1,68 @@
+"""
+Littoral neighbour index construction.
+"""
+import numpy as np
+
+
+def littoral_index(xdim, ydim, littoral, max_distance):
+    """
+    Build an index of the littoral neighbours of each tile in compressed
+    sparse row form. Littoral tiles are neighbours of all other littoral tiles
+    within max_distance, and of themselves at distance 0.
+
+    Rather than comparing every pair of littoral tiles, each littoral tile is
+    only compared with the tiles at the grid offsets within max_distance of
+    it.
+
+    Args:
+        xdim (int): The x dimension of the world in communities.
+        ydim (int): The y dimension of the world in communities.
+        littoral (list[bool]): Whether each tile is littoral, in the same
+            order as World.tiles.
+        max_distance (float): The greatest distance of a neighbour to include.
+
+    Returns:
+        (tuple): A tuple (offsets, targets, squared_distances) of numpy arrays.
+            The littoral neighbours of tile i are targets[offsets[i]:
+            offsets[i+1]] at the squared distances squared_distances[
+            offsets[i]:offsets[i+1]], sorted by distance.
+    """
+    littoral = np.asarray(littoral, dtype=bool)
+    total_tiles = xdim*ydim
+
+    # Grid offsets within range, ordered by distance
+    reach = int(np.floor(max_distance))
+    dx, dy = np.meshgrid(np.arange(-reach, reach+1),
+                         np.arange(-reach, reach+1), indexing='ij')
+    dx, dy = dx.ravel(), dy.ravel()
+    squared = dx**2 + dy**2
+    within = np.sqrt(squared) <= max_distance
+    order = np.argsort(squared[within], kind='stable')
+    dx, dy, squared = dx[within][order], dy[within][order], \
+        squared[within][order]
+
+    tiles = np.flatnonzero(littoral)
+    x, y = tiles % xdim, tiles // xdim
+
+    sources, targets, distances = [], [], []
+    for offset_x, offset_y, offset_squared in zip(dx, dy, squared):
+        target_x = x + offset_x
+        target_y = y + offset_y
+        on_map = np.logical_and.reduce([target_x >= 0, target_x < xdim,
+                                        target_y >= 0, target_y < ydim])
+        target = np.where(on_map, target_x + target_y*xdim, 0)
+        found = np.logical_and(on_map, littoral[target])
+        sources.append(tiles[found])
+        targets.append(target[found])
+        distances.append(np.full(np.count_nonzero(found), offset_squared))
+
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    distances = np.concatenate(distances)
+
+    # Group by source tile, a stable sort preserves the distance order
+    order = np.argsort(sources, kind='stable')
+    counts = np.bincount(sources, minlength=total_tiles)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    return offsets, targets[order], distances[order]
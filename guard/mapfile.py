@@ -0,0 +1,247 @@
+"""
+Reading world definition files, and compiling them to a binary format which
+is cached to avoid parsing YAML.
+"""
+from . import terrain, period
+import hashlib
+import numpy as np
+import os
+
+# Version of the compiled map format, changing it invalidates cached maps
+_FORMAT_VERSION = 1
+
+
+def read_map(map_file, cache=True):
+    """
+    Read a world definition. YAML definitions are compiled to the binary map
+    format on first reading and cached, keyed by a hash of the file's
+    contents, so later reads of an unchanged file load the compiled map
+    rather than parsing the YAML again.
+
+    The cache directory is set by the environment variable GUARD_CACHE_DIR
+    and defaults to ~/.cache/guard. If the cache cannot be written the map is
+    still read.
+
+    Args:
+        map_file (str): Path to a YAML world definition or a compiled map
+            written by compile_map (which must have the extension .npz).
+        cache (bool, default=True): Whether to use the cache for YAML
+            definitions.
+
+    Returns:
+        (tuple): The x and y dimensions of the world, and the terrain code,
+            elevation and agricultural period code of each tile as numpy
+            Arrays, ordered in the same way as World.tiles.
+
+    Raises:
+        (MissingYamlKey): Raised if a required key is not present in the
+            YAML file, including if a tile has no community.
+        (InvalidYamlValue): Raised if the terrain or agricultural period
+            of a community is not recognised, or its position is outside
+            of the map.
+    """
+    if map_file.endswith('.npz'):
+        return _load_compiled_map(map_file)
+    if not cache:
+        return _read_yaml_map(map_file)
+
+    with open(map_file, 'rb') as infile:
+        source_hash = hashlib.sha256(infile.read()).hexdigest()
+    cache_file = os.path.join(
+        _cache_dir(), '{}-v{}.npz'.format(source_hash, _FORMAT_VERSION))
+    if os.path.isfile(cache_file):
+        try:
+            return _load_compiled_map(cache_file)
+        except (OSError, ValueError, KeyError):
+            # Fall back to the YAML file if the cached map is unreadable
+            pass
+
+    world_map = _read_yaml_map(map_file)
+    try:
+        os.makedirs(_cache_dir(), exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never
+        # see a partial map
+        temporary_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        _save_compiled_map(temporary_file, world_map, source_hash)
+        os.replace(temporary_file, cache_file)
+    except OSError:
+        pass
+    return world_map
+
+
+def compile_map(yaml_file, outfile):
+    """
+    Convert a YAML world definition to the binary map format, a NumPy .npz
+    file of the world's dimensions and the terrain, elevation and
+    agricultural period of each tile.
+
+    Args:
+        yaml_file (str): Path to the YAML world definition.
+        outfile (str): Path to the file to write, which should have the
+            extension .npz.
+
+    Raises:
+        (MissingYamlKey): Raised if a required key is not present in the
+            YAML file, including if a tile has no community.
+        (InvalidYamlValue): Raised if the terrain or agricultural period
+            of a community is not recognised, or its position is outside
+            of the map.
+    """
+    with open(yaml_file, 'rb') as infile:
+        source_hash = hashlib.sha256(infile.read()).hexdigest()
+    _save_compiled_map(outfile, _read_yaml_map(yaml_file), source_hash)
+
+
+def _cache_dir():
+    """
+    The directory compiled maps are cached in.
+    """
+    return os.environ.get(
+        'GUARD_CACHE_DIR',
+        os.path.join(os.path.expanduser('~'), '.cache', 'guard'))
+
+
+def _save_compiled_map(path, world_map, source_hash):
+    """
+    Write a map to the binary map format.
+    """
+    xdim, ydim, terrains, elevations, periods = world_map
+    # Save to an open file so that NumPy does not append a suffix to the path
+    with open(path, 'wb') as outfile:
+        np.savez(outfile, version=_FORMAT_VERSION, xdim=xdim, ydim=ydim,
+                 terrain=np.asarray(terrains, dtype=np.int8),
+                 elevation=np.asarray(elevations, dtype=float),
+                 period=np.asarray(periods, dtype=np.int8),
+                 source_hash=source_hash)
+
+
+def _load_compiled_map(path):
+    """
+    Read a map in the binary map format.
+    """
+    with np.load(path) as compiled:
+        if int(compiled['version']) != _FORMAT_VERSION:
+            raise ValueError(
+                'Compiled map "{}" has format version {}, expected {}'.format(
+                    path, int(compiled['version']), _FORMAT_VERSION))
+        return (int(compiled['xdim']), int(compiled['ydim']),
+                compiled['terrain'], compiled['elevation'],
+                compiled['period'])
+
+
+# Integer codes of the terrain and agricultural period names used in YAML
+# world definitions
+_TERRAIN_CODES = {
+    'agriculture': terrain.all_terrains.index(terrain.agriculture),
+    'steppe': terrain.all_terrains.index(terrain.steppe),
+    'desert': terrain.all_terrains.index(terrain.desert),
+    'sea': terrain.all_terrains.index(terrain.sea)
+    }
+_PERIOD_CODES = {
+    'agri1': period.all_periods.index(period.agri1),
+    'agri2': period.all_periods.index(period.agri2),
+    'agri3': period.all_periods.index(period.agri3)
+    }
+
+
+def _read_yaml_map(yaml_file):
+    """
+    Parse a YAML world definition into per tile lists of terrain code,
+    elevation and agricultural period code, ordered in the same way as
+    World.tiles.
+    """
+    # yaml is only imported when a map is not read from the cache
+    import yaml
+
+    # Parse YAML file
+    with open(yaml_file, 'r') as infile:
+        world_data = yaml.load(infile, Loader=yaml.FullLoader)
+    try:
+        xdim = world_data['xdim']
+    except KeyError:
+        raise MissingYamlKey('xdim', yaml_file)
+    try:
+        ydim = world_data['ydim']
+    except KeyError:
+        raise MissingYamlKey('ydim', yaml_file)
+
+    # Determine total number of tiles and assign lists
+    total_communities = xdim*ydim
+    terrains = [None]*total_communities
+    elevations = [0]*total_communities
+    periods = [_PERIOD_CODES['agri1']]*total_communities
+
+    # Enter world data into tiles lists
+    try:
+        community_data = world_data['communities']
+    except KeyError:
+        raise MissingYamlKey('communities', yaml_file)
+    for community in community_data:
+        x = _community_value(community, 'x', yaml_file)
+        y = _community_value(community, 'y', yaml_file)
+        if not 0 <= x < xdim:
+            raise InvalidYamlValue('x', x, yaml_file)
+        if not 0 <= y < ydim:
+            raise InvalidYamlValue('y', y, yaml_file)
+        index = x + y*xdim
+
+        landscape = _community_value(community, 'terrain', yaml_file)
+        if landscape not in _TERRAIN_CODES:
+            raise InvalidYamlValue('terrain', landscape, yaml_file)
+        landscape = _TERRAIN_CODES[landscape]
+        terrains[index] = landscape
+
+        if terrain.all_terrains[landscape].polity_forming:
+            elevations[index] = _community_value(
+                community, 'elevation', yaml_file) / 1000.
+            agricultural_period = _community_value(community, 'activeFrom',
+                                                   yaml_file)
+            if agricultural_period not in _PERIOD_CODES:
+                raise InvalidYamlValue('activeFrom', agricultural_period,
+                                       yaml_file)
+            periods[index] = _PERIOD_CODES[agricultural_period]
+
+    # Every tile must be defined
+    if None in terrains:
+        index = terrains.index(None)
+        raise MissingYamlKey(
+            'communities (x: {}, y: {})'.format(index % xdim, index // xdim),
+            yaml_file)
+
+    return xdim, ydim, terrains, elevations, periods
+
+
+def _community_value(community, key, yaml_file):
+    """
+    Get the value of a key of a community in a YAML world definition.
+
+    Raises:
+        (MissingYamlKey): Raised if the community does not have the key.
+    """
+    try:
+        return community[key]
+    except KeyError:
+        raise MissingYamlKey('communities: ' + key, yaml_file)
+
+
+class MissingYamlKey(Exception):
+    """
+    Exception raised when a necessary key is missing from the world YAML file.
+    """
+    def __init__(self, key, filename):
+        super().__init__(
+            'Required key "{}" missing from the world definition'
+            ' file "{}".'.format(key, filename)
+            )
+
+
+class InvalidYamlValue(Exception):
+    """
+    Exception raised when a key of the world YAML file has an unrecognised
+    value.
+    """
+    def __init__(self, key, value, filename):
+        super().__init__(
+            'Invalid value "{}" of key "{}" in the world definition'
+            ' file "{}".'.format(value, key, filename)
+            )
@@ -41,3 +41,9 @@ agri2 = Period(900)
 Agricultural from 700CE
 """
 agri3 = Period(1100)
+
+"""
+All agricultural periods. The position of a period in this tuple is its integer
+code in array representations of the map.
+"""
+all_periods = (agri1, agri2, agri3)
@@ -1,6 +1,7 @@
 """
 Polity Module.
 """
+from .rng import default_stream
 
 
 class Polity(object):
@@ -14,11 +15,20 @@ class Polity(object):
     Attributes:
         communities (list[Community]): A list of communities which belong to
             the polity.
+
+    Notes:
+        The total number of ultrasocietal traits of the polity's communities
+        is kept as a running total, updated as communities join and leave the
+        polity and as their traits change, so that the attack power and mean
+        traits of a polity do not depend on its size to calculate.
     """
     def __init__(self, communities):
         self.communities = communities
+        self._total_ultrasocietal_traits = 0
         for community in communities:
             community.assign_to_polity(self)
+            self._total_ultrasocietal_traits += (
+                community.total_ultrasocietal_traits())
 
     def __str__(self):
         string = "Polity:\n"
@@ -46,6 +56,8 @@ class Polity(object):
         """
         community.assign_to_polity(self)
         self.communities.append(community)
+        self._total_ultrasocietal_traits += (
+            community.total_ultrasocietal_traits())
 
     def remove_community(self, community):
         """
@@ -56,6 +68,8 @@ class Polity(object):
         """
         community.assign_to_polity(None)
         self.communities.remove(community)
+        self._total_ultrasocietal_traits -= (
+            community.total_ultrasocietal_traits())
 
     def transfer_community(self, community):
         """
@@ -77,6 +91,7 @@ class Polity(object):
         """
         new_polities = [Polity([tile]) for tile in self.communities]
         self.communities = []
+        self._total_ultrasocietal_traits = 0
         return new_polities
 
     def size(self):
@@ -88,6 +103,26 @@ class Polity(object):
         """
         return len(self.communities)
 
+    def total_ultrasocietal_traits(self):
+        """
+        Total number of ultrasocietal traits of the communities of this
+        polity.
+
+        Returns:
+            (int): The total number of ultrasocietal traits.
+        """
+        return self._total_ultrasocietal_traits
+
+    def change_total_ultrasocietal_traits(self, change):
+        """
+        Update the running total of ultrasocietal traits when the traits of a
+        member community change.
+
+        Args:
+            change (int): The change in the number of ultrasocietal traits.
+        """
+        self._total_ultrasocietal_traits += change
+
     def mean_ultrasocietal_traits(self):
         """
         Calculate the mean number of ultrasocietal traits of the communities of
@@ -96,10 +131,7 @@ class Polity(object):
         Returns:
             (float): The number number of ultrasocietal traits.
         """
-        return sum(
-            [community.total_ultrasocietal_traits()
-             for community in self.communities]
-            ) / self.size()
+        return self._total_ultrasocietal_traits / self.size()
 
     def attack_power(self, params):
         """
@@ -117,8 +149,7 @@ class Polity(object):
             Here the size of the polity is omitted in the mean and
             multiplication to save calculation time.
         """
-        power = sum([community.total_ultrasocietal_traits()
-                     for community in self.communities])
+        power = self._total_ultrasocietal_traits
         power *= params.ultrasocietal_attack_coefficient
         power += 1.
         return power
@@ -141,12 +172,14 @@ class Polity(object):
         else:
             return min(params.disintegration_base + probability, 1)
 
-    def cultural_shift(self, params):
+    def cultural_shift(self, params, rng=default_stream):
         """
         Attempt cultural shift on all communities.
 
         Args:
             params (Parameters): The simulation parameter set.
+            rng (RandomStream, default=rng.default_stream): The random number
+                stream.
         """
         for community in self.communities:
-            community.cultural_shift(params)
+            community.cultural_shift(params, rng)
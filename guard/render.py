@@ -0,0 +1,250 @@
+"""
+Rendering map images in parallel.
+"""
+from .analysis import map_rgba, _colour_map
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+import os
+
+
+def render_eras(accumulator, outdir='.', image_format='png', workers=None,
+                **options):
+    """
+    Render the map of every era of an accumulator, or correlator, to image
+    files in parallel. The maps match those drawn by AccumulatorBase.plot or
+    CorrelateBase.plot_heatmap.
+
+    Args:
+        accumulator (AccumulatorBase or CorrelateBase): The data to render.
+        outdir (str, default='.'): The directory to write images to.
+        image_format (str, default='png'): The image file format.
+        workers (int, default=None): The number of worker processes. If None
+            the number of CPUs is used. If 1 the images are drawn in this
+            process.
+        **options: Passed to the _map_data method of accumulator with each
+            era. These are the options of AccumulatorBase.plot, or of
+            CorrelateBase.plot_heatmap, other than the era, for example area
+            and highlight.
+
+    Returns:
+        (list[str]): The path of the image of each era, in the order of
+            accumulator.date_ranges.
+    """
+    paths = []
+    with _FramePool(workers) as pool:
+        for era in accumulator.date_ranges:
+            plot_data, vmin, vmax = accumulator._map_data(era, **options)
+            path = os.path.join(outdir, '{}_{}.{}'.format(
+                accumulator._prefix, era, image_format))
+            pool.submit(plot_data, vmin, vmax, path)
+            paths.append(path)
+    return paths
+
+
+class StepRenderer(object):
+    """
+    Render maps of the state of a world as a simulation runs, as PNG frames
+    and optionally an animation. Call sample after each step, as with an
+    accumulator, and close once the simulation is finished. Frames are drawn
+    by a pool of worker processes while the simulation continues.
+
+    Args:
+        world (World): The world to render.
+        field (str, default='military_techs'): The field to render, one of
+            analysis.MAP_FIELDS.
+        every (int, default=1): Render a frame every this many steps.
+        outdir (str, default='.'): The directory to write frames to.
+        workers (int, default=None): The number of worker processes. If None
+            the number of CPUs is used. If 1 frames are drawn in this
+            process.
+        animation (str, default=None): Path to an animation file to assemble
+            from the frames when the renderer is closed. The format is
+            determined by the extension, for example .gif, .png or .webp. If
+            None no animation is made.
+        fps (float, default=10): The frame rate of the animation.
+        highligt_desert (bool, default=False): Highlight desert tiles on the
+            map.
+        highligt_steppe (bool, default=False): Highlight steppe tiles on the
+            map.
+
+    Attributes:
+        paths (list[str]): The path of each frame rendered.
+    """
+    def __init__(self, world, field='military_techs', every=1, outdir='.',
+                 workers=None, animation=None, fps=10, highlight_desert=False,
+                 highlight_steppe=False):
+        # Check the field before starting the worker processes
+        map_rgba(world, field)
+
+        self.world = world
+        self.field = field
+        self.every = every
+        self.outdir = outdir
+        self.animation = animation
+        self.fps = fps
+        self.highlight_desert = highlight_desert
+        self.highlight_steppe = highlight_steppe
+        self.paths = []
+        self._pool = _FramePool(workers)
+
+    def sample(self):
+        """
+        Render the current state of the world, if the step number is a
+        multiple of every.
+        """
+        if self.world.step_number % self.every != 0:
+            return
+        plot_data = map_rgba(self.world, self.field, self.highlight_desert,
+                             self.highlight_steppe)
+        path = os.path.join(self.outdir, '{}_{:04d}.png'.format(
+            self.field, self.world.step_number))
+        self._pool.submit(plot_data, 0, 1, path)
+        self.paths.append(path)
+
+    def close(self):
+        """
+        Wait for every frame to be drawn, stop the worker processes and write
+        the animation if one was requested.
+        """
+        self._pool.close()
+        if self.animation is not None and self.paths:
+            write_animation(self.paths, self.animation, self.fps)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.close()
+
+
+def write_animation(frames, outfile, fps=10):
+    """
+    Assemble image files into an animation.
+
+    Args:
+        frames (list[str]): The paths of the frames, in order.
+        outfile (str): Path to the animation file to write. The format is
+            determined by the extension, for example .gif, .png or .webp.
+        fps (float, default=10): The frame rate.
+    """
+    # Pillow is a dependency of matplotlib
+    from PIL import Image
+
+    def images():
+        for path in frames:
+            with Image.open(path) as image:
+                image.load()
+                yield image
+
+    images = images()
+    first = next(images)
+    first.save(outfile, save_all=True, append_images=images,
+               duration=1000/fps, loop=0)
+
+
+class _FramePool(object):
+    """
+    Draws frames, in a pool of worker processes unless there is only one
+    worker. A bounded number of frames are in flight at once so that pending
+    frame data does not accumulate.
+    """
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = os.cpu_count()
+        self._workers = workers
+        self._pending = set()
+        if workers == 1:
+            self._executor = None
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, plot_data, vmin, vmax, path):
+        """
+        Draw a frame, see _draw_frame.
+        """
+        if self._executor is None:
+            _draw_frame(plot_data, vmin, vmax, path)
+            return
+
+        self._pending.add(self._executor.submit(_draw_frame, plot_data, vmin,
+                                                vmax, path))
+        if len(self._pending) >= 2*self._workers:
+            done, self._pending = wait(self._pending,
+                                       return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+
+    def close(self):
+        """
+        Wait for all frames to be drawn and stop the worker processes.
+        """
+        if self._executor is None:
+            return
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._pending = set()
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Canvas(object):
+    """
+    A map figure drawn with the non-interactive Agg backend. The figure is
+    not registered with pyplot, so it does not need to be closed and is freed
+    with the canvas.
+    """
+    def __init__(self, plot_data, vmin, vmax):
+        self.shape = plot_data.shape
+        self.figure = Figure()
+        FigureCanvasAgg(self.figure)
+        ax = self.figure.subplots()
+
+        # Hide axes ticks
+        ax.get_xaxis().set_visible(False)
+        ax.get_yaxis().set_visible(False)
+
+        self.image = ax.imshow(np.rot90(plot_data), cmap=_colour_map(),
+                               vmin=vmin, vmax=vmax)
+        self.figure.colorbar(self.image)
+
+    def draw(self, plot_data, vmin, vmax, path):
+        """
+        Replace the image data and colour bar range and save the figure.
+        """
+        self.image.set_data(np.rot90(plot_data))
+        self.image.set_clim(vmin, vmax)
+        self.figure.savefig(path)
+
+
+# The canvas reused for every frame drawn by this process
+_canvas = None
+
+
+def _draw_frame(plot_data, vmin, vmax, path):
+    """
+    Draw a map and save it to a file, reusing this process's canvas while the
+    map size is unchanged.
+
+    Args:
+        plot_data (numpy Array): The RGBA colour of each tile.
+        vmin (float): The minimum of the colour bar.
+        vmax (float): The maximum of the colour bar.
+        path (str): The path of the image file to write.
+    """
+    global _canvas
+    if _canvas is None or _canvas.shape != plot_data.shape:
+        _canvas = _Canvas(plot_data, vmin, vmax)
+    _canvas.draw(plot_data, vmin, vmax, path)
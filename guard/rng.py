@@ -0,0 +1,200 @@
+"""
+Random number streams.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+from operator import length_hint
+import numpy as np
+
+# Number of uniform random numbers drawn at a time
+_BUFFER_SIZE = 2**16
+
+
+class RandomStream(object):
+    """
+    A seedable source of random numbers for the simulation. Scalar random
+    numbers are handed out from buffers drawn in bulk from a
+    numpy.random.Generator, avoiding the overhead of drawing them one at a
+    time. Vectorised code may draw from the generator directly.
+
+    Args:
+        seed (int, default=None): The seed, or anything else accepted by
+            numpy.random.default_rng. If None the stream is seeded from fresh
+            entropy.
+        buffer_size (int, default=65536): The number of uniform random numbers
+            to draw at a time.
+
+    Attributes:
+        generator (numpy.random.Generator): The underlying generator.
+    """
+    def __init__(self, seed=None, buffer_size=_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Reseed the stream, discarding any buffered random numbers.
+
+        Args:
+            seed (int, default=None): The seed, or anything else accepted by
+                numpy.random.default_rng. If None the stream is seeded from
+                fresh entropy.
+        """
+        self.generator = np.random.default_rng(seed)
+        self._buffer = iter(())
+        # The bit generator state before the buffer was drawn, and the length
+        # of the buffer, from which the buffer can be drawn again
+        self._buffer_state = None
+        self._buffer_length = 0
+
+    def get_state(self):
+        """
+        Get the state of the stream, from which it can be restored to produce
+        the same sequence of random numbers.
+
+        Returns:
+            (dict): The state of the underlying bit generator, under the key
+                'generator', and the buffer, from which it is drawn again
+                when the state is restored. The state of the bit generator
+                before the buffer was drawn is under the key 'buffer_state',
+                None if no buffer has been drawn, the length of the buffer
+                under the key 'buffer_length' and the number of random numbers
+                already taken from it under the key 'buffer_position'.
+        """
+        return {'generator': self.generator.bit_generator.state,
+                'buffer_state': self._buffer_state,
+                'buffer_length': self._buffer_length,
+                'buffer_position': (self._buffer_length
+                                    - length_hint(self._buffer))}
+
+    def set_state(self, state):
+        """
+        Restore the state of the stream.
+
+        Args:
+            state (dict): A state returned by get_state.
+        """
+        self._buffer_state = state['buffer_state']
+        self._buffer_length = state['buffer_length']
+        if self._buffer_state is None:
+            self._buffer = iter(())
+        else:
+            self.generator.bit_generator.state = self._buffer_state
+            buffer = self.generator.random(self._buffer_length).tolist()
+            self._buffer = iter(buffer[state['buffer_position']:])
+        self.generator.bit_generator.state = state['generator']
+
+    def copy(self):
+        """
+        Copy the stream.
+
+        Returns:
+            (RandomStream): An independent stream in the same state, which
+                will produce the same sequence of random numbers.
+        """
+        stream = RandomStream(buffer_size=self.buffer_size)
+        stream.set_state(self.get_state())
+        return stream
+
+    def _refill(self):
+        """
+        Draw a new buffer of uniform random numbers.
+        """
+        self._buffer_state = self.generator.bit_generator.state
+        self._buffer_length = self.buffer_size
+        self._buffer = iter(self.generator.random(self.buffer_size).tolist())
+
+    def random(self):
+        """
+        Draw a uniform random number.
+
+        Returns:
+            (float): A random number in the range [0,1).
+        """
+        try:
+            return next(self._buffer)
+        except StopIteration:
+            self._refill()
+            return next(self._buffer)
+
+    def randint(self, high):
+        """
+        Draw a random integer.
+
+        Args:
+            high (int): The upper bound (exclusive).
+
+        Returns:
+            (int): A random integer in the range [0,high).
+        """
+        return int(self.random()*high)
+
+    def choice(self, sequence):
+        """
+        Choose a random element of a sequence with uniform probability.
+
+        Args:
+            sequence (sequence): The sequence to choose from.
+
+        Returns:
+            The chosen element.
+        """
+        return sequence[self.randint(len(sequence))]
+
+    def weighted_index(self, weights):
+        """
+        Choose a random index with probability proportional to a weight.
+
+        Args:
+            weights (list[float]): The non-negative weight of each index.
+
+        Returns:
+            (int): The chosen index.
+        """
+        cumulative = list(accumulate(weights))
+        index = bisect_right(cumulative, self.random()*cumulative[-1])
+        # Guard against rounding selecting past the final index
+        return min(index, len(cumulative)-1)
+
+    def bernoulli_positions(self, n, probability):
+        """
+        Sample which of a sequence of independent trials succeed. Rather than
+        drawing a random number for every trial, the number of successes is
+        drawn from a binomial distribution and their positions chosen
+        uniformly, so the cost scales with the number of successes.
+
+        Args:
+            n (int): The number of trials.
+            probability (float): The probability of success of each trial.
+
+        Returns:
+            (numpy Array): The positions in range(n) of the successful
+                trials, in ascending order.
+        """
+        if probability <= 0 or n == 0:
+            return np.zeros(0, dtype=np.int64)
+        elif probability >= 1:
+            return np.arange(n)
+        successes = self.generator.binomial(n, probability)
+        return np.sort(self.generator.choice(n, successes, replace=False))
+
+    def permutation(self, x):
+        """
+        Draw a random permutation.
+
+        Args:
+            x (int or numpy Array): If an integer, the number of elements to
+                permute. Otherwise an array of elements to permute.
+
+        Returns:
+            (numpy Array): A random permutation of range(x), or of the
+                elements of x.
+        """
+        return self.generator.permutation(x)
+
+
+"""
+The stream used when no other is given, for example by communities outside of
+a world
+"""
+default_stream = RandomStream()
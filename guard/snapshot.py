@@ -0,0 +1,81 @@
+"""
+Reading and writing snapshots of the state of a simulation.
+"""
+import json
+import numpy as np
+
+
+def save_snapshot(path, step_number, polity, members, ultrasocietal_traits,
+                  military_techs, rng):
+    """
+    Write a snapshot of the mutable state of a world to a NumPy .npz file.
+
+    Args:
+        path (str): Path to the file to write.
+        step_number (int): The current step number.
+        polity (numpy Array): The polity label of each tile, -1 for tiles
+            which do not belong to a polity.
+        members (numpy Array): The tile numbers of the members of every
+            polity, in the order the world holds them. May be empty if the
+            order carries no information.
+        ultrasocietal_traits (numpy Array): The ultrasocietal trait bitmask
+            of each tile.
+        military_techs (numpy Array): The military technology bitmask of each
+            tile.
+        rng (RandomStream): The world's random number stream.
+    """
+    rng_state = rng.get_state()
+    # Save to an open file so that NumPy does not append a suffix to the path
+    with open(path, 'wb') as outfile:
+        np.savez(outfile,
+                 step_number=step_number,
+                 polity=np.asarray(polity, dtype=np.int64),
+                 members=np.asarray(members, dtype=np.int64),
+                 ultrasocietal_traits=np.asarray(ultrasocietal_traits,
+                                                 dtype=np.int64),
+                 military_techs=np.asarray(military_techs, dtype=np.int64),
+                 rng_generator=json.dumps(rng_state['generator']),
+                 rng_buffer_state=json.dumps(rng_state['buffer_state']),
+                 rng_buffer_length=rng_state['buffer_length'],
+                 rng_buffer_position=rng_state['buffer_position'])
+
+
+def load_snapshot(path, total_tiles, rng):
+    """
+    Read a snapshot written by save_snapshot and restore the state of a random
+    number stream from it.
+
+    Args:
+        path (str): Path to the snapshot file.
+        total_tiles (int): The number of tiles of the world being restored.
+        rng (RandomStream): The random number stream to restore.
+
+    Returns:
+        (dict): The step number, under the key 'step_number', and arrays of
+            the polity labels, polity members, ultrasocietal traits and
+            military technologies under the keys of the corresponding
+            arguments of save_snapshot.
+
+    Raises:
+        (ValueError): Raised if the snapshot is of a world with a different
+            number of tiles.
+    """
+    with np.load(path) as snapshot:
+        state = {key: snapshot[key] for key in
+                 ('polity', 'members', 'ultrasocietal_traits',
+                  'military_techs')}
+        state['step_number'] = int(snapshot['step_number'])
+        rng_state = {
+            'generator': json.loads(str(snapshot['rng_generator'])),
+            'buffer_state': json.loads(str(snapshot['rng_buffer_state'])),
+            'buffer_length': int(snapshot['rng_buffer_length']),
+            'buffer_position': int(snapshot['rng_buffer_position'])
+            }
+
+    if len(state['polity']) != total_tiles:
+        raise ValueError(
+            'Snapshot has {} tiles but the world has {}'.format(
+                len(state['polity']), total_tiles))
+
+    rng.set_state(rng_state)
+    return state
@@ -42,3 +42,9 @@ sea = Terrain('sea', False)
 Desert terrain
 """
 desert = Terrain('desert', False)
+
+"""
+All terrain types. The position of a terrain in this tuple is its integer code
+in array representations of the map.
+"""
+all_terrains = (agriculture, steppe, sea, desert)
@@ -3,12 +3,23 @@ World module.
 """
 from . import polity, terrain, period, default_parameters
 from .community import Community, DIRECTIONS, LittoralNeighbour
-from numpy import sqrt
-from numpy.random import random, permutation
-import yaml
+from .events import AttackBuffer
+from .littoral import littoral_index
+from .mapfile import read_map, MissingYamlKey
+from .rng import RandomStream
+from .snapshot import save_snapshot, load_snapshot
+from bisect import bisect_right
+import copy
+import numpy as np
 
 _START_YEAR = -1500
 _YEARS_PER_STEP = 2
+# The simulation is run until 1500AD
+_FINAL_STEP = (1500 - _START_YEAR) // _YEARS_PER_STEP
+
+# Fields of the state of a world available as rasters
+RASTER_FIELDS = ('terrain', 'elevation', 'active', 'polity', 'polity_size',
+                 'ultrasocietal_traits', 'military_techs')
 
 
 class World(object):
@@ -25,23 +36,50 @@ class World(object):
             (0,1), (0,2)].
         params (Parameters, default=guard.default_paramters): The simulation
             parameter set to use.
+        rng (RandomStream, default=None): The random number stream used for
+            every stochastic decision in the simulation. If None a new,
+            unseeded, stream is created.
 
     Attributes:
         xdim (int): The x dimension of the world in communities.
         ydim (int): The y dimension of the world in communities.
         params (Parameters): The simulation parameter set.
+        rng (RandomStream): The random number stream.
         step_number (int): The current step number.
         tiles (list[Community]): A list of communities in the world.
         polities (list[Polity]): A list of polities in the world.
+        littoral_range (float): The greatest distance included in the
+            littoral neighbour index.
+        littoral_offsets (numpy Array): Tile i's littoral neighbours are
+            entries littoral_offsets[i] to littoral_offsets[i+1] of
+            littoral_targets and littoral_distances, sorted by distance.
+        littoral_targets (numpy Array): Tile numbers of littoral neighbours.
+        littoral_distances (numpy Array): Distances to littoral neighbours.
     """
-    def __init__(self, xdim, ydim, communities, params=default_parameters):
+    def __init__(self, xdim, ydim, communities, params=default_parameters,
+                 rng=None):
         self.params = params
+        if rng is None:
+            rng = RandomStream()
+        self.rng = rng
+        self.attack_accumulators = []
+        self.attack_buffer = AttackBuffer()
 
         self.xdim = xdim
         self.ydim = ydim
         self.total_tiles = xdim*ydim
         self.tiles = communities
 
+        # Polity forming tiles, the only tiles which attack, shift culturally
+        # or belong to polities
+        self._polity_forming_tiles = [tile for tile in self.tiles
+                                      if tile.terrain.polity_forming]
+        # The steps at which agricultural periods begin, between which the
+        # set of active tiles does not change
+        self._period_boundaries = sorted(
+            {tile.period.active_from for tile in self._polity_forming_tiles})
+        self._active_interval = (None, None)
+
         # Initialise neighbours and littoral neighbours
         self.set_neighbours()
         if params.sea_attacks:
@@ -77,7 +115,7 @@ class World(object):
             (Community): The community at coordinate (x,y).
             (None): If there is no such tile.
         """
-        if any([x < 0, x >= self.xdim, y < 0, y >= self.ydim]):
+        if x < 0 or x >= self.xdim or y < 0 or y >= self.ydim:
             return None
         return self.tiles[self._index(x, y)]
 
@@ -88,6 +126,75 @@ class World(object):
         """
         return x + y*self.xdim
 
+    def raster(self, field):
+        """
+        The value of a field for every tile, as an array indexed by the
+        coordinates of the tile.
+
+        Args:
+            field (str): The field, one of RASTER_FIELDS:
+                'terrain': The terrain code of the tile, its index in
+                    terrain.all_terrains.
+                'elevation': The elevation of the tile.
+                'active': Whether the tile is polity forming and currently
+                    agricultural.
+                'polity': A label identifying the tile's polity, -1 if the
+                    tile does not belong to a polity.
+                'polity_size': The size of the tile's polity, 0 if the tile
+                    does not belong to a polity.
+                'ultrasocietal_traits': The number of ultrasocietal traits of
+                    the tile.
+                'military_techs': The number of military technologies of the
+                    tile.
+
+        Returns:
+            (numpy Array): A two dimensional xdim by ydim array, where element
+                [x, y] is the value for the tile at (x, y).
+
+        Raises:
+            (ValueError): Raised if field is not one of RASTER_FIELDS.
+        """
+        return _raster(self.xdim, self.ydim, self._tile_values(field))
+
+    def as_arrays(self):
+        """
+        Rasters of every field of the world's state, see raster.
+
+        Returns:
+            (dict): The raster of each of RASTER_FIELDS, keyed by field.
+        """
+        return {field: self.raster(field) for field in RASTER_FIELDS}
+
+    def _tile_values(self, field):
+        """
+        The value of a field for every tile, in the order of World.tiles.
+        """
+        if field == 'terrain':
+            return [terrain.all_terrains.index(tile.terrain)
+                    for tile in self.tiles]
+        elif field == 'elevation':
+            return [tile.elevation for tile in self.tiles]
+        elif field == 'active':
+            values = np.zeros(self.total_tiles, dtype=bool)
+            for tile in self.active_tiles():
+                values[self._index(*tile.position)] = True
+            return values
+        elif field in ('polity', 'polity_size'):
+            values = np.full(self.total_tiles,
+                             -1 if field == 'polity' else 0, dtype=np.int64)
+            for label, state in enumerate(self.polities):
+                value = label if field == 'polity' else state.size()
+                for community in state.communities:
+                    values[self._index(*community.position)] = value
+            return values
+        elif field == 'ultrasocietal_traits':
+            return [tile.total_ultrasocietal_traits() for tile in self.tiles]
+        elif field == 'military_techs':
+            return [tile.total_military_techs() for tile in self.tiles]
+        else:
+            raise ValueError('field must be one of {}'.format(
+                ', '.join(RASTER_FIELDS)))
+
     def year(self):
         """
         Return the current year.
@@ -107,6 +214,51 @@ class World(object):
         return (self.params.base_sea_attack_distance
                 + self.step_number * self.params.sea_attack_increment)
 
+    def final_sea_attack_distance(self):
+        """
+        Determine the maximum sea attack distance at the final step of a
+        simulation, 1500AD.
+
+        Returns:
+            (float): The maximum sea attack distance.
+        """
+        return (self.params.base_sea_attack_distance
+                + _FINAL_STEP * self.params.sea_attack_increment)
+
+    def active_tiles(self):
+        """
+        The polity forming tiles which are active (currently agricultural),
+        _i.e._ those which may attack. The list is cached and only rebuilt
+        when the step number crosses the start of an agricultural period.
+
+        Returns:
+            (list[Community]): The active communities.
+        """
+        start, end = self._active_interval
+        if start is None or not start <= self.step_number < end:
+            self._set_active_tiles()
+        return self._active_tiles
+
+    def _set_active_tiles(self):
+        """
+        Build the list of active tiles and the interval of steps over which it
+        is valid.
+        """
+        step_number = self.step_number
+        position = bisect_right(self._period_boundaries, step_number)
+        if position == 0:
+            start = -np.inf
+        else:
+            start = self._period_boundaries[position-1]
+        if position == len(self._period_boundaries):
+            end = np.inf
+        else:
+            end = self._period_boundaries[position]
+
+        self._active_interval = (start, end)
+        self._active_tiles = [tile for tile in self._polity_forming_tiles
+                              if tile.is_active(step_number)]
+
     def set_neighbours(self):
         """
         Assign tiles their neighbours.
@@ -115,6 +267,7 @@ class World(object):
             for y in range(self.ydim):
                 tile = self.index(x, y)
                 tile.position = (x, y)
+                tile.tile_number = self._index(x, y)
                 tile.neighbours['left'] = self.index(x-1, y)
                 tile.neighbours['right'] = self.index(x+1, y)
                 tile.neighbours['up'] = self.index(x, y+1)
@@ -141,121 +294,310 @@ class World(object):
                     # to be littoral
                     break
 
-    def set_littoral_neighbours(self):
-        """
-        Assign littoral tiles their lists of littoral neighbours.
+    def set_littoral_neighbours(self, max_distance=None):
         """
-        littoral_tiles = [tile for tile in self.tiles if tile.littoral is True]
-        n_littoral = len(littoral_tiles)
-
-        for tile in littoral_tiles:
-            # Add self as a littoral neighbour with 0 distance, this is
-            # important in order to reproduce Turchin's results
-            tile.littoral_neighbours.append(LittoralNeighbour(tile, 0))
-
-        for i in range(n_littoral-1):
-            itile = littoral_tiles[i]
-            for j in range(i+1, n_littoral):
-                jtile = littoral_tiles[j]
-
-                # Calculate euclidean distance between tiles in tile dimension
-                # units
-                distance = sqrt((itile.position[0]-jtile.position[0])**2 +
-                                (itile.position[1]-jtile.position[1])**2)
+        Assign littoral tiles their lists of littoral neighbours, sorted by
+        distance.
 
-                # Add neighbour and the symmetric entry
-                itile.littoral_neighbours.append(
-                    LittoralNeighbour(jtile, distance))
-                jtile.littoral_neighbours.append(
-                    LittoralNeighbour(itile, distance))
+        Args:
+            max_distance (float, default=None): The greatest distance of a
+                neighbour to include. If None the maximum sea attack distance
+                at the final step is used, as no sea attack can reach further
+                during a simulation.
+        """
+        if max_distance is None:
+            max_distance = self.final_sea_attack_distance()
+        self.littoral_range = max_distance
+
+        (self.littoral_offsets, self.littoral_targets,
+         squared_distances) = littoral_index(
+             self.xdim, self.ydim, [tile.littoral for tile in self.tiles],
+             max_distance)
+        self.littoral_distances = np.sqrt(squared_distances)
+        self._assign_littoral_neighbours()
+
+    def _assign_littoral_neighbours(self):
+        """
+        Give each tile its list of littoral neighbours from the littoral
+        neighbour index.
+        """
+        targets = self.littoral_targets.tolist()
+        distances = self.littoral_distances.tolist()
+        offsets = self.littoral_offsets.tolist()
+        for tile_no, tile in enumerate(self.tiles):
+            # Littoral tiles have themselves as a littoral neighbour with 0
+            # distance, this is important in order to reproduce Turchin's
+            # results
+            start, end = offsets[tile_no], offsets[tile_no+1]
+            if start == end:
+                tile.set_littoral_neighbours([])
+                continue
+            tile.set_littoral_neighbours([
+                LittoralNeighbour(self.tiles[target], distance)
+                for target, distance
+                in zip(targets[start:end], distances[start:end])
+                ])
 
     @classmethod
-    def from_file(cls, yaml_file, params=default_parameters):
+    def from_file(cls, yaml_file, params=default_parameters, engine='object',
+                  seed=None, cache=True):
         """
-        Read a world from a YAML file.
+        Read a world from a YAML file, or a map compiled by
+        mapfile.compile_map.
 
         Args:
             yaml_file (str): Path to the file containing a YAML definition of
-                the world.
+                the world, or a compiled map with the extension .npz.
             params (Parameters, default=guard.default_paramters): The
                 simulation parameter set.
+            engine (str, default='object'): The simulation engine to use.
+                'object' builds a World of linked Community and Polity
+                objects, 'array' builds an ArrayWorld which holds the state of
+                all tiles in NumPy arrays.
+            seed (int, default=None): The seed of the world's random number
+                stream. If None the stream is seeded from fresh entropy.
+            cache (bool, default=True): Whether to use the compiled map
+                cache, see mapfile.read_map.
 
         Returns:
-            (World): The world object specified by the YAML file
+            (World): The world object specified by the YAML file. If engine is
+                'array' an ArrayWorld is returned instead.
 
         Raises:
             (MissingYamlKey): Raised if a required key is not present in the
-                YAML file.
-        """
-        # Parse YAML file
-        with open(yaml_file, 'r') as infile:
-            world_data = yaml.load(infile, Loader=yaml.FullLoader)
-        try:
-            xdim = world_data['xdim']
-        except KeyError:
-            raise MissingYamlKey('xdim', yaml_file)
-        try:
-            ydim = world_data['ydim']
-        except KeyError:
-            raise MissingYamlKey('ydim', yaml_file)
-
-        # Determine total number of tiles and assign list
-        total_communities = xdim*ydim
-        communities = [None]*total_communities
-
-        # Enter world data into tiles list
-        try:
-            community_data = world_data['communities']
-        except KeyError:
-            raise MissingYamlKey('communities', yaml_file)
-        for community in community_data:
-            x, y = community['x'], community['y']
-
-            assert community['terrain'] in ['agriculture', 'steppe',
-                                            'desert', 'sea']
-            if community['terrain'] == 'agriculture':
-                landscape = terrain.agriculture
-            elif community['terrain'] == 'steppe':
-                landscape = terrain.steppe
-            elif community['terrain'] == 'desert':
-                landscape = terrain.desert
-            elif community['terrain'] == 'sea':
-                landscape = terrain.sea
-
-            if landscape.polity_forming:
-                elevation = community['elevation'] / 1000.
-                agricultural_period = community['activeFrom']
-
-                if agricultural_period == 'agri1':
-                    active_from = period.agri1
-                elif agricultural_period == 'agri2':
-                    active_from = period.agri2
-                elif agricultural_period == 'agri3':
-                    active_from = period.agri3
-
-                communities[x + y*xdim] = Community(params, landscape,
-                                                    elevation, active_from)
-            else:
-                communities[x + y*xdim] = Community(params, landscape)
+                YAML file, including if a tile has no community.
+            (InvalidYamlValue): Raised if the terrain or agricultural period
+                of a community is not recognised, or its position is outside
+                of the map.
+            (ValueError): Raised if engine is not one of 'object' or 'array'.
+        """
+        xdim, ydim, terrains, elevations, periods = read_map(yaml_file,
+                                                             cache)
+        return cls.from_arrays(xdim, ydim, terrains, elevations, periods,
+                               params, engine, seed)
+
+    @classmethod
+    def from_arrays(cls, xdim, ydim, terrains, elevations, periods,
+                    params=default_parameters, engine='object', seed=None):
+        """
+        Build a world from per tile terrain, elevation and agricultural period
+        codes, ordered in the same way as World.tiles.
+
+        Args:
+            xdim (int): The size of the world in the x direction.
+            ydim (int): The size of the world in the y direction.
+            terrains (sequence[int]): The terrain of each tile, as an index of
+                terrain.all_terrains.
+            elevations (sequence[float]): The elevation of each tile.
+            periods (sequence[int]): The agricultural period of each tile, as
+                an index of period.all_periods.
+            params (Parameters, default=guard.default_paramters): The
+                simulation parameter set.
+            engine (str, default='object'): The simulation engine to use.
+                'object' builds a World of linked Community and Polity
+                objects, 'array' builds an ArrayWorld which holds the state of
+                all tiles in NumPy arrays.
+            seed (int, default=None): The seed of the world's random number
+                stream. If None the stream is seeded from fresh entropy.
 
-        return cls(xdim, ydim, communities, params)
+        Returns:
+            (World): The world object. If engine is 'array' an ArrayWorld is
+                returned instead.
 
-    def reset(self):
+        Raises:
+            (ValueError): Raised if engine is not one of 'object' or 'array'.
+        """
+        terrains = np.asarray(terrains).tolist()
+        elevations = np.asarray(elevations, dtype=float).tolist()
+        periods = np.asarray(periods).tolist()
+
+        rng = RandomStream(seed)
+        if engine == 'object':
+            communities = [
+                Community(params, terrain.all_terrains[landscape], elevation,
+                          period.all_periods[active_from], rng)
+                for landscape, elevation, active_from
+                in zip(terrains, elevations, periods)
+                ]
+            return cls(xdim, ydim, communities, params, rng)
+        elif engine == 'array':
+            # Imported here to avoid a circular import
+            from .arrayworld import ArrayWorld
+            return ArrayWorld(
+                xdim, ydim, terrains, elevations,
+                [period.all_periods[active_from].active_from
+                 for active_from in periods],
+                params, rng)
+        else:
+            raise ValueError('engine must be one of "object" or "array"')
+
+    def reset(self, seed=None):
         """
         Reset the world by returning all polities to single communities and
         setting the step number to 0.
+
+        Args:
+            seed (int, default=None): If not None, reseed the world's random
+                number stream with this seed, clear all ultrasocietal traits
+                and draw the initial military technologies again from the
+                reseeded stream, so that the simulation which follows depends
+                only on the seed.
         """
+        if seed is not None:
+            self.rng.seed(seed)
+            for tile in self.tiles:
+                tile.polity = None
+                tile.ultrasocietal_trait_mask = 0
+                tile.seed_military_techs(self.params, self.rng)
         self.step_number = 0
         self.polities = [polity.Polity([tile])
-                         for tile in self.tiles if tile.terrain.polity_forming]
+                         for tile in self._polity_forming_tiles]
+
+    def fork(self, seed=None, params=None):
+        """
+        Create an independent copy of the world in its current state, from
+        which a simulation may continue separately. The mutable state, the
+        communities and polities, is copied while the neighbour and littoral
+        neighbour indices are reused rather than recalculated.
+
+        Args:
+            seed (int, default=None): The seed of the copy's random number
+                stream. If None the copy continues from the same random number
+                stream state as this world, and so reproduces its future.
+            params (Parameters, default=None): The simulation parameter set of
+                the copy. If None this world's parameters are used.
+
+        Returns:
+            (World): The copy of the world.
+
+        Raises:
+            (ValueError): Raised if params has a different number of
+                ultrasocietal traits or military technologies.
+        """
+        clone = copy.copy(self)
+        clone.params = _fork_params(self.params, params)
+        clone.rng = _fork_rng(self.rng, seed)
+        clone.attack_accumulators = []
+        clone.attack_buffer = AttackBuffer()
+
+        # Copy the communities, then point them at their new neighbours and
+        # polities
+        clone.tiles = [_copy_community(tile) for tile in self.tiles]
+        for tile in clone.tiles:
+            tile.neighbours = {
+                direction: (None if neighbour is None
+                            else clone.tiles[self._index(*neighbour.position)])
+                for direction, neighbour in tile.neighbours.items()
+                }
+            tile.polity = None
+        clone._polity_forming_tiles = [
+            clone.tiles[self._index(*tile.position)]
+            for tile in self._polity_forming_tiles]
+        clone._active_interval = (None, None)
+        if clone.params.sea_attacks:
+            if self.params.sea_attacks:
+                clone._assign_littoral_neighbours()
+            else:
+                clone.set_littoral_tiles()
+                clone.set_littoral_neighbours()
+
+        clone.polities = [
+            polity.Polity([clone.tiles[self._index(*community.position)]
+                           for community in state.communities])
+            for state in self.polities]
+        return clone
+
+    def save_state(self, path):
+        """
+        Write the state of the simulation to a file. The file holds the step
+        number, the polity of each tile, the traits and technologies of each
+        tile and the state of the random number stream, from which
+        load_state resumes the simulation exactly.
+
+        Args:
+            path (str): Path to the file to write.
+        """
+        labels = np.full(self.total_tiles, -1, dtype=np.int64)
+        members = []
+        for label, state in enumerate(self.polities):
+            for community in state.communities:
+                tile_no = self._index(*community.position)
+                labels[tile_no] = label
+                members.append(tile_no)
+
+        save_snapshot(
+            path, self.step_number, labels, members,
+            [tile.ultrasocietal_trait_mask for tile in self.tiles],
+            [tile.military_tech_mask for tile in self.tiles],
+            self.rng)
+
+    def load_state(self, path):
+        """
+        Restore the state of the simulation from a file written by save_state.
+        The world must have been built from the same map and parameters.
+
+        Args:
+            path (str): Path to the snapshot file.
+
+        Raises:
+            (ValueError): Raised if the snapshot is of a world with a
+                different number of tiles.
+        """
+        state = load_snapshot(path, self.total_tiles, self.rng)
+
+        self.step_number = state['step_number']
+        for tile, traits, techs in zip(self.tiles,
+                                       state['ultrasocietal_traits'].tolist(),
+                                       state['military_techs'].tolist()):
+            tile.assign_to_polity(None)
+            tile.ultrasocietal_trait_mask = traits
+            tile.military_tech_mask = techs
+
+        # Rebuild the polities in their original order, if the snapshot
+        # records it, otherwise in order of their labels
+        labels = state['polity']
+        members = state['members']
+        if len(members) == 0:
+            members = np.flatnonzero(labels >= 0)
+            members = members[np.argsort(labels[members], kind='stable')]
+        communities = {}
+        for tile_no, label in zip(members.tolist(),
+                                  labels[members].tolist()):
+            communities.setdefault(label, []).append(self.tiles[tile_no])
+        self.polities = [polity.Polity(communities[label])
+                         for label in sorted(communities)]
 
     def cultural_shift(self):
         """
         Attempt cultural shift in all communities.
+
+        Notes:
+            This is equivalent to calling Community.cultural_shift for every
+            polity forming community. As mutation rates are small, rather
+            than drawing a random number for every trait of every community,
+            only the traits which may shift at the larger of the two mutation
+            rates are sampled. Each is then shifted with the probability of
+            its own mutation rate relative to the larger rate.
         """
-        for tile in self.tiles:
-            if tile.terrain.polity_forming:
-                tile.cultural_shift(self.params)
+        params = self.params
+        n_traits = params.n_ultrasocietal_traits
+        shift_probability = max(params.mutation_to_ultrasocietal,
+                                params.mutation_from_ultrasocietal)
+
+        tiles = self._polity_forming_tiles
+        candidates = self.rng.bernoulli_positions(len(tiles)*n_traits,
+                                                  shift_probability)
+        for candidate in candidates.tolist():
+            tile = tiles[candidate // n_traits]
+            index = candidate % n_traits
+            if tile.has_ultrasocietal_trait(index):
+                # Chance to loose an ultrasocietal trait
+                probability = params.mutation_from_ultrasocietal
+            else:
+                # Chance to develop an ultrasocietal trait
+                probability = params.mutation_to_ultrasocietal
+            if probability > shift_probability*self.rng.random():
+                tile.toggle_ultrasocietal_trait(index)
 
     def disintegration(self):
         """
@@ -266,7 +608,7 @@ class World(object):
             # Skip single community polities
             if state.size() == 1:
                 continue
-            if state.disintegrate_probability(self.params) > random():
+            if state.disintegrate_probability(self.params) > self.rng.random():
                 # Create a new set of polities, one for each of the communities
                 new_states += state.disintegrate()
 
@@ -278,22 +620,50 @@ class World(object):
 
     def attack(self, callback=None):
         """
-        Attempt an attack from all communities.
+        Attempt an attack from all active communities.
 
         Args:
             callback (function, default=None): A callback function invoked if
-                an attack is successful. Used to record attack events.
+                an attack is successful. Used to record attack events,
+                record_attacks is a faster alternative.
         """
-        # Generate a random order for communities to attempt attacks in
-        attack_order = permutation(self.total_tiles)
+        # Extend the littoral neighbour index if the simulation runs past the
+        # final step
+        if self.params.sea_attacks:
+            if self.sea_attack_distance() > self.littoral_range:
+                self.set_littoral_neighbours(2*self.sea_attack_distance())
+
+        # Record attacks only if an accumulator will sample them
+        events = None
+        if self.attack_accumulators:
+            events = self.attack_buffer
+            events.clear()
+
+        # Generate a random order for active communities to attempt attacks in
+        active_tiles = self.active_tiles()
+        sea_attack_distance = self.sea_attack_distance()
+        attack_order = self.rng.permutation(len(active_tiles))
         for tile_no in attack_order:
-            tile = self.tiles[tile_no]
-            if tile.can_attack(self.step_number):
-                tile.attempt_attack(self.params, self.step_number,
-                                    self.sea_attack_distance(), callback)
+            active_tiles[tile_no].attempt_attack(
+                self.params, self.step_number, sea_attack_distance, callback,
+                self.rng, events)
+
+        for accumulator in self.attack_accumulators:
+            accumulator.sample_attacks(self.attack_buffer)
 
         self.prune_empty_polities()
 
+    def record_attacks(self, accumulator):
+        """
+        Attach an accumulator of attack events. At the end of each attack
+        phase the attacks made are written to World.attack_buffer, which is
+        passed to the accumulator's sample_attacks method.
+
+        Args:
+            accumulator (AttackEvents): The accumulator.
+        """
+        self.attack_accumulators.append(accumulator)
+
     def prune_empty_polities(self):
         """
         Prune polities with zero communities.
@@ -323,12 +693,42 @@ class World(object):
         self.step_number += 1
 
 
-class MissingYamlKey(Exception):
+def _raster(xdim, ydim, values):
+    """
+    Arrange per tile values, ordered by tile number, into an xdim by ydim
+    array indexed by coordinates.
+    """
+    return np.asarray(values).reshape(ydim, xdim).T.copy()
+
+
+def _copy_community(community):
+    """
+    Make a shallow copy of a community, faster than copy.copy.
+    """
+    clone = Community.__new__(Community)
+    clone.__dict__.update(community.__dict__)
+    return clone
+
+
+def _fork_params(params, new_params):
+    """
+    Determine the parameters of a forked world, ensuring that the number of
+    traits and technologies is unchanged.
+    """
+    if new_params is None:
+        return params
+    if (new_params.n_ultrasocietal_traits != params.n_ultrasocietal_traits
+            or new_params.n_military_techs != params.n_military_techs):
+        raise ValueError('A forked world must have the same number of '
+                         'ultrasocietal traits and military technologies')
+    return new_params
+
+
+def _fork_rng(rng, seed):
     """
-    Exception raised when a necessary key is missing from the world YAML file.
+    Determine the random number stream of a forked world, a copy of the
+    original stream unless a seed is given.
     """
-    def __init__(self, key, filename):
-        super().__init__(
-            'Required key "{}" missing from the world definition'
-            ' file "{}".'.format(key, filename)
-            )
+    if seed is None:
+        return rng.copy()
+    return RandomStream(seed)
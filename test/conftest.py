@@ -1,5 +1,17 @@
 import pytest
-from guard import World, Community, terrain, daterange, default_parameters
+from guard import (World, ArrayWorld, Community, terrain, daterange,
+                   default_parameters)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def map_cache(tmp_path_factory):
+    """
+    Keep compiled maps cached during testing out of the user's cache.
+    """
+    cache_dir = tmp_path_factory.mktemp('map_cache')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('GUARD_CACHE_DIR', str(cache_dir))
+        yield cache_dir
 
 
 @pytest.fixture(scope='class')
@@ -57,6 +69,21 @@ def generate_world_with_sea():
     return _generate_world
 
 
+@pytest.fixture
+def generate_array_world():
+    def _generate_world(xdim, ydim, sea_tiles=(), params=default_parameters):
+        communities = [
+            Community(params) for i in range(xdim*ydim)
+            ]
+        for coordinate in sea_tiles:
+            x, y = coordinate
+            communities[x + y*xdim] = Community(params, landscape=terrain.sea)
+
+        world = ArrayWorld.from_communities(xdim, ydim, communities, params)
+        return world
+    return _generate_world
+
+
 def pytest_runtest_makereport(item, call):
     if "incremental" in item.keywords:
         if call.excinfo is not None:
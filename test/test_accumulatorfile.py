@@ -0,0 +1,119 @@
+from guard import analysis
+from guard.accumulatorfile import (AccumulatorFile, is_accumulator_file,
+                                   write_accumulator_file)
+from guard.area import Area, Rectangle
+from guard.daterange import DateRange
+import numpy as np
+import os
+import pytest
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+eras = [DateRange(-1500, -500), DateRange(-500, 500), DateRange(500, 1500)]
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(5)
+    return {era: rng.random([6, 4]) for era in eras}
+
+
+@pytest.fixture
+def data_file(data, tmp_path):
+    path = str(tmp_path / 'accumulator.dat')
+    write_accumulator_file(path, data)
+    return path
+
+
+def test_read(data, data_file):
+    assert is_accumulator_file(data_file)
+    with AccumulatorFile(data_file) as accumulator_file:
+        assert accumulator_file.eras == eras
+        assert accumulator_file.shape == (6, 4)
+        assert isinstance(accumulator_file.data, np.memmap)
+        assert not accumulator_file.data.flags.writeable
+        for era in eras:
+            assert np.all(accumulator_file.read(era) == data[era])
+            assert np.all(accumulator_file.read(str(era)) == data[era])
+        with pytest.raises(KeyError):
+            accumulator_file.read(DateRange(0, 100))
+
+
+def test_read_area(data, data_file):
+    accumulator_file = AccumulatorFile(data_file)
+    era = eras[1]
+    assert np.all(accumulator_file.read(era, Rectangle(1, 4, 2, 4))
+                  == data[era][1:4, 2:4])
+
+    area = Area()
+    area.all_tiles = [(0, 0), (5, 3), (2, 1)]
+    assert np.all(accumulator_file.read(era, area)
+                  == [data[era][0, 0], data[era][5, 3], data[era][2, 1]])
+
+
+def test_alignment(data_file):
+    assert AccumulatorFile(data_file)._offset % 64 == 0
+
+
+def test_float32(data, tmp_path):
+    path = str(tmp_path / 'accumulator.dat')
+    write_accumulator_file(path, data, np.float32)
+    accumulator_file = AccumulatorFile(path)
+    assert accumulator_file.dtype == np.float32
+    assert os.path.getsize(path) == (accumulator_file._offset
+                                     + len(eras) * 6 * 4 * 4)
+    assert np.allclose(accumulator_file.read(eras[0]), data[eras[0]])
+
+
+def test_invalid(data, tmp_path):
+    path = str(tmp_path / 'accumulator.dat')
+    with pytest.raises(ValueError):
+        write_accumulator_file(path, data, np.int64)
+    with pytest.raises(ValueError):
+        write_accumulator_file(path, {eras[0]: np.zeros([2, 2]),
+                                      eras[1]: np.zeros([3, 3])})
+    with pytest.raises(ValueError):
+        AccumulatorFile(project_dir+'/data/imperial_density_data.pkl')
+
+
+def test_accumulator_dump(world_5x5, tmp_path):
+    accumulator = analysis.ImperialDensity(world_5x5, eras)
+    for era in eras:
+        accumulator.data[era] = np.random.random([5, 5])
+    path = str(tmp_path / 'imperial_density.dat')
+    accumulator.dump(path)
+
+    for mmap in (False, True):
+        loaded = analysis.ImperialDensity.from_file(world_5x5, path, mmap)
+        assert loaded.date_ranges == eras
+        for era in eras:
+            assert np.all(loaded.data[era] == accumulator.data[era])
+
+
+def test_attributes(data, tmp_path):
+    path = str(tmp_path / 'accumulator.dat')
+    write_accumulator_file(path, data, attributes={'edges': [0, 5, 50]})
+    assert AccumulatorFile(path).attributes == {'edges': [0, 5, 50]}
+
+
+def test_polity_size_density_dump(world_5x5, tmp_path):
+    accumulator = analysis.PolitySizeDensity(world_5x5, eras, (0, 4, 40))
+    for era in eras:
+        accumulator.data[era] = np.random.random([5, 5, 3])
+    path = str(tmp_path / 'polity_size_density.dat')
+    accumulator.dump(path)
+
+    loaded = analysis.PolitySizeDensity.from_file(world_5x5, path)
+    assert np.all(loaded.edges == [0, 4, 40])
+    for era in eras:
+        assert np.all(loaded.data[era] == accumulator.data[era])
+    assert np.all(loaded.imperial_density(4).data[eras[0]]
+                  == accumulator.imperial_density(4).data[eras[0]])
+
+
+def test_legacy_pickle(world_5x5):
+    data_file = project_dir+'/data/imperial_density_data.pkl'
+    assert not is_accumulator_file(data_file)
+    accumulator = analysis.ImperialDensity.from_file(world_5x5, data_file)
+    assert [str(era) for era in accumulator.date_ranges] == [
+        '1500BC-500BC', '500BC-500AD', '500AD-1500AD']
+    assert accumulator.data[accumulator.date_ranges[0]].shape == (115, 121)
@@ -1,7 +1,10 @@
-from guard import analysis
+from guard import analysis, generate_parameters, terrain, Community, World
 import numpy as np
 import os
 import pytest
+import subprocess
+import sys
+from scipy import stats
 
 project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -82,3 +85,399 @@ def test_mean_accumulator(world_5x5, daterange_0_100AD, accumulator_class):
 
     mean = analysis.AccumulatorBase.mean(accumulators)
     assert np.all(mean.data[daterange_0_100AD] == mean_data)
+
+
+def large_polity_tiles(world):
+    # Reference count of active tiles in large polities, tile by tile
+    density = np.zeros([world.xdim, world.ydim])
+    if hasattr(world, 'tiles'):
+        for tile in world.tiles:
+            if (tile.terrain.polity_forming
+                    and tile.is_active(world.step_number)
+                    and tile.polity.size() > 10):
+                density[tile.position] += 1
+    else:
+        for tile in range(world.total_tiles):
+            if (world.active()[tile]
+                    and world.polity_size[world.polity[tile]] > 10):
+                density[tile % world.xdim, tile // world.xdim] += 1
+    return density
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_imperial_density_sample(generate_world, generate_array_world,
+                                 engine):
+    params = generate_parameters(mutation_to_ultrasocietal=0.2,
+                                 disintegration_base=0.)
+    if engine == 'object':
+        world = generate_world(8, 8, params)
+    else:
+        world = generate_array_world(8, 8, params=params)
+    world.rng.seed(1)
+    # The first era contains the first 25 steps, the second none of them
+    eras = [analysis.DateRange(-1500, -1450), analysis.DateRange(0, 100)]
+    imperial_density = analysis.ImperialDensity(world, eras)
+
+    expected = np.zeros([8, 8])
+    for step in range(30):
+        world.step()
+        imperial_density.sample()
+        if world.year() < -1450:
+            expected += large_polity_tiles(world)
+
+    assert np.sum(expected) > 0
+    assert np.all(imperial_density.data[eras[0]] == expected)
+    assert np.all(imperial_density.data[eras[1]] == 0)
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_polity_size_density(generate_world, generate_array_world, engine):
+    params = generate_parameters(mutation_to_ultrasocietal=0.2,
+                                 disintegration_base=0.)
+    if engine == 'object':
+        world = generate_world(8, 8, params)
+    else:
+        world = generate_array_world(8, 8, params=params)
+    world.rng.seed(1)
+    eras = [analysis.DateRange(-1500, -1450), analysis.DateRange(0, 100)]
+    polity_size_density = analysis.PolitySizeDensity(world, eras)
+    imperial_density = analysis.ImperialDensity(world, eras)
+    active = np.zeros([8, 8])
+
+    for step in range(30):
+        world.step()
+        polity_size_density.sample()
+        imperial_density.sample()
+        if world.year() < -1450:
+            active += world.raster('active')
+
+    for era in eras:
+        assert np.all(polity_size_density.imperial_density(10).data[era]
+                      == imperial_density.data[era])
+    # Every active tile belongs to a polity of size greater than zero
+    assert np.all(polity_size_density.imperial_density(0).data[eras[0]]
+                  == active)
+
+    with pytest.raises(ValueError):
+        polity_size_density.imperial_density(11)
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_record_attacks(generate_world, generate_array_world, engine):
+    params = generate_parameters(mutation_to_ultrasocietal=0.2)
+    if engine == 'object':
+        worlds = [generate_world(8, 8, params) for i in range(2)]
+    else:
+        worlds = [generate_array_world(8, 8, params=params)
+                  for i in range(2)]
+    era = analysis.DateRange(-1500, 1500)
+    attack_events = [analysis.AttackEvents(world, [era]) for world in worlds]
+
+    # Record attacks in one world with a callback and the other with the
+    # attack buffer
+    worlds[1].record_attacks(attack_events[1])
+    if engine == 'object':
+        callback = attack_events[0].sample
+    else:
+        def callback(tile):
+            attack_events[0].data[era][tile % 8, tile // 8] += 1.
+    n_attacks = n_successful = 0
+    for world in worlds:
+        world.rng.seed(2)
+    for step in range(10):
+        worlds[0].step(callback)
+        worlds[1].step()
+        buffer = worlds[1].attack_buffer
+        assert np.all(buffer.field('step') == step)
+        n_attacks += len(buffer)
+        n_successful += np.sum(buffer.field('success'))
+
+    assert np.all(attack_events[0].data[era] == attack_events[1].data[era])
+    assert np.sum(attack_events[1].data[era]) == n_attacks
+    assert 0 < n_successful < n_attacks
+
+
+class TestAccumulatorStatistics():
+    @pytest.fixture
+    def replicas(self, world_5x5, daterange_0_100AD):
+        rng = np.random.default_rng(3)
+        replicas = []
+        for i in range(20):
+            accumulator = analysis.ImperialDensity(world_5x5,
+                                                   [daterange_0_100AD])
+            accumulator.data[daterange_0_100AD] = rng.integers(0, 50, [5, 5])
+            replicas.append(accumulator)
+        return replicas
+
+    @pytest.fixture
+    def statistics(self, world_5x5, daterange_0_100AD, replicas):
+        statistics = analysis.AccumulatorStatistics(
+            world_5x5, [daterange_0_100AD],
+            quantile_edges=np.arange(0, 51))
+        for replica in replicas:
+            statistics.add(replica)
+        return statistics
+
+    def test_mean_variance(self, statistics, replicas, daterange_0_100AD):
+        data = np.array([replica.data[daterange_0_100AD]
+                         for replica in replicas])
+        mean = statistics.mean()
+        assert isinstance(mean, analysis.ImperialDensity)
+        assert np.allclose(mean.data[daterange_0_100AD], data.mean(axis=0))
+        assert np.allclose(statistics.variance().data[daterange_0_100AD],
+                           data.var(axis=0, ddof=1))
+        assert np.allclose(
+            statistics.standard_deviation(0).data[daterange_0_100AD],
+            data.std(axis=0))
+
+    def test_quantile(self, statistics, replicas, daterange_0_100AD):
+        data = np.array([replica.data[daterange_0_100AD]
+                         for replica in replicas])
+        median = statistics.quantile(0.5).data[daterange_0_100AD]
+        # With unit bins the approximation is within a bin of the sorted
+        # values either side of the median
+        ordered = np.sort(data, axis=0)
+        assert np.all(median >= ordered[9])
+        assert np.all(median <= ordered[10] + 1)
+        assert np.all(statistics.quantile(0).data[daterange_0_100AD]
+                      == data.min(axis=0))
+        assert np.all(statistics.quantile(1).data[daterange_0_100AD]
+                      == data.max(axis=0) + 1)
+
+    def test_merge(self, statistics, replicas, world_5x5, daterange_0_100AD):
+        parts = [analysis.AccumulatorStatistics(
+            world_5x5, [daterange_0_100AD], quantile_edges=np.arange(0, 51))
+            for i in range(3)]
+        for index, replica in enumerate(replicas):
+            parts[index % 2].add(replica)
+        # Merge into an empty set of statistics
+        for part in parts[:2]:
+            parts[2].merge(part)
+
+        era = daterange_0_100AD
+        assert parts[2].count == statistics.count
+        assert np.allclose(parts[2].data[era], statistics.data[era])
+        assert np.allclose(parts[2].m2[era], statistics.m2[era])
+        assert np.all(parts[2].histograms[era] == statistics.histograms[era])
+
+        with pytest.raises(ValueError):
+            parts[2].merge(analysis.AccumulatorStatistics(world_5x5, [era]))
+
+    def test_dump(self, statistics, world_5x5, daterange_0_100AD, tmp_path):
+        outfile = str(tmp_path / 'statistics.pkl')
+        statistics.dump(outfile)
+        loaded = analysis.AccumulatorStatistics.from_file(world_5x5, outfile)
+
+        era = daterange_0_100AD
+        assert loaded.count == statistics.count
+        assert np.all(loaded.variance().data[era]
+                      == statistics.variance().data[era])
+        assert np.all(loaded.quantile(0.9).data[era]
+                      == statistics.quantile(0.9).data[era])
+
+    def test_attributes(self, world_5x5, daterange_0_100AD, tmp_path):
+        era = daterange_0_100AD
+        edges = (0, 2, 10)
+        replicas = []
+        for i in range(3):
+            replica = analysis.PolitySizeDensity(world_5x5, [era],
+                                                 edges=edges)
+            replica.data[era][...] = i
+            replicas.append(replica)
+        assert np.all(analysis.PolitySizeDensity.mean(replicas).edges
+                      == edges)
+
+        parts = [analysis.AccumulatorStatistics(
+            world_5x5, [era], analysis.PolitySizeDensity,
+            attributes=replicas[0]._attributes()) for i in range(2)]
+        for replica in replicas:
+            parts[0].add(replica)
+        parts[1].merge(parts[0])
+        assert np.all(parts[1].mean().edges == edges)
+        assert np.all(parts[1].mean().data[era] == 1)
+
+        outfile = str(tmp_path / 'statistics.npz')
+        parts[1].dump(outfile)
+        loaded = analysis.AccumulatorStatistics.from_file(
+            world_5x5, outfile, analysis.PolitySizeDensity)
+        assert np.all(loaded.variance().edges == edges)
+
+        with pytest.raises(ValueError):
+            parts[1].merge(analysis.AccumulatorStatistics(
+                world_5x5, [era], analysis.PolitySizeDensity))
+
+    def test_errors(self, world_5x5, daterange_0_100AD):
+        statistics = analysis.AccumulatorStatistics(world_5x5,
+                                                    [daterange_0_100AD])
+        with pytest.raises(ValueError):
+            statistics.mean()
+        with pytest.raises(ValueError):
+            statistics.quantile(0.5)
+        with pytest.raises(ValueError):
+            analysis.AccumulatorStatistics(world_5x5, [daterange_0_100AD],
+                                           quantile_edges=[1, 1])
+
+
+def test_compare_empire_shape_dump(world_5x5, tmp_path):
+    data_file = project_dir+'/data/roman_empire.yml'
+    years = ['0', '100AD', '1000BC']
+    compare = analysis.CompareEmpireShape(world_5x5, data_file, years)
+    compare.n_polities = {'0': 3, '100AD': 2, '1000BC': 0}
+    compare.polity_sizes = {'0': [1, 5, 2], '100AD': [4, 4], '1000BC': []}
+
+    outfile = str(tmp_path / 'roman_empire.npz')
+    compare.dump(outfile)
+    loaded = analysis.CompareEmpireShape.from_file(world_5x5, data_file,
+                                                   years, outfile)
+    assert loaded.n_polities == compare.n_polities
+    assert loaded.polity_sizes == compare.polity_sizes
+
+
+class TestRegress():
+    @pytest.fixture
+    def world(self, generate_world_with_sea):
+        return generate_world_with_sea(6, 6, [(0, 0), (1, 0), (5, 5)])
+
+    @pytest.fixture
+    def eras(self):
+        return [analysis.DateRange(-500, 0), analysis.DateRange(0, 500)]
+
+    @pytest.fixture
+    def correlator(self, world, eras):
+        rng = np.random.default_rng(11)
+        correlator = analysis.CorrelateBase(world, eras)
+        for era in eras:
+            correlator.data[era] = rng.integers(0, 3, [6, 6]).astype(float)
+        return correlator
+
+    @pytest.fixture
+    def accumulator(self, world, eras):
+        rng = np.random.default_rng(12)
+        accumulator = analysis.ImperialDensity(world, eras)
+        for era in eras:
+            accumulator.data[era] = rng.integers(0, 3, [6, 6]).astype(float)
+        return accumulator
+
+    def reference(self, correlator, accumulator, era, mask):
+        return stats.linregress(accumulator.data[era][mask],
+                                correlator.data[era][mask])
+
+    def test_regress(self, correlator, accumulator, eras):
+        mask = np.ones([6, 6], dtype=bool)
+        mask[[0, 1, 5], [0, 0, 5]] = False
+        correlator_data = {era: correlator.data[era].copy() for era in eras}
+
+        results = correlator.regress(accumulator)
+        assert list(results) == eras
+        for era in eras:
+            reference = self.reference(correlator, accumulator, era, mask)
+            assert results[era].n == 33
+            assert np.isclose(results[era].slope, reference.slope)
+            assert np.isclose(results[era].intercept, reference.intercept)
+            assert np.isclose(results[era].rvalue, reference.rvalue)
+            assert np.isclose(results[era].pvalue, reference.pvalue)
+            # The inputs are not modified
+            assert np.all(correlator.data[era] == correlator_data[era])
+
+    def test_area(self, correlator, accumulator, eras):
+        area = analysis.Rectangle(1, 5, 0, 4)
+        exclude = analysis.Rectangle(2, 3, 2, 4)
+        results = correlator.regress(accumulator, area=area, exclude=exclude)
+
+        mask = np.zeros([6, 6], dtype=bool)
+        mask[1:5, 0:4] = True
+        mask[1, 0] = False
+        mask[2, 2:4] = False
+        reference = self.reference(correlator, accumulator, eras[0], mask)
+        assert results[eras[0]].n == np.sum(mask)
+        assert np.isclose(results[eras[0]].rvalue, reference.rvalue)
+
+    def test_cumulative(self, correlator, accumulator, eras):
+        accumulator_data = accumulator.data[eras[0]].copy()
+        results = correlator.regress(accumulator, cumulative=True)
+
+        mask = np.ones([6, 6], dtype=bool)
+        mask[[0, 1, 5], [0, 0, 5]] = False
+        reference = stats.linregress(
+            (accumulator.data[eras[0]] + accumulator.data[eras[1]])[mask],
+            correlator.data[eras[1]][mask])
+        assert np.isclose(results[eras[1]].rvalue, reference.rvalue)
+        assert np.all(accumulator.data[eras[0]] == accumulator_data)
+
+    def test_log_log(self, correlator, accumulator, eras):
+        results = correlator.regress(accumulator, log_log=True)
+
+        era = eras[0]
+        mask = ((accumulator.data[era] != 0) & (correlator.data[era] != 0))
+        mask[[0, 1, 5], [0, 0, 5]] = False
+        reference = stats.linregress(np.log(accumulator.data[era][mask]),
+                                     np.log(correlator.data[era][mask]))
+        assert results[era].n == np.sum(mask)
+        assert np.isclose(results[era].slope, reference.slope)
+
+    def test_too_few_tiles(self, correlator, accumulator, eras):
+        results = correlator.regress(accumulator,
+                                     area=analysis.Rectangle(0, 3, 0, 1))
+        assert results[eras[0]].n == 1
+        assert np.isnan(results[eras[0]].rvalue)
+
+
+class TestOverlay():
+    @pytest.fixture
+    def world(self):
+        params = generate_parameters()
+        landscapes = {(0, 0): terrain.sea, (1, 0): terrain.sea,
+                      (2, 3): terrain.desert, (3, 1): terrain.steppe,
+                      (4, 4): terrain.steppe}
+        communities = [
+            Community(params, landscape=landscapes.get((i % 5, i // 5),
+                                                       terrain.agriculture))
+            for i in range(25)]
+        return World(5, 5, communities, params)
+
+    def reference(self, world, area):
+        # Colour tile by tile, as the plots previously did
+        xmin, xmax, ymin, ymax = area.bounds()
+        rgba_data = np.full([xmax-xmin, ymax-ymin, 4], 0.5)
+        for tile in world.tiles:
+            x, y = tile.position
+            if area.in_area(x, y):
+                colour = {terrain.sea: analysis._SEA,
+                          terrain.desert: analysis._DESERT,
+                          terrain.steppe: analysis._STEPPE}.get(tile.terrain)
+                if colour is not None:
+                    rgba_data[x-xmin, y-ymin] = colour
+        return rgba_data
+
+    @pytest.mark.parametrize('area', [None, analysis.Rectangle(1, 5, 1, 5)])
+    def test_colour_special_tiles(self, world, area):
+        reference = self.reference(
+            world, area or analysis.Rectangle.entire_map(world))
+        rgba_data = np.full(reference.shape, 0.5)
+        rgba_data = analysis._colour_special_tiles(rgba_data, world, True,
+                                                   True, area)
+        assert np.all(rgba_data == reference)
+
+        # The overlay is cached
+        bounds = (area or analysis.Rectangle.entire_map(world)).bounds()
+        assert bounds in analysis._terrain_overlays[world]
+
+    def test_highlight(self):
+        area = analysis.Rectangle(1, 4, 1, 4)
+        highlight = analysis.Rectangle(0, 3, 2, 5)
+        rgba_data = np.full([3, 3, 4], 0.8)
+        rgba_data = analysis._highlight(rgba_data, area, highlight)
+
+        expected = np.full([3, 3, 4], 0.8)
+        expected[0:2, 1:3] = [1.0, 0.8, 1.0, 0.8]
+        assert np.allclose(rgba_data, expected)
+
+
+def test_lazy_imports():
+    # Accumulating data does not import the plotting and regression stacks
+    code = ('import sys, guard, guard.analysis; '
+            'print(" ".join(sorted(module for module in sys.modules '
+            'if module.split(".")[0] in ("matplotlib", "scipy"))))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=project_dir,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
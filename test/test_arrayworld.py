@@ -0,0 +1,386 @@
+from guard import (World, ArrayWorld, analysis, generate_parameters, period,
+                   terrain)
+from guard.daterange import DateRange
+import numpy as np
+import os
+import pytest
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+# Ensure polity aggregates agree with the polity labels and traits
+def assert_consistent(world):
+    forming = world.polity_forming
+    assert np.all(world.polity[~forming] == -1)
+    assert np.all(world.polity_size == np.bincount(
+        world.polity[forming], minlength=world.total_tiles))
+    assert np.all(world.polity_traits == np.bincount(
+        world.polity[forming],
+        weights=world.total_ultrasocietal_traits()[forming],
+        minlength=world.total_tiles))
+    assert np.all(world.ultrasocietal_trait_counts == [
+        bin(mask).count('1') for mask in world.ultrasocietal_traits])
+    assert np.all(world.military_tech_counts == [
+        bin(mask).count('1') for mask in world.military_techs])
+
+
+class TestNeighbours(object):
+    def test_neighbours_3x3(self, generate_array_world):
+        world = generate_array_world(xdim=3, ydim=3)
+
+        # Neighbours are in the order left, right, up, down
+        assert list(world.neighbours[world.index(1, 1)]) == [
+            world.index(0, 1), world.index(2, 1), world.index(1, 2),
+            world.index(1, 0)]
+        assert list(world.neighbours[world.index(0, 0)]) == [
+            -1, world.index(1, 0), world.index(0, 1), -1]
+
+    def test_littoral_assignment(self, generate_array_world,
+                                 generate_world_with_sea):
+        sea_tiles = [(0, 0), (1, 2), (2, 2)]
+        world = generate_array_world(xdim=3, ydim=3, sea_tiles=sea_tiles)
+        reference = generate_world_with_sea(xdim=3, ydim=3,
+                                            sea_tiles=sea_tiles)
+
+        assert list(world.littoral) == [tile.littoral
+                                        for tile in reference.tiles]
+
+    @pytest.mark.parametrize('distance', [0, 1, 2, 3, 3.6, 1000])
+    def test_littoral_neighbours_in_range(self, generate_array_world,
+                                          generate_world_with_sea, distance):
+        sea_tiles = [(2, 1), (2, 2), (2, 3), (2, 4),
+                     (0, 4), (1, 4), (3, 4), (4, 4)]
+        world = generate_array_world(xdim=5, ydim=5, sea_tiles=sea_tiles)
+        reference = generate_world_with_sea(xdim=5, ydim=5,
+                                            sea_tiles=sea_tiles)
+
+        tiles = np.arange(world.total_tiles)
+        in_range = world.littoral_neighbours_in_range(tiles, distance)
+        for tile, count in zip(reference.tiles, in_range):
+            assert count == len(tile.littoral_neighbours_in_range(distance))
+
+    def test_littoral_neighbours_sorted(self, generate_array_world):
+        world = generate_array_world(xdim=5, ydim=5,
+                                     sea_tiles=[(2, 1), (2, 2), (2, 3)])
+        tile = world.index(1, 2)
+        start, end = world.littoral_offsets[tile:tile+2]
+
+        # The tile itself is the nearest littoral neighbour
+        assert world.littoral_targets[start] == tile
+        assert np.all(np.diff(world.littoral_distances[start:end]) >= 0)
+
+
+@pytest.mark.parametrize('attack_method', ['uniform', 'entropy_maximisation'])
+def test_step(generate_array_world, attack_method):
+    params = generate_parameters(attack_method=attack_method,
+                                 mutation_to_ultrasocietal=0.1)
+    world = generate_array_world(xdim=6, ydim=6, sea_tiles=[(2, 2), (3, 3)],
+                                 params=params)
+    nsteps = 10
+
+    for i in range(nsteps):
+        world.step()
+        assert_consistent(world)
+
+    assert world.step_number == nsteps
+
+
+# The array engine gives the same rasters as the object engine for the same
+# state, except for polity labels which may differ
+def test_raster(tmp_path):
+    snapshot = str(tmp_path / 'snapshot.npz')
+    world = World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                            seed=1)
+    for i in range(20):
+        world.step()
+    world.save_state(snapshot)
+    array_world = World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                                  engine='array')
+    array_world.load_state(snapshot)
+
+    expected = world.as_arrays()
+    arrays = array_world.as_arrays()
+    assert set(arrays) == set(expected)
+    for field in expected:
+        assert arrays[field].shape == (5, 5)
+        if field != 'polity':
+            assert np.all(arrays[field] == expected[field])
+
+
+@pytest.fixture
+def stepped_world(generate_array_world):
+    params = generate_parameters(mutation_to_ultrasocietal=0.05)
+    world = generate_array_world(xdim=8, ydim=8, sea_tiles=[(3, 3)],
+                                 params=params)
+    world.rng.seed(3)
+    for i in range(10):
+        world.step()
+    return world
+
+
+class TestFork(object):
+    def test_same_future(self, stepped_world):
+        fork = stepped_world.fork()
+        for i in range(20):
+            stepped_world.step()
+            fork.step()
+        assert np.all(stepped_world.polity == fork.polity)
+        assert np.all(stepped_world.ultrasocietal_traits
+                      == fork.ultrasocietal_traits)
+        assert_consistent(fork)
+
+    def test_independent(self, stepped_world):
+        polity = stepped_world.polity.copy()
+        fork = stepped_world.fork(seed=1)
+        for i in range(20):
+            fork.step()
+        assert np.all(stepped_world.polity == polity)
+        assert stepped_world.step_number == 10
+        assert fork.neighbours is stepped_world.neighbours
+
+    def test_params(self, stepped_world):
+        fork = stepped_world.fork(params=generate_parameters(
+            sea_attacks=False))
+        assert not fork.params.sea_attacks
+        with pytest.raises(ValueError):
+            stepped_world.fork(params=generate_parameters(n_military_techs=3))
+
+    def test_enable_sea_attacks(self, generate_array_world):
+        world = generate_array_world(
+            xdim=8, ydim=8, sea_tiles=[(3, y) for y in range(8)],
+            params=generate_parameters(sea_attacks=False))
+        world.rng.seed(3)
+        for i in range(5):
+            world.step()
+        assert len(world.littoral_targets) == 0
+
+        fork = world.fork(seed=1, params=generate_parameters(
+            sea_attacks=True))
+        assert len(fork.littoral_targets) > 0
+        assert len(world.littoral_targets) == 0
+        for i in range(20):
+            fork.step()
+        assert_consistent(fork)
+
+
+class TestStaticArrays(object):
+    @pytest.fixture
+    def world(self, generate_array_world):
+        return generate_array_world(xdim=8, ydim=8,
+                                    sea_tiles=[(3, y) for y in range(8)])
+
+    def test_memory_mapped(self, world, tmp_path):
+        world.save_static_arrays(str(tmp_path))
+        attached = ArrayWorld.from_static_arrays(str(tmp_path))
+        assert attached.total_tiles == world.total_tiles
+        assert attached.littoral_range == world.littoral_range
+        for name in ('terrain', 'elevation', 'active_from', 'neighbours',
+                     'littoral_offsets', 'littoral_targets',
+                     'littoral_distances'):
+            array = getattr(attached, name)
+            assert isinstance(array, np.memmap)
+            assert not array.flags.writeable
+            assert np.all(array == getattr(world, name))
+        assert attached.number_of_polities() == world.number_of_polities()
+
+    def test_same_simulation(self, world, tmp_path):
+        world.save_static_arrays(str(tmp_path))
+        attached = ArrayWorld.from_static_arrays(str(tmp_path))
+        for simulation in (world, attached):
+            simulation.reset(seed=5)
+            for i in range(20):
+                simulation.step()
+            assert_consistent(simulation)
+        assert np.all(attached.polity == world.polity)
+        assert np.all(attached.military_techs == world.military_techs)
+
+    def test_enable_sea_attacks(self, generate_array_world, tmp_path):
+        world = generate_array_world(
+            xdim=8, ydim=8, sea_tiles=[(3, y) for y in range(8)],
+            params=generate_parameters(sea_attacks=False))
+        world.save_static_arrays(str(tmp_path))
+        attached = ArrayWorld.from_static_arrays(
+            str(tmp_path), generate_parameters(sea_attacks=True))
+        assert len(attached.littoral_targets) > 0
+        for i in range(20):
+            attached.step()
+        assert_consistent(attached)
+
+
+def test_cultural_shift_rate(generate_array_world):
+    params = generate_parameters(mutation_to_ultrasocietal=0.01,
+                                 mutation_from_ultrasocietal=0.1)
+    world = generate_array_world(xdim=20, ydim=20, params=params)
+    world.ultrasocietal_traits[:200] = (1 << params.n_ultrasocietal_traits) - 1
+    world.ultrasocietal_trait_counts[:200] = params.n_ultrasocietal_traits
+    world.reset()
+    world.cultural_shift()
+    assert_consistent(world)
+
+    # 2000 traits lost at a rate of 0.1 and 2000 gained at 0.01
+    lost = (params.n_ultrasocietal_traits*200
+            - np.sum(world.ultrasocietal_trait_counts[:200]))
+    gained = np.sum(world.ultrasocietal_trait_counts[200:])
+    assert 120 < lost < 280
+    assert 2 < gained < 45
+
+
+def test_attack_callback(generate_array_world):
+    world = generate_array_world(xdim=5, ydim=5)
+    targets = []
+
+    world.step(targets.append)
+    assert len(targets) > 0
+    assert all(0 <= target < world.total_tiles for target in targets)
+
+
+def test_attack_events_callback(generate_array_world):
+    world = generate_array_world(xdim=5, ydim=5)
+    fork = world.fork()
+    date_ranges = [DateRange(-1500, 1500)]
+    callback = analysis.AttackEvents(world, date_ranges)
+    recorded = analysis.AttackEvents(fork, date_ranges)
+    fork.record_attacks(recorded)
+
+    for step in range(10):
+        world.step(callback.sample)
+        fork.step()
+    era = date_ranges[0]
+    assert np.sum(callback.data[era]) > 0
+    assert np.all(callback.data[era] == recorded.data[era])
+
+
+@pytest.mark.incremental
+class TestDisintegration(object):
+    @pytest.fixture(scope='class')
+    def world(self):
+        params = generate_parameters(disintegration_base=1000)
+        return World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                               params, engine='array')
+
+    def test_merge(self, world):
+        world.polity[world.polity_forming] = 1
+        world.polity_size[:] = 0
+        world.polity_size[1] = np.count_nonzero(world.polity_forming)
+        world.polity_traits[:] = 0
+        assert world.number_of_polities() == 1
+
+    def test_disintegration(self, world):
+        world.disintegration()
+        assert world.number_of_polities() == 22
+        assert_consistent(world)
+
+    def test_reset(self, world):
+        world.reset()
+        assert world.number_of_polities() == 22
+        assert world.step_number == 0
+
+
+@pytest.fixture(scope='module')
+def yaml_array_world():
+    return World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                           engine='array')
+
+
+class TestYamlParsing():
+    def test_type(self, yaml_array_world):
+        assert isinstance(yaml_array_world, ArrayWorld)
+
+    def test_number_of_polities(self, yaml_array_world):
+        assert yaml_array_world.number_of_polities() == 22
+
+    @pytest.mark.parametrize('coordinate, value', [
+        ((4, 4), terrain.steppe),
+        ((3, 4), terrain.desert),
+        ((4, 0), terrain.sea),
+        ((1, 0), terrain.agriculture)
+        ])
+    def test_terrain(self, yaml_array_world, coordinate, value):
+        tile = yaml_array_world.index(*coordinate)
+        assert terrain.all_terrains[yaml_array_world.terrain[tile]] == value
+
+    @pytest.mark.parametrize('coordinate, elevation', [((2, 2), 5),
+                                                       ((3, 1), 3),
+                                                       ((3, 0), 1)])
+    def test_elevation(self, yaml_array_world, coordinate, elevation):
+        tile = yaml_array_world.index(*coordinate)
+        assert yaml_array_world.elevation[tile] == elevation
+
+    @pytest.mark.parametrize('coordinate, period', [((1, 0), period.agri1),
+                                                    ((2, 0), period.agri2),
+                                                    ((4, 1), period.agri3)])
+    def test_active_from(self, yaml_array_world, coordinate, period):
+        tile = yaml_array_world.index(*coordinate)
+        assert yaml_array_world.active_from[tile] == period.active_from
+
+    def test_steppe_techs(self, yaml_array_world):
+        tile = yaml_array_world.index(4, 4)
+        assert yaml_array_world.military_techs[tile] == 2**5 - 1
+        assert yaml_array_world.total_military_techs()[tile] == 5
+
+
+@pytest.mark.parametrize('step, active', [(0, [0]), (900, [0, 1]),
+                                          (1100, [0, 1, 2]), (0, [0])])
+def test_active_tiles(step, active):
+    world = World.from_file(project_dir+'/test/data/test_activation.yml',
+                            engine='array')
+    world.step_number = step
+    assert world.active_tiles().tolist() == active
+    assert np.flatnonzero(world.active()).tolist() == active
+
+
+def test_invalid_engine():
+    with pytest.raises(ValueError):
+        World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                        engine='invalid')
+
+
+def engine_statistics(engine, seeds, steps):
+    """
+    Statistics of a simulation of the old world for each seed. The fraction
+    of active tile samples, over the second half of the simulation, in
+    polities of 1, 2, 3-5, 6-9, 10-20, 21-50 and more than 50 communities,
+    followed by the final number of military technologies per active tile.
+    """
+    era = DateRange(-1500, 1500)
+    statistics = []
+    base_world = World.from_file(project_dir+'/data/old_world.yml',
+                                 engine=engine)
+    for seed in seeds:
+        world = base_world.fork()
+        world.reset(seed)
+        polity_size_density = analysis.PolitySizeDensity(
+            world, [era], edges=(0, 1, 2, 5, 9, 20, 50))
+        for step in range(steps):
+            world.step()
+            if step >= steps // 2 and step % 5 == 0:
+                polity_size_density.sample()
+        counts = np.sum(polity_size_density.data[era], axis=(0, 1))
+        techs = np.mean(
+            world.raster('military_techs')[world.raster('active')])
+        statistics.append(np.append(counts / np.sum(counts), techs))
+    return np.array(statistics)
+
+
+# The array engine is statistically equivalent to the object engine. The
+# simulations run for 1000 years, long enough for polities of more than 50
+# communities to form, and the mean of each statistic over the seeds must
+# agree between the engines within four standard errors of the difference
+def test_equivalence():
+    seeds, steps = range(6), 500
+    statistics = engine_statistics('object', seeds, steps)
+    array_statistics = engine_statistics('array', seeds, steps)
+
+    for engine_statistic in (statistics, array_statistics):
+        mean = np.mean(engine_statistic, axis=0)
+        # Imperial density, the fraction of samples in polities of at least
+        # 10 communities, and polities of more than 50 communities
+        assert np.sum(mean[4:7]) > 0.04
+        assert mean[6] > 0.005
+
+    difference = (np.mean(array_statistics, axis=0)
+                  - np.mean(statistics, axis=0))
+    standard_error = np.sqrt(
+        (np.var(statistics, axis=0, ddof=1)
+         + np.var(array_statistics, axis=0, ddof=1)) / len(seeds))
+    assert np.all(np.abs(difference) < 4*standard_error)
@@ -0,0 +1,65 @@
+from guard import benchmark
+from guard.cli import main
+import os
+import pytest
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+map_file = project_dir+'/test/data/test_map_5x5.yml'
+
+
+@pytest.fixture(scope='module')
+def results():
+    return benchmark.run_benchmarks(map_file, steps=2, repeat=1,
+                                    scaling_sizes=(100,), scaling_steps=1)
+
+
+def test_results(results):
+    names = set(results['results'])
+    for engine in benchmark.ENGINES:
+        for attack_method in benchmark.ATTACK_METHODS:
+            assert 'step/{}/{}'.format(engine, attack_method) in names
+        assert 'scaling/{}/100/step'.format(engine) in names
+        assert 'sample/{}/ImperialDensity'.format(engine) in names
+    assert 'construction/set_littoral_neighbours' in names
+    for result in results['results'].values():
+        assert result['value'] > 0
+        assert result['unit'] in ('s', 'steps/s')
+    assert results['metadata']['cpu_count'] == os.cpu_count()
+
+
+def test_save_load(results, tmp_path):
+    path = str(tmp_path / 'results.json')
+    benchmark.save_results(results, path)
+    assert benchmark.load_results(path) == results
+
+
+def test_compare():
+    baseline = {'version': 1, 'results': {
+        'step': {'value': 100., 'unit': 'steps/s', 'higher_is_better': True},
+        'sample': {'value': 1., 'unit': 's', 'higher_is_better': False},
+        'read': {'value': 1., 'unit': 's', 'higher_is_better': False}}}
+    results = {'version': 1, 'results': {
+        'step': {'value': 80., 'unit': 'steps/s', 'higher_is_better': True},
+        'sample': {'value': 0.5, 'unit': 's', 'higher_is_better': False},
+        'new': {'value': 1., 'unit': 's', 'higher_is_better': False}}}
+
+    speed_ups, regressions = benchmark.compare(results, baseline)
+    assert speed_ups == {'step': 0.8, 'sample': 2.0}
+    assert regressions == ['step']
+    assert benchmark.compare(results, baseline, tolerance=0.25)[1] == []
+
+    with pytest.raises(ValueError):
+        benchmark.compare(results, dict(baseline, version=0))
+
+
+def test_command_line(results, tmp_path, capsys):
+    baseline = str(tmp_path / 'baseline.json')
+    benchmark.save_results(results, baseline)
+    # A generous tolerance so that timing noise does not fail the test
+    status = main(['benchmark', '--map', map_file, '--steps', '2',
+                   '--repeat', '1', '--sizes', '100', '--engines', 'array',
+                   '--baseline', baseline, '--tolerance', '1',
+                   '--output', str(tmp_path / 'results.json')])
+    assert status == 0
+    assert 'step/array/uniform' in capsys.readouterr().out
+    assert os.path.exists(str(tmp_path / 'results.json'))
@@ -0,0 +1,133 @@
+from guard import analysis, World
+from guard.cli import ConfigError, main, read_config, run
+from guard.daterange import DateRange
+import json
+import os
+import pytest
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+map_file = project_dir+'/test/data/test_map_5x5.yml'
+
+
+@pytest.fixture
+def write_config(tmp_path):
+    def _write_config(text):
+        config_file = tmp_path / 'config.yml'
+        config_file.write_text(text)
+        return str(config_file)
+    return _write_config
+
+
+def test_read_config(write_config, tmp_path):
+    config = read_config(write_config('map: map.yml\nsteps: 5\n'))
+    assert config['map'] == str(tmp_path / 'map.yml')
+    assert config['output'] == str(tmp_path)
+    assert config['steps'] == 5
+    assert config['replicas'] == 20
+    assert config['accumulators'] == ['ImperialDensity']
+
+
+@pytest.mark.parametrize('text', [
+    'steps: 5\n',
+    'map: map.yml\nreplica: 5\n',
+    'map: map.yml\nengine: vector\n',
+    '- map.yml\n'
+    ])
+def test_invalid_config(write_config, text):
+    with pytest.raises(ConfigError):
+        read_config(write_config(text))
+
+
+@pytest.mark.parametrize('text', [
+    'parameters:\n  n_traits: 4\n',
+    'accumulators: [CorrelateBase]\n',
+    'accumulators:\n  - name: AttackEvents\n    era: 0-100AD\n'
+    ])
+def test_invalid_run(write_config, text):
+    config = read_config(write_config(
+        'map: {}\nreplicas: 1\nsteps: 1\nworkers: 1\n'.format(map_file)
+        + text))
+    with pytest.raises(ConfigError):
+        run(config)
+
+
+def test_run(write_config, tmp_path, capsys):
+    config_file = write_config("""
+map: {}
+parameters:
+  mutation_to_ultrasocietal: 0.01
+steps: 10
+replicas: 2
+seed: 4
+workers: 1
+statistics: true
+accumulators:
+  - ImperialDensity
+  - name: AttackEvents
+    date_ranges: [1500BC-1500AD]
+output: results
+""".format(map_file))
+    assert main(['run', config_file]) == 0
+    assert 'results written to' in capsys.readouterr().out
+
+    output = tmp_path / 'results'
+    with open(str(output / 'summary.json')) as infile:
+        summary = json.load(infile)
+    assert summary['seed'] == 4
+    assert summary['parameters']['mutation_to_ultrasocietal'] == 0.01
+    assert summary['wall_time'] > 0
+
+    world = World.from_file(map_file)
+    attack_events = analysis.AttackEvents.from_file(
+        world, str(output / 'attack_frequency.dat'))
+    assert attack_events.date_ranges == [DateRange(-1500, 1500)]
+    statistics = analysis.AccumulatorStatistics.from_file(
+        world, str(output / 'imperial_density_statistics.npz'))
+    assert statistics.count == 2
+
+    # Command line options override the configuration
+    assert main(['run', config_file, '--output', str(tmp_path / 'other'),
+                 '--seed', '5']) == 0
+    with open(str(tmp_path / 'other' / 'summary.json')) as infile:
+        assert json.load(infile)['seed'] == 5
+
+
+def test_run_duplicate_accumulators(write_config, tmp_path):
+    config_file = write_config("""
+map: {}
+steps: 2
+replicas: 1
+workers: 1
+accumulators:
+  - name: ImperialDensity
+    date_ranges: [1500BC-1000BC]
+  - name: ImperialDensity
+    date_ranges: [1000BC-500BC]
+""".format(map_file))
+    summary = run(read_config(config_file))
+    assert summary['files'] == [str(tmp_path / 'imperial_density.dat'),
+                                str(tmp_path / 'imperial_density_2.dat')]
+
+    world = World.from_file(map_file)
+    for name, era in (('imperial_density.dat', DateRange(-1500, -1000)),
+                      ('imperial_density_2.dat', DateRange(-1000, -500))):
+        accumulator = analysis.ImperialDensity.from_file(
+            world, str(tmp_path / name))
+        assert accumulator.date_ranges == [era]
+
+
+def test_missing_config(tmp_path, capsys):
+    assert main(['run', str(tmp_path / 'missing.yml')]) == 2
+    assert 'error' in capsys.readouterr().err
+
+
+# Ensure invalid YAML and date ranges are reported rather than raised
+@pytest.mark.parametrize('text', [
+    'map: {}\nsteps: [1\n',
+    'map: {}\naccumulators:\n  - name: AttackEvents\n'
+    '    date_ranges: [1500BC]\n'
+    ])
+def test_main_errors(write_config, capsys, text):
+    config_file = write_config(text.format(map_file))
+    assert main(['run', config_file, '--workers', '1']) == 2
+    assert capsys.readouterr().err.startswith('guard: error: ')
@@ -1,4 +1,5 @@
 from guard import Community, terrain, default_parameters, generate_parameters
+from guard.community import LittoralNeighbour
 import pytest
 
 
@@ -73,3 +74,80 @@ class TestMilitaryTechDifussion(object):
 
         advanced.diffuse_military_tech(basic, params)
         assert basic.total_military_techs() == 1
+
+
+# Test the sorted littoral neighbours lookup
+class TestLittoralNeighbours(object):
+    @pytest.fixture
+    def littoral_community(self, basic_community):
+        tile = basic_community()
+        neighbours = [basic_community() for i in range(4)]
+        tile.set_littoral_neighbours([
+            LittoralNeighbour(neighbours[0], 3),
+            LittoralNeighbour(tile, 0),
+            LittoralNeighbour(neighbours[1], 1.5),
+            LittoralNeighbour(neighbours[2], 1.5),
+            LittoralNeighbour(neighbours[3], 2)
+            ])
+        return tile
+
+    def test_sorted(self, littoral_community):
+        assert littoral_community.littoral_distances == [0, 1.5, 1.5, 2, 3]
+        assert littoral_community.littoral_neighbours[0].neighbour is (
+            littoral_community)
+
+    @pytest.mark.parametrize('distance,number', [
+        (0, 1), (1, 1), (1.5, 3), (2.5, 4), (3, 5), (100, 5)
+        ])
+    def test_neighbours_within(self, littoral_community, distance, number):
+        assert littoral_community.littoral_neighbours_within(distance) == (
+            number)
+        assert len(
+            littoral_community.littoral_neighbours_in_range(distance)
+            ) == number
+
+
+# Test the bitmask representation of traits and technologies
+class TestBitmasks(object):
+    def test_trait_mask(self, basic_community):
+        tile = basic_community()
+        tile.ultrasocietal_traits = [True, False, True]
+        assert tile.ultrasocietal_trait_mask == 0b101
+        assert tile.total_ultrasocietal_traits() == 2
+        assert tile.ultrasocietal_traits == (
+            (True, False, True)
+            + (False,)*(default_parameters.n_ultrasocietal_traits-3)
+            )
+
+    def test_tech_mask(self, basic_community):
+        tile = basic_community()
+        tile.military_tech_mask = 0b11010
+        assert tile.total_military_techs() == 3
+        assert tile.military_techs == (False, True, False, True, True)
+
+    def test_immutable(self, basic_community):
+        tile = basic_community()
+        with pytest.raises(TypeError):
+            tile.military_techs[0] = True
+        with pytest.raises(TypeError):
+            tile.ultrasocietal_traits[0] = True
+        assert tile.military_tech_mask == 0
+        assert tile.ultrasocietal_trait_mask == 0
+
+    def test_toggle(self, basic_community):
+        tile = basic_community()
+        tile.toggle_ultrasocietal_trait(3)
+        assert tile.has_ultrasocietal_trait(3)
+        assert tile.total_ultrasocietal_traits() == 1
+        tile.toggle_ultrasocietal_trait(3)
+        assert not tile.has_ultrasocietal_trait(3)
+        assert tile.total_ultrasocietal_traits() == 0
+
+    def test_copy(self, basic_community):
+        source = basic_community()
+        source.ultrasocietal_trait_mask = 0b1110
+        tile = basic_community()
+        tile.ultrasocietal_trait_mask = 0b1
+        tile.copy_ultrasocietal_traits(source)
+        assert tile.ultrasocietal_trait_mask == 0b1110
+        assert tile.total_ultrasocietal_traits() == 3
@@ -38,3 +38,9 @@ class TestDateRange(object):
     def test_invalid_range_from_string(self):
         with pytest.raises(daterange.InvalidDateRange):
             daterange.DateRange.from_string('200AD-50BC')
+
+    @pytest.mark.parametrize('string', ['100BC', '100BC-200', '1500BC-x',
+                                        '1-2-3AD', 'ADBC-100AD'])
+    def test_malformed_string(self, string):
+        with pytest.raises(daterange.InvalidDateRange):
+            daterange.DateRange.from_string(string)
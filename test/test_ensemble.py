@@ -0,0 +1,128 @@
+from guard import (run_ensemble, World, ensemble, generate_parameters,
+                   default_parameters)
+from guard.analysis import ImperialDensity, AttackEvents
+from guard.daterange import DateRange
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import os
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+map_file = project_dir+'/test/data/test_map_5x5.yml'
+date_ranges = [DateRange(-1500, 1500)]
+accumulators = [(ImperialDensity, date_ranges), (AttackEvents, date_ranges)]
+
+
+def simulation(seed, steps, params=default_parameters):
+    world = World.from_file(map_file, params, seed=seed)
+    imperial_density = ImperialDensity(world, date_ranges)
+    attack_events = AttackEvents(world, date_ranges)
+    for step in range(steps):
+        world.step(attack_events.sample)
+        imperial_density.sample()
+    return imperial_density, attack_events
+
+
+def test_serial_mean():
+    imperial_density, attack_events = run_ensemble(
+        map_file, n_replicas=3, steps=20, accumulators=accumulators,
+        workers=1, seed=42)
+
+    seeds = np.random.SeedSequence(42).spawn(3)
+    replicas = [simulation(seed, 20) for seed in seeds]
+    era = date_ranges[0]
+    assert np.all(imperial_density.data[era] == ImperialDensity.mean(
+        [replica[0] for replica in replicas]).data[era])
+    assert np.all(attack_events.data[era] == AttackEvents.mean(
+        [replica[1] for replica in replicas]).data[era])
+    assert np.sum(attack_events.data[era]) > 0
+
+
+# Ensure the initial technologies of each replica are drawn from its own seed
+def test_uniform_technology_seed():
+    params = generate_parameters(military_technology_seed='uniform')
+    ensembles = [
+        run_ensemble(map_file, params, n_replicas=3, steps=20,
+                     accumulators=accumulators, workers=workers, seed=0)
+        for workers in (1, 1, 2)
+        ]
+
+    seeds = np.random.SeedSequence(0).spawn(3)
+    replicas = [simulation(seed, 20, params) for seed in seeds]
+    era = date_ranges[0]
+    for imperial_density, attack_events in ensembles:
+        assert np.all(imperial_density.data[era] == ImperialDensity.mean(
+            [replica[0] for replica in replicas]).data[era])
+        assert np.all(attack_events.data[era] == AttackEvents.mean(
+            [replica[1] for replica in replicas]).data[era])
+
+
+def test_parallel_matches_serial():
+    serial = run_ensemble(map_file, n_replicas=5, steps=10,
+                          accumulators=accumulators, workers=1, seed=7)
+    parallel = run_ensemble(map_file, n_replicas=5, steps=10,
+                            accumulators=accumulators, workers=2, seed=7)
+    era = date_ranges[0]
+    for serial_accumulator, parallel_accumulator in zip(serial, parallel):
+        assert np.allclose(serial_accumulator.data[era],
+                           parallel_accumulator.data[era])
+
+
+def test_default_accumulator():
+    imperial_density, = run_ensemble(map_file, n_replicas=2, steps=1,
+                                     workers=1)
+    assert isinstance(imperial_density, ImperialDensity)
+    assert list(imperial_density.data) == imperial_density.date_ranges
+
+
+def test_statistics():
+    mean, = run_ensemble(map_file, n_replicas=4, steps=10,
+                         accumulators=accumulators[:1], workers=1, seed=3)
+    statistics, = run_ensemble(map_file, n_replicas=4, steps=10,
+                               accumulators=accumulators[:1], workers=2,
+                               seed=3, statistics=True,
+                               quantile_edges=range(12))
+    era = date_ranges[0]
+    assert statistics.count == 4
+    assert np.allclose(statistics.mean().data[era], mean.data[era])
+    assert np.all(statistics.variance().data[era] >= 0)
+    assert np.all(statistics.quantile(1).data[era] <= 11)
+
+
+def test_array_engine():
+    imperial_density, attack_events = run_ensemble(
+        map_file, n_replicas=2, steps=10, accumulators=accumulators,
+        workers=1, seed=3, engine='array')
+    era = date_ranges[0]
+    assert np.sum(attack_events.data[era]) > 0
+
+
+def test_array_parallel_matches_serial():
+    serial = run_ensemble(map_file, n_replicas=4, steps=10,
+                          accumulators=accumulators, workers=1, seed=7,
+                          engine='array')
+    parallel = run_ensemble(map_file, n_replicas=4, steps=10,
+                            accumulators=accumulators, workers=2, seed=7,
+                            engine='array')
+    era = date_ranges[0]
+    for serial_accumulator, parallel_accumulator in zip(serial, parallel):
+        assert np.all(serial_accumulator.data[era]
+                      == parallel_accumulator.data[era])
+
+
+def worker_arrays_mapped():
+    world = ensemble._worker_world
+    return all(isinstance(getattr(world, name), np.memmap)
+               for name in ('terrain', 'elevation', 'active_from',
+                            'neighbours', 'littoral_offsets',
+                            'littoral_targets', 'littoral_distances'))
+
+
+# Ensure array engine workers attach to the static arrays rather than copy
+def test_workers_attach(tmp_path):
+    world = World.from_file(map_file, engine='array')
+    world.save_static_arrays(str(tmp_path))
+    with ProcessPoolExecutor(max_workers=2,
+                             initializer=ensemble._initialise_worker,
+                             initargs=(map_file, default_parameters, 'array',
+                                       str(tmp_path))) as executor:
+        assert executor.submit(worker_arrays_mapped).result()
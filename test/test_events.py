@@ -0,0 +1,32 @@
+from guard.events import AttackBuffer
+import numpy as np
+
+
+class TestAttackBuffer(object):
+    def test_extend(self):
+        buffer = AttackBuffer(capacity=2)
+        buffer.extend(3, [0, 1], [1, 2], [True, False], [False, False])
+        buffer.extend(4, [5], [6], [True], [True])
+        assert len(buffer) == 3
+        assert buffer.records.tolist() == [[3, 0, 1, 1, 0],
+                                           [3, 1, 2, 0, 0],
+                                           [4, 5, 6, 1, 1]]
+        assert buffer.field('target').tolist() == [1, 2, 6]
+
+    def test_clear(self):
+        buffer = AttackBuffer(capacity=2)
+        buffer.extend(0, [0, 1, 2], [1, 2, 3], [True]*3, [False]*3)
+        buffer.clear()
+        assert len(buffer) == 0
+        buffer.extend(1, [4], [5], [False], [False])
+        assert np.all(buffer.records == [[1, 4, 5, 0, 0]])
+
+    def test_append(self):
+        buffer = AttackBuffer(capacity=1)
+        buffer.append(3, 0, 1, True, False)
+        buffer.extend(3, [1], [2], [False], [False])
+        buffer.append(4, 5, 6, True, True)
+        assert len(buffer) == 3
+        assert buffer.records.tolist() == [[3, 0, 1, 1, 0],
+                                           [3, 1, 2, 0, 0],
+                                           [4, 5, 6, 1, 1]]
@@ -0,0 +1,45 @@
+from guard.littoral import littoral_index
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope='module')
+def random_littoral():
+    xdim, ydim = 12, 9
+    generator = np.random.default_rng(42)
+    return xdim, ydim, generator.random(xdim*ydim) < 0.4
+
+
+# Ensure the index matches a comparison of all pairs of littoral tiles
+@pytest.mark.parametrize('max_distance', [0, 1, 2.5, 4.75, 100])
+def test_all_pairs(random_littoral, max_distance):
+    xdim, ydim, littoral = random_littoral
+    offsets, targets, squared = littoral_index(xdim, ydim, littoral,
+                                               max_distance)
+
+    tiles = np.flatnonzero(littoral)
+    for tile in range(xdim*ydim):
+        start, end = offsets[tile], offsets[tile+1]
+        if not littoral[tile]:
+            assert start == end
+            continue
+
+        distances = np.sqrt((tiles % xdim - tile % xdim)**2
+                            + (tiles // xdim - tile // xdim)**2)
+        expected = tiles[distances <= max_distance]
+        assert sorted(targets[start:end]) == sorted(expected)
+        assert np.all(np.diff(squared[start:end]) >= 0)
+        assert targets[start] == tile
+
+
+def test_extend_index(generate_world_with_sea):
+    world = generate_world_with_sea(xdim=12, ydim=3,
+                                    sea_tiles=[(x, 1) for x in range(12)])
+    tile = world.index(0, 0)
+    assert len(tile.littoral_neighbours_in_range(1000)) == 10
+
+    # Advance beyond the final step until the far end of the map is in range
+    world.step_number = 4000
+    world.attack()
+    assert world.littoral_range >= world.sea_attack_distance()
+    assert len(tile.littoral_neighbours_in_range(1000)) == 24
@@ -0,0 +1,83 @@
+from guard import World, terrain
+from guard.mapfile import (read_map, compile_map, InvalidYamlValue,
+                           MissingYamlKey)
+import numpy as np
+import os
+import pytest
+import shutil
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+map_file = project_dir+'/test/data/test_map_5x5.yml'
+
+
+def assert_same_map(map_a, map_b):
+    assert map_a[:2] == map_b[:2]
+    for field_a, field_b in zip(map_a[2:], map_b[2:]):
+        assert np.all(np.asarray(field_a) == np.asarray(field_b))
+
+
+def test_compile(tmp_path):
+    compiled = str(tmp_path / 'map.npz')
+    compile_map(map_file, compiled)
+    assert_same_map(read_map(compiled), read_map(map_file, cache=False))
+
+
+def test_cache(tmp_path, map_cache):
+    source = str(tmp_path / 'map.yml')
+    shutil.copy(map_file, source)
+    expected = read_map(source, cache=False)
+
+    assert_same_map(read_map(source), expected)
+    cached = [name for name in os.listdir(str(map_cache))
+              if name.endswith('.npz')]
+    assert len(cached) >= 1
+
+    # A second read loads the compiled map
+    assert_same_map(read_map(source), expected)
+
+
+def test_stale_cache(tmp_path):
+    source = str(tmp_path / 'map.yml')
+    shutil.copy(map_file, source)
+    read_map(source)
+
+    # Changing the source file invalidates the cached map
+    with open(source) as infile:
+        contents = infile.read()
+    with open(source, 'w') as outfile:
+        outfile.write(contents.replace('terrain: steppe', 'terrain: desert',
+                                       1))
+    assert read_map(source)[2][0] == terrain.all_terrains.index(
+        terrain.desert)
+
+
+def test_unwritable_cache(monkeypatch, tmp_path):
+    cache_file = tmp_path / 'file'
+    cache_file.write_text('')
+    # The cache directory cannot be created inside a file
+    monkeypatch.setenv('GUARD_CACHE_DIR', str(cache_file / 'cache'))
+    assert_same_map(read_map(map_file), read_map(map_file, cache=False))
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_from_compiled(tmp_path, engine):
+    compiled = str(tmp_path / 'map.npz')
+    compile_map(map_file, compiled)
+    world = World.from_file(compiled, engine=engine)
+    assert world.number_of_polities() == 22
+
+
+def test_invalid_active_from():
+    with pytest.raises(InvalidYamlValue, match='agri4'):
+        read_map(project_dir+'/test/data/invalid_active_from.yml', cache=False)
+
+
+# Ensure maps which do not define every tile completely are rejected
+@pytest.mark.parametrize('yaml_file, exception, message', [
+    ('missing_tile.yml', MissingYamlKey, 'x: 1, y: 0'),
+    ('missing_elevation.yml', MissingYamlKey, 'elevation'),
+    ('out_of_range_tile.yml', InvalidYamlValue, '"x"')
+    ])
+def test_incomplete_map(yaml_file, exception, message):
+    with pytest.raises(exception, match=message):
+        read_map(project_dir+'/test/data/'+yaml_file, cache=False)
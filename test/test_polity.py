@@ -231,6 +231,57 @@ def test_transfer(arbitrary_polity):
                 state_a.communities[-1].elevation == 12])
 
 
+# Ensure running trait totals follow changes to the polity and its communities
+class TestTotalUltrasocietalTraits(object):
+    def test_initial(self, polity_10, example_traits):
+        state = polity_10
+        traits, _ = example_traits
+        set_ultrasocietal_traits(default_parameters, state, traits)
+        assert state.total_ultrasocietal_traits() == sum(traits)
+
+    def test_transfer(self, arbitrary_polity, example_traits):
+        state_a = arbitrary_polity(10)
+        state_b = arbitrary_polity(10)
+        traits, _ = example_traits
+        set_ultrasocietal_traits(default_parameters, state_b, traits)
+
+        state_a.transfer_community(state_b.communities[4])
+        assert state_a.total_ultrasocietal_traits() == traits[4]
+        assert state_b.total_ultrasocietal_traits() == sum(traits) - traits[4]
+
+    def test_ethnocide(self, arbitrary_polity, example_traits):
+        state_a = arbitrary_polity(10)
+        state_b = arbitrary_polity(10)
+        traits, _ = example_traits
+        set_ultrasocietal_traits(default_parameters, state_a, traits)
+        params = generate_parameters(ethnocide_min=1)
+
+        attacker = state_a.communities[4]
+        attacker.attack(state_b.communities[0], params, sea_attack=False,
+                        probability=1)
+        assert state_a.total_ultrasocietal_traits() == (sum(traits)
+                                                        + traits[4])
+        assert state_b.total_ultrasocietal_traits() == 0
+
+    def test_cultural_shift(self, polity_10):
+        params = generate_parameters(mutation_to_ultrasocietal=1,
+                                     mutation_from_ultrasocietal=1)
+        state = polity_10
+        state.communities[0].cultural_shift(params)
+        assert (state.total_ultrasocietal_traits()
+                == params.n_ultrasocietal_traits)
+
+    def test_disintegration(self, polity_10, example_traits):
+        state = polity_10
+        traits, _ = example_traits
+        set_ultrasocietal_traits(default_parameters, state, traits)
+
+        new_states = state.disintegrate()
+        assert state.total_ultrasocietal_traits() == 0
+        assert ([polity.total_ultrasocietal_traits() for polity in new_states]
+                == traits)
+
+
 # Assign the example ultrasocietal traits to polity
 def set_ultrasocietal_traits(params, polity, traits):
     for i, number in enumerate(traits):
@@ -0,0 +1,71 @@
+from guard import analysis, generate_parameters
+from guard.daterange import DateRange
+from guard.render import render_eras, write_animation, StepRenderer
+import numpy as np
+from PIL import Image
+import pytest
+
+eras = [DateRange(-500, 0), DateRange(0, 500), DateRange(500, 1000)]
+
+
+@pytest.fixture
+def world(generate_world_with_sea):
+    return generate_world_with_sea(6, 5, [(0, 0), (5, 4)])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_render_eras(world, workers, tmp_path):
+    accumulator = analysis.ImperialDensity(world, eras)
+    for index, era in enumerate(eras):
+        accumulator.data[era] = np.full([6, 5], float(index + 1))
+
+    paths = render_eras(accumulator, outdir=str(tmp_path), workers=workers,
+                        area=analysis.Rectangle(0, 4, 0, 5))
+    assert paths == [str(tmp_path / 'imperial_density_{}.png'.format(era))
+                     for era in eras]
+    for path in paths:
+        with Image.open(path) as image:
+            assert image.format == 'PNG'
+
+
+def test_render_correlator(world, tmp_path):
+    correlator = analysis.CorrelateBase(world, eras[:1])
+    correlator._prefix = 'correlator'
+    correlator.data[eras[0]][2, 3] = 1.
+    paths = render_eras(correlator, outdir=str(tmp_path), workers=1,
+                        blur=1)
+    assert paths == [str(tmp_path / 'correlator_{}.png'.format(eras[0]))]
+
+
+def test_step_renderer(generate_world, tmp_path):
+    world = generate_world(5, 5, generate_parameters())
+    animation = str(tmp_path / 'military_techs.gif')
+    with StepRenderer(world, every=2, outdir=str(tmp_path), workers=2,
+                      animation=animation) as renderer:
+        for step in range(5):
+            world.step()
+            renderer.sample()
+
+    assert renderer.paths == [
+        str(tmp_path / 'military_techs_{:04d}.png'.format(step))
+        for step in (2, 4)]
+    with Image.open(animation) as image:
+        assert image.format == 'GIF'
+
+
+def test_write_animation(tmp_path):
+    frames = []
+    for index, colour in enumerate(['red', 'blue', 'green']):
+        frames.append(str(tmp_path / 'frame_{}.png'.format(index)))
+        Image.new('RGB', (8, 8), colour).save(frames[-1])
+
+    write_animation(frames, str(tmp_path / 'animation.gif'), fps=5)
+    with Image.open(str(tmp_path / 'animation.gif')) as image:
+        assert image.n_frames == 3
+        assert image.info['duration'] == 200
+
+
+def test_step_renderer_field(generate_world):
+    world = generate_world(5, 5, generate_parameters())
+    with pytest.raises(ValueError):
+        StepRenderer(world, field='elevation')
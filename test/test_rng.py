@@ -0,0 +1,162 @@
+from guard import World, generate_parameters
+from guard.rng import RandomStream
+import numpy as np
+import os
+import pytest
+
+project_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestRandomStream(object):
+    def test_seed(self):
+        stream_a = RandomStream(42, buffer_size=10)
+        stream_b = RandomStream(42, buffer_size=10)
+        assert ([stream_a.random() for i in range(25)]
+                == [stream_b.random() for i in range(25)])
+
+    def test_reseed(self):
+        stream = RandomStream(42)
+        first = [stream.random() for i in range(5)]
+        stream.seed(42)
+        assert [stream.random() for i in range(5)] == first
+
+    def test_range(self):
+        stream = RandomStream(buffer_size=100)
+        values = [stream.random() for i in range(1000)]
+        assert all(0 <= value < 1 for value in values)
+
+    def test_randint(self):
+        stream = RandomStream()
+        values = {stream.randint(4) for i in range(1000)}
+        assert values == {0, 1, 2, 3}
+
+    def test_choice(self):
+        stream = RandomStream()
+        sequence = ('a', 'b', 'c')
+        values = {stream.choice(sequence) for i in range(1000)}
+        assert values == set(sequence)
+
+    @pytest.mark.parametrize('weights,expected', [
+        ([1, 0, 0], 0), ([0, 0, 2.5], 2), ([0, 1e-3, 0], 1)
+        ])
+    def test_weighted_index(self, weights, expected):
+        stream = RandomStream()
+        assert all(stream.weighted_index(weights) == expected
+                   for i in range(100))
+
+    @pytest.mark.parametrize('probability', [0, 0.05, 0.5, 1])
+    def test_bernoulli_positions(self, probability):
+        stream = RandomStream()
+        n = 10000
+        positions = stream.bernoulli_positions(n, probability)
+        assert np.all(np.diff(positions) > 0)
+        assert np.all((positions >= 0) & (positions < n))
+        assert abs(len(positions) - n*probability) <= 5*np.sqrt(n*0.25)
+
+    def test_state(self):
+        stream = RandomStream(42, buffer_size=10)
+        [stream.random() for i in range(15)]
+        state = stream.get_state()
+        expected = [stream.random() for i in range(25)]
+        expected_permutation = stream.permutation(10)
+
+        restored = RandomStream(buffer_size=10)
+        restored.set_state(state)
+        assert [restored.random() for i in range(25)] == expected
+        assert np.all(restored.permutation(10) == expected_permutation)
+
+    def test_state_after_generator_draws(self):
+        stream = RandomStream(42, buffer_size=10)
+        stream.random()
+        stream.generator.random(5)
+        state = stream.get_state()
+        expected = [stream.random() for i in range(15)]
+        expected_draws = stream.generator.random(5)
+
+        restored = RandomStream(buffer_size=10)
+        restored.set_state(state)
+        assert [restored.random() for i in range(15)] == expected
+        assert np.all(restored.generator.random(5) == expected_draws)
+
+    def test_state_size(self):
+        stream = RandomStream(42)
+        stream.random()
+        state = stream.get_state()
+        assert state['buffer_length'] == 2**16
+        assert state['buffer_position'] == 1
+        assert not any(isinstance(value, list) for value in state.values())
+
+    def test_unused_state(self):
+        state = RandomStream(42).get_state()
+        restored = RandomStream(buffer_size=10)
+        restored.set_state(state)
+        assert restored.random() == RandomStream(42).random()
+
+
+# Ensure seeded worlds reproduce the same simulation
+@pytest.mark.parametrize('engine', ['object', 'array'])
+@pytest.mark.parametrize('attack_method', ['uniform', 'entropy_maximisation'])
+def test_reproducible_world(engine, attack_method):
+    params = generate_parameters(attack_method=attack_method,
+                                 military_technology_seed='uniform')
+    worlds = [
+        World.from_file(project_dir+'/test/data/test_map_5x5.yml', params,
+                        engine=engine, seed=7)
+        for i in range(2)
+        ]
+    for world in worlds:
+        for step in range(50):
+            world.step()
+
+    assert_same_state(*worlds)
+
+
+# Ensure two worlds have the same polities, traits and technologies
+def assert_same_state(world_a, world_b):
+    assert world_a.number_of_polities() == world_b.number_of_polities()
+    if isinstance(world_a, World):
+        assert ([tile.ultrasocietal_traits for tile in world_a.tiles]
+                == [tile.ultrasocietal_traits for tile in world_b.tiles])
+        assert ([tile.military_techs for tile in world_a.tiles]
+                == [tile.military_techs for tile in world_b.tiles])
+    else:
+        assert np.all(world_a.polity == world_b.polity)
+        assert np.all(world_a.ultrasocietal_traits
+                      == world_b.ultrasocietal_traits)
+        assert np.all(world_a.military_techs == world_b.military_techs)
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_reset_seed(engine):
+    worlds = [
+        World.from_file(project_dir+'/test/data/test_map_5x5.yml',
+                        engine=engine)
+        for i in range(2)
+        ]
+    polities = []
+    for world in worlds:
+        world.reset(seed=3)
+        for step in range(20):
+            world.step()
+        polities.append(world.number_of_polities())
+
+    assert polities[0] == polities[1]
+
+
+# Ensure resetting with a seed discards the evolved state of the world
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_reset_seed_state(engine):
+    params = generate_parameters(military_technology_seed='uniform')
+    worlds = [
+        World.from_file(project_dir+'/test/data/test_map_5x5.yml', params,
+                        engine=engine)
+        for i in range(2)
+        ]
+    for step in range(30):
+        worlds[0].step()
+    for world in worlds:
+        world.reset(seed=3)
+        for step in range(50):
+            world.step()
+
+    assert_same_state(*worlds)
@@ -0,0 +1,76 @@
+from guard import World, generate_parameters
+import numpy as np
+import pytest
+
+params = generate_parameters(mutation_to_ultrasocietal=0.02,
+                             military_technology_seed='uniform')
+
+
+def build_world(engine, seed):
+    # A 20x20 world with a strip of sea down the middle
+    xdim, ydim = 20, 20
+    terrains = np.zeros([ydim, xdim], dtype=int)
+    terrains[:, 9:11] = 2
+    periods = np.zeros([ydim, xdim], dtype=int)
+    periods[:10, :] = 1
+    return World.from_arrays(xdim, ydim, terrains.flatten(),
+                             np.ones(xdim*ydim), periods.flatten(), params,
+                             engine, seed)
+
+
+def world_state(world):
+    if isinstance(world, World):
+        return ([[world._index(*tile.position) for tile in state.communities]
+                 for state in world.polities],
+                [tile.ultrasocietal_trait_mask for tile in world.tiles],
+                [tile.military_tech_mask for tile in world.tiles],
+                world.step_number, world.rng.random())
+    else:
+        return (world.polity.tolist(), world.polity_size.tolist(),
+                world.polity_traits.tolist(),
+                world.ultrasocietal_traits.tolist(),
+                world.military_techs.tolist(), world.step_number,
+                world.rng.random())
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_resume(tmp_path, engine):
+    snapshot = str(tmp_path / 'snapshot.npz')
+    world = build_world(engine, seed=11)
+    for step in range(100):
+        world.step()
+    world.save_state(snapshot)
+    for step in range(100):
+        world.step()
+    expected = world_state(world)
+
+    resumed = build_world(engine, seed=12)
+    resumed.load_state(snapshot)
+    assert resumed.step_number == 100
+    for step in range(100):
+        resumed.step()
+    assert world_state(resumed) == expected
+
+
+@pytest.mark.parametrize('save_engine, load_engine', [('object', 'array'),
+                                                      ('array', 'object')])
+def test_across_engines(tmp_path, save_engine, load_engine):
+    snapshot = str(tmp_path / 'snapshot.npz')
+    world = build_world(save_engine, seed=5)
+    for step in range(100):
+        world.step()
+    world.save_state(snapshot)
+
+    loaded = build_world(load_engine, seed=5)
+    loaded.load_state(snapshot)
+    assert loaded.number_of_polities() == world.number_of_polities()
+    assert loaded.step_number == world.step_number
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_mismatched_world(tmp_path, engine):
+    snapshot = str(tmp_path / 'snapshot.npz')
+    build_world(engine, seed=1).save_state(snapshot)
+    world = World.from_arrays(2, 2, [0]*4, [0]*4, [0]*4, params, engine)
+    with pytest.raises(ValueError):
+        world.load_state(snapshot)
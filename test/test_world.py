@@ -1,8 +1,9 @@
-from guard import (World, terrain, generate_parameters,
+from guard import (World, Community, terrain, generate_parameters,
                    default_parameters, period)
-from guard.world import MissingYamlKey
+from guard.world import MissingYamlKey, RASTER_FIELDS
 from guard.community import LittoralNeighbour
 from numpy import sqrt
+import numpy as np
 import os
 import pytest
 
@@ -268,6 +269,40 @@ class TestDisintegration():
         assert all([state.size() == 1 for state in world.polities])
 
 
+# Test cultural shift of all communities in the world
+class TestCulturalShift(object):
+    def test_shift_to_true(self, generate_world):
+        params = generate_parameters(mutation_to_ultrasocietal=1,
+                                     mutation_from_ultrasocietal=0)
+        world = generate_world(xdim=3, ydim=3, params=params)
+        world.cultural_shift()
+        assert all(
+            [tile.total_ultrasocietal_traits() == params.n_ultrasocietal_traits
+             for tile in world.tiles]
+            )
+        assert all(
+            [state.total_ultrasocietal_traits()
+             == params.n_ultrasocietal_traits for state in world.polities]
+            )
+
+    def test_shift_rate(self, generate_world):
+        params = generate_parameters(mutation_to_ultrasocietal=0.01,
+                                     mutation_from_ultrasocietal=0.1)
+        world = generate_world(xdim=20, ydim=20, params=params)
+        for tile in world.tiles[:200]:
+            tile.ultrasocietal_traits = [True]*params.n_ultrasocietal_traits
+        world.cultural_shift()
+
+        # 2000 traits lost at a rate of 0.1 and 2000 gained at 0.01
+        lost = sum([params.n_ultrasocietal_traits
+                    - tile.total_ultrasocietal_traits()
+                    for tile in world.tiles[:200]])
+        gained = sum([tile.total_ultrasocietal_traits()
+                      for tile in world.tiles[200:]])
+        assert 120 < lost < 280
+        assert 2 < gained < 45
+
+
 def test_step_increment(generate_world):
     world = generate_world(xdim=5, ydim=5)
     nsteps = 10
@@ -278,6 +313,114 @@ def test_step_increment(generate_world):
     assert world.step_number == nsteps
 
 
+class TestRaster(object):
+    def test_terrain(self, generate_world_with_sea):
+        world = generate_world_with_sea(4, 3, [(3, 0), (1, 2)])
+        expected = np.zeros([4, 3])
+        expected[3, 0] = expected[1, 2] = 2
+        assert np.all(world.raster('terrain') == expected)
+
+    def test_polity(self, generate_world):
+        world = generate_world(3, 2)
+        world.polities[0].transfer_community(world.index(2, 1))
+        world.prune_empty_polities()
+        polity = world.raster('polity')
+        polity_size = world.raster('polity_size')
+        assert polity.shape == (3, 2)
+        assert polity[2, 1] == polity[0, 0]
+        assert polity_size[2, 1] == polity_size[0, 0] == 2
+        assert polity_size[1, 1] == 1
+
+    def test_traits(self, generate_world):
+        world = generate_world(3, 2)
+        world.index(1, 0).ultrasocietal_traits = [True]*3 + [False]*7
+        assert world.raster('ultrasocietal_traits')[1, 0] == 3
+        assert np.sum(world.raster('ultrasocietal_traits')) == 3
+
+    def test_as_arrays(self, generate_world):
+        world = generate_world(3, 2)
+        arrays = world.as_arrays()
+        assert set(arrays) == set(RASTER_FIELDS)
+        assert np.all(arrays['active'])
+
+    def test_invalid_field(self, generate_world):
+        with pytest.raises(ValueError):
+            generate_world(3, 2).raster('invalid')
+
+
+@pytest.fixture
+def stepped_world(generate_world_with_sea):
+    world = generate_world_with_sea(8, 8, [(3, 3), (3, 4)])
+    world.params = generate_parameters(mutation_to_ultrasocietal=0.05)
+    world.rng.seed(3)
+    for i in range(10):
+        world.step()
+    return world
+
+
+def polity_members(world):
+    return [[world._index(*tile.position) for tile in state.communities]
+            for state in world.polities]
+
+
+class TestFork(object):
+    def test_same_future(self, stepped_world):
+        fork = stepped_world.fork()
+        for i in range(20):
+            stepped_world.step()
+            fork.step()
+        assert polity_members(fork) == polity_members(stepped_world)
+        assert ([tile.ultrasocietal_trait_mask for tile in fork.tiles]
+                == [tile.ultrasocietal_trait_mask
+                    for tile in stepped_world.tiles])
+
+    def test_independent(self, stepped_world):
+        members = polity_members(stepped_world)
+        fork = stepped_world.fork(seed=1)
+        for i in range(20):
+            fork.step()
+        assert polity_members(stepped_world) == members
+        assert stepped_world.step_number == 10
+        assert all(tile.polity in stepped_world.polities
+                   for tile in stepped_world._polity_forming_tiles)
+        assert fork.littoral_targets is stepped_world.littoral_targets
+
+    def test_links(self, stepped_world):
+        fork = stepped_world.fork()
+        tiles = set(map(id, fork.tiles))
+        for tile in fork.tiles:
+            assert all(id(neighbour) in tiles
+                       for neighbour in tile.neighbours.values()
+                       if neighbour is not None)
+            assert all(id(neighbour.neighbour) in tiles
+                       for neighbour in tile.littoral_neighbours)
+        assert all(tile.polity in fork.polities
+                   for tile in fork._polity_forming_tiles)
+
+    def test_params(self, stepped_world):
+        with pytest.raises(ValueError):
+            stepped_world.fork(params=generate_parameters(n_military_techs=3))
+
+    def test_enable_sea_attacks(self):
+        params = generate_parameters(sea_attacks=False)
+        communities = [
+            Community(params, landscape=terrain.sea if i % 8 == 3
+                      else terrain.agriculture)
+            for i in range(64)
+            ]
+        world = World(8, 8, communities, params)
+        world.rng.seed(3)
+        for i in range(5):
+            world.step()
+
+        fork = world.fork(seed=1, params=generate_parameters(
+            sea_attacks=True))
+        assert any(tile.littoral_neighbours for tile in fork.tiles)
+        assert not any(tile.littoral_neighbours for tile in world.tiles)
+        for i in range(20):
+            fork.step()
+
+
 @pytest.fixture(scope='class')
 def world_activation():
     return World.from_file(project_dir+'/test/data/test_activation.yml')
@@ -292,6 +435,15 @@ def test_community_activation(world_activation, step, number_active):
         ) == number_active
 
 
+@pytest.mark.parametrize('step, number_active', [(0, 1), (900, 2), (1100, 3),
+                                                 (0, 1)])
+def test_active_tiles(world_activation, step, number_active):
+    world_activation.step_number = step
+    active_tiles = world_activation.active_tiles()
+    assert len(active_tiles) == number_active
+    assert active_tiles == world_activation.tiles[:number_active]
+
+
 @pytest.mark.incremental
 class TestReset():
     def test_initial(self, world_5x5):